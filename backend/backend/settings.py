@@ -153,6 +153,34 @@ CORS_ALLOW_ALL_ORIGINS = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Resized copies of ProductImage linked from product payloads. They are made
+# off the request by products.images, serializing a product never resizes
+VERSATILEIMAGEFIELD_RENDITION_KEY_SETS = {
+    'product_image': [
+        ('thumbnail', 'thumbnail__160x160'),
+        ('card', 'thumbnail__480x480'),
+        ('detail', 'thumbnail__1200x1200'),
+    ],
+}
+VERSATILEIMAGEFIELD_SETTINGS = {
+    'create_images_on_demand': False,
+    'jpeg_resize_quality': 80,
+    'webp_resize_quality': 80,
+}
+
+# Cache for the product list (products/cache.py). A file backend is shared by
+# every worker process on the host, so an invalidation in one is seen by all
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -1,5 +1,7 @@
+from django import forms
 from django.contrib import admin
-from .models import Products, Variant, SubVariant, ProductSKU
+from .allocator import allocate_product_id
+from .models import Products, Variant, SubVariant, ProductSKU, CatalogImport, CatalogImportError
 
 # Inline for SubVariant within VariantAdmin
 
@@ -20,11 +22,25 @@ class VariantInline(admin.TabularInline):
 # Inline for ProductSKU within ProductAdmin
 
 
+class ProductSKUInlineForm(forms.ModelForm):
+    class Meta:
+        model = ProductSKU
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The stock of a sharded SKU lives in its shards, rebalancing would
+        # overwrite an edit here; use shard_stock to unshard it first
+        if self.instance.shard_count and 'stock' in self.fields:
+            self.fields['stock'].disabled = True
+
+
 class ProductSKUInline(admin.TabularInline):  # SKU -> Stock Keeping Unit
     model = ProductSKU
+    form = ProductSKUInlineForm
     extra = 0  # No extra blank forms by default
     show_change_link = True
-    readonly_fields = ('sku_code',)  # SKU code is auto-generated
+    readonly_fields = ('sku_code', 'shard_count', 'reserved')  # SKU code is auto-generated
 
 
 @admin.register(Products)
@@ -57,11 +73,14 @@ class ProductAdmin(admin.ModelAdmin):
             obj.CreatedUser = request.user
         # Auto-generate ProductID if not set
         if not obj.ProductID:
-            last_product = Products.objects.order_by('-ProductID').first()
-            obj.ProductID = (
-                last_product.ProductID if last_product and last_product.ProductID is not None else 0) + 1
+            obj.ProductID = allocate_product_id()
         super().save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        # SKU stock may have been edited through the inline
+        super().save_related(request, form, formsets, change)
+        form.instance.refresh_total_stock()
+
 
 @admin.register(Variant)
 class VariantAdmin(admin.ModelAdmin):
@@ -85,6 +104,49 @@ class ProductSKUAdmin(admin.ModelAdmin):
     list_filter = ('product',)
     readonly_fields = ('sku_code',)
 
+    def get_readonly_fields(self, request, obj=None):
+        # See ProductSKUInlineForm
+        if obj is not None and obj.shard_count:
+            return self.readonly_fields + ('stock',)
+        return self.readonly_fields
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.product.refresh_total_stock()
+
+    def delete_model(self, request, obj):
+        product = obj.product
+        super().delete_model(request, obj)
+        product.refresh_total_stock()
+
+    def delete_queryset(self, request, queryset):
+        products = list(Products.objects.filter(
+            productsku_set__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for product in products:
+            product.refresh_total_stock()
+
     def display_sub_variants(self, obj):
-        return ", ".join([sv.option for sv in obj.sub_variants.all().order_by('variant__name', 'option')])
+        return obj.options_label
     display_sub_variants.short_description = 'Options'
+    display_sub_variants.admin_order_field = 'options_label'
+
+
+class CatalogImportErrorInline(admin.TabularInline):
+    model = CatalogImportError
+    extra = 0
+    can_delete = False
+    readonly_fields = ('row_number', 'errors')
+
+
+@admin.register(CatalogImport)
+class CatalogImportAdmin(admin.ModelAdmin):
+    list_display = ('source', 'file_format', 'status', 'processed_rows',
+                    'created_count', 'failed_count', 'CreatedDate')
+    list_filter = ('status', 'file_format')
+    readonly_fields = ('status', 'processed_rows', 'created_count', 'failed_count',
+                       'message', 'CreatedDate', 'UpdatedDate', 'CreatedUser')
+    inlines = [CatalogImportErrorInline]
@@ -0,0 +1,195 @@
+"""
+Native async versions of the busiest endpoints, for ASGI deployments
+(``uvicorn backend.asgi:application``), served under ``/api/async/``.
+
+DRF views are synchronous, so under ASGI each request to them holds a
+worker thread for its whole database round trip. These are plain Django
+async views instead: reads go through the async ORM (``acount``, ``afirst``,
+``async for``), the payloads are rendered with the same serializers and
+DRF's JSON renderer, so they match the sync endpoints. Stock movements need
+a transaction, which Django does not support in async code yet, so
+record_movement is the one part run through ``sync_to_async``.
+
+The async product list reads straight from the database; the read-through
+cache and conditional GETs stay on the sync endpoint.
+"""
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django_filters.filterset import filterset_factory
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import Products, ProductSKU
+from .movements import record_movement
+from .serializers import ProductSerializer
+from .views import ProductListAPIView, requested_fields, requested_prefetches
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status,
+                        content_type='application/json')
+
+
+def filter_errors(filterset):
+    return json_response({"error": "Invalid filters.", "errors": filterset.errors},
+                         status=status.HTTP_400_BAD_REQUEST)
+
+
+class LimitOffsetWindow:
+    """The ``?limit=&offset=`` paging of LimitOffsetPagination, for async views."""
+
+    def __init__(self, request, max_limit=None):
+        self.request = request
+        self.limit = self.positive_int('limit', settings.REST_FRAMEWORK['PAGE_SIZE'], strict=True)
+        if max_limit is not None:
+            self.limit = min(self.limit, max_limit)
+        self.offset = self.positive_int('offset', 0)
+
+    def positive_int(self, name, default, strict=False):
+        try:
+            value = int(self.request.GET[name])
+        except (KeyError, ValueError):
+            return default
+        if value < 0 or (strict and value == 0):
+            return default
+        return value
+
+    def slice(self, queryset):
+        return queryset[self.offset:self.offset + self.limit]
+
+    def next_link(self, has_next):
+        if not has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), 'limit', self.limit)
+        return replace_query_param(url, 'offset', self.offset + self.limit)
+
+    def previous_link(self):
+        if self.offset <= 0:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), 'limit', self.limit)
+        if self.offset - self.limit <= 0:
+            return remove_query_param(url, 'offset')
+        return replace_query_param(url, 'offset', self.offset - self.limit)
+
+    def response(self, results, count=None, has_next=False):
+        # Without a count, as with ?count=false, the caller says if a next page exists
+        body = {}
+        if count is not None:
+            body['count'] = count
+            has_next = self.offset + self.limit < count
+        body.update(next=self.next_link(has_next), previous=self.previous_link(), results=results)
+        return json_response(body)
+
+
+# Async List Product API
+
+ProductFilterSet = filterset_factory(Products, fields=ProductListAPIView.filterset_fields)
+
+
+class AsyncProductListView(View):
+    async def get(self, request, *args, **kwargs):
+        try:
+            fields = requested_fields(request.GET)
+        except serializers.ValidationError as e:
+            return json_response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        filterset = ProductFilterSet(request.GET, queryset=Products.objects.all())
+        if not filterset.is_valid():
+            return filter_errors(filterset)
+        queryset = filterset.qs.prefetch_related(*requested_prefetches(fields))
+        if fields is not None:
+            queryset = queryset.only(*ProductSerializer.columns(fields))
+
+        window = LimitOffsetWindow(request)
+        count = await queryset.acount()
+        # Async iteration runs the page query and its prefetches off the event loop
+        products = [product async for product in window.slice(queryset)]
+        serializer = ProductSerializer(products, many=True, fields=fields,
+                                       context={'request': request})
+        return window.response(serializer.data, count=count)
+
+
+# Async Add / Remove Stock API
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncStockMovementView(View):
+    transaction_type = None
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return json_response({"error": "Request body must be JSON."}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            return json_response({"error": "Request body must be a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+
+        product_id = data.get('product_id')
+        product_sku_id = data.get('product_sku_id')
+        quantity = data.get('quantity')
+
+        if not all([product_id, product_sku_id, quantity is not None]):
+            return json_response({"error": "product_id, product_sku_id, and quantity are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            quantity = Decimal(str(quantity))
+            if not quantity.is_finite():
+                raise ValueError
+            if quantity <= 0:
+                return json_response({"error": "Quantity must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+        except (ValueError, InvalidOperation):
+            return json_response({"error": "Quantity must be a valid number."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # The conditional UPDATE, total and ledger row must commit together
+            moved = await sync_to_async(record_movement)(
+                product_id, product_sku_id, self.transaction_type, quantity)
+            if moved is None and self.transaction_type == 'IN':
+                raise ProductSKU.DoesNotExist
+            if moved is None:
+                available = await ProductSKU.objects.filter(
+                    id=product_sku_id, product_id=product_id).values_list(
+                    F('stock') - F('reserved'), flat=True).afirst()
+                if available is None:
+                    raise ProductSKU.DoesNotExist
+                logger.warning(
+                    f"Attempted to remove {quantity} from ProductSKU (ID: {product_sku_id}) but only {available} available.")
+                return json_response({"error": "Not enough stock available."}, status=status.HTTP_400_BAD_REQUEST)
+        except (ProductSKU.DoesNotExist, ValidationError):
+            logger.warning(
+                f"ProductSKU with ID {product_sku_id} or Product with ID {product_id} not found for stock movement.")
+            return json_response({"error": "Product SKU not found."}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error moving stock: {e}", exc_info=True)
+            return json_response({"error": "Internal server error.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        current_stock, sku_code = moved
+        logger.info(
+            f"Moved {quantity} stock {self.transaction_type} for ProductSKU '{sku_code}' (ID: {product_sku_id}), Product ID {product_id}.")
+        return json_response({
+            "message": self.success_message,
+            "product_sku_current_stock": current_stock,
+        })
+
+
+class AsyncAddStockView(AsyncStockMovementView):
+    transaction_type = 'IN'
+    success_message = "Stock added successfully"
+
+
+class AsyncRemoveStockView(AsyncStockMovementView):
+    transaction_type = 'OUT'
+    success_message = "Stock removed successfully"
@@ -0,0 +1,152 @@
+"""
+Read-through cache for the product list.
+
+Two kinds of entries live in Django's cache:
+
+* one serialized ProductSerializer payload per product, keyed by a version
+  token of that product;
+* one entry per page/filter combination holding the product ids, count and
+  links of that page, keyed by a version token of the whole catalog.
+
+Writes never delete entries, they replace version tokens once their
+transaction commits (see invalidate_products), which orphans the old entries.
+Stock movements only change the tokens of the products they touch, so cached
+pages stay valid and only those products are serialized again. Changes that
+can alter which products a filter matches also replace the catalog token.
+A missing token is simply a new token, so evicted tokens can never bring a
+stale entry back.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+CACHE_ALIAS = 'default'
+CATALOG_VERSION_KEY = 'catalog:version'
+LAST_CHANGE_KEY = 'catalog:last-change'
+STATS = ('page_hits', 'page_misses', 'product_hits', 'product_misses')
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def product_version_key(product_id):
+    return f'catalog:product-version:{product_id}'
+
+
+def catalog_version(cache):
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = new_token()
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def last_change():
+    """(token, time) of the last write to any product, for ETag / Last-Modified."""
+    cache = get_cache()
+    changed = cache.get(LAST_CHANGE_KEY)
+    if changed is None:
+        changed = (new_token(), timezone.now())
+        if not cache.add(LAST_CHANGE_KEY, changed, timeout=None):
+            changed = cache.get(LAST_CHANGE_KEY, changed)
+    return changed
+
+
+def product_versions(cache, product_ids):
+    keys = {product_version_key(pk): pk for pk in product_ids}
+    found = cache.get_many(keys)
+    missing = {key: new_token() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return {keys[key]: version for key, version in {**found, **missing}.items()}
+
+
+def count(cache, stat, amount=1):
+    if not amount:
+        return
+    key = f'catalog:stats:{stat}'
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+
+
+def stats():
+    cache = get_cache()
+    values = cache.get_many([f'catalog:stats:{stat}' for stat in STATS])
+    return {stat: values.get(f'catalog:stats:{stat}', 0) for stat in STATS}
+
+
+def page_key(request, version):
+    # Absolute image URLs depend on the host, so it is part of every key
+    query = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    digest = hashlib.sha1(
+        f'{request.get_host()}|{request.path}|{query}'.encode()).hexdigest()
+    return f'catalog:page:{version}:{digest}'
+
+
+def get_page(request):
+    """(cached page or None, key to store the page under)."""
+    cache = get_cache()
+    key = page_key(request, catalog_version(cache))
+    page = cache.get(key)
+    count(cache, 'page_hits' if page is not None else 'page_misses')
+    return page, key
+
+
+def set_page(key, page):
+    get_cache().set(key, page)
+
+
+def get_products(request, product_ids, build, representation=''):
+    """
+    Payloads of ``product_ids`` in order. ``build(missing_ids)`` serializes
+    the products that are not cached and returns {id: payload}.
+    ``representation`` tells sparse fieldsets apart from the full payload.
+    """
+    cache = get_cache()
+    host = request.get_host()
+    if representation:
+        representation = hashlib.sha1(representation.encode()).hexdigest()[:12]
+    versions = product_versions(cache, product_ids)
+    keys = {pk: f'catalog:product:{host}:{pk}:{versions[pk]}:{representation}'
+            for pk in product_ids}
+    cached = cache.get_many(list(keys.values()))
+    payloads = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in product_ids if pk not in payloads]
+    count(cache, 'product_hits', len(product_ids) - len(missing))
+    count(cache, 'product_misses', len(missing))
+    if missing:
+        built = build(missing)
+        cache.set_many({keys[pk]: built[pk] for pk in missing})
+        payloads.update(built)
+    return [payloads[pk] for pk in product_ids]
+
+
+def invalidate_products(product_ids, catalog=False):
+    """
+    Replaces the version tokens of ``product_ids`` once the current
+    transaction commits; ``catalog`` also drops every cached page.
+    """
+    product_ids = {str(pk) for pk in product_ids}
+
+    def bump():
+        cache = get_cache()
+        cache.set_many({product_version_key(pk): new_token() for pk in product_ids}, timeout=None)
+        if catalog:
+            cache.set(CATALOG_VERSION_KEY, new_token(), timeout=None)
+        cache.set(LAST_CHANGE_KEY, (new_token(), timezone.now()), timeout=None)
+
+    if product_ids or catalog:
+        transaction.on_commit(bump)
@@ -0,0 +1,50 @@
+"""
+Conditional GET for list endpoints.
+
+Views report a version of what they would return (ETag) and when it last
+changed (Last-Modified) through get_validators(), which must be far cheaper
+than building the response. A client sending a matching If-None-Match or
+If-Modified-Since gets a 304 before the queryset is paginated or anything is
+serialized.
+"""
+import hashlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    Views using it define get_validators(), returning (version string, last
+    modified datetime or None).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not callable(getattr(self, 'get_validators', None)):
+            raise ImproperlyConfigured(
+                f"{type(self).__name__} uses ConditionalGetMixin but does not define get_validators().")
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_etag(self, version):
+        # The same version renders differently per query, host and format
+        request = self.request
+        query = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        key = f"{version}|{request.get_host()}|{request.path}|{query}|{request.META.get('HTTP_ACCEPT', '')}"
+        return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        version, last_modified = self.get_validators()
+        etag = self.get_etag(version)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response.headers.setdefault('ETag', etag)
+            if timestamp is not None:
+                response.headers.setdefault('Last-Modified', http_date(timestamp))
+            # Browsers revalidate on every request instead of guessing a lifetime
+            patch_cache_control(response, no_cache=True)
+        return response
@@ -0,0 +1,79 @@
+"""
+ProductImage renditions, generated off the request.
+
+Product payloads link to a fixed set of resized copies of the upload
+(settings.VERSATILEIMAGEFIELD_RENDITION_KEY_SETS['product_image']) instead
+of the multi-megabyte original. The request that stores an image only queues
+its product here: a small local worker pool resizes it once the transaction
+commits, and create_images_on_demand is off so serializing a product never
+does. ImageRenditionsReady tells the serializer the files exist, until then
+ProductImageRenditions is null and clients show the original.
+
+Renditions keep the format of the upload, JPEG and WebP at
+jpeg_resize_quality / webp_resize_quality. warm_product_images makes them
+for products stored before this existed.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from versatileimagefield.image_warmer import VersatileImageFieldWarmer
+from versatileimagefield.utils import build_versatileimagefield_url_set, get_rendition_key_set
+
+from .cache import invalidate_products
+from .models import Products
+
+logger = logging.getLogger(__name__)
+
+RENDITION_KEY_SET = 'product_image'
+WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='product-images')
+
+
+def submit_renditions(product_id):
+    return _executor.submit(_run_in_worker, product_id)
+
+
+def _run_in_worker(product_id):
+    close_old_connections()
+    try:
+        return generate_renditions(product_id)
+    except Exception:
+        logger.error(f"Renditions of product {product_id} crashed.", exc_info=True)
+        return False
+    finally:
+        close_old_connections()
+
+
+def warm_renditions(product_ids, workers=WORKERS):
+    """Generates the renditions of ``product_ids`` in ``workers`` threads, yields (product_id, ok) in order."""
+    # Pillow releases the GIL while it decodes, resizes and encodes
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warm-product-images') as pool:
+        yield from zip(product_ids, pool.map(_run_in_worker, product_ids))
+
+
+def generate_renditions(product_id):
+    """
+    Creates the missing renditions of a product's image and marks them
+    ready. Returns False when the product has no image or one failed.
+    """
+    product = Products.objects.filter(pk=product_id).only('id', 'ProductImage').first()
+    if product is None or not product.ProductImage:
+        return False
+    image_name = product.ProductImage.name
+    _, failed = VersatileImageFieldWarmer(
+        product, RENDITION_KEY_SET, 'ProductImage').warm()
+    if failed:
+        logger.warning(f"Could not create renditions of '{image_name}' for product {product_id}.")
+        return False
+    # A newer upload replaced the image meanwhile, its own job marks it
+    if Products.objects.filter(pk=product_id, ProductImage=image_name).update(ImageRenditionsReady=True):
+        invalidate_products([product_id])
+    return True
+
+
+def rendition_urls(image, request=None):
+    """{rendition name: url} of a ProductImage, without touching storage."""
+    return build_versatileimagefield_url_set(
+        image, get_rendition_key_set(RENDITION_KEY_SET), request=request)
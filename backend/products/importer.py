@@ -0,0 +1,163 @@
+"""
+Streaming catalog import for CSV and JSON Lines files.
+
+Each row describes one product in the same shape as the multipart create
+endpoint: ProductName, ProductCode, HSNCode, Active, IsFavourite, plus
+``variants`` / ``initial_product_skus`` (JSONL) or ``variants_json`` /
+``initial_product_skus_json`` (CSV columns holding JSON). Rows go through
+ProductSerializer, so they are validated and created exactly like a POST
+to ProductCreateAPIView.
+
+The file is read lazily and written one chunk per transaction. The chunk's
+progress counters and row errors commit together with its products, so an
+import that dies half way resumes from the first row of the chunk that did
+not commit.
+"""
+import csv
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from rest_framework import serializers
+
+from .models import CatalogImport, CatalogImportError
+from .serializers import ProductSerializer
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_FIELDS = ('ProductName', 'ProductCode', 'HSNCode', 'Active', 'IsFavourite')
+
+# Uploads are processed off the request, one import at a time
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-import')
+
+
+def submit_import(catalog_import_id):
+    return _executor.submit(_run_in_worker, catalog_import_id)
+
+
+def _run_in_worker(catalog_import_id):
+    close_old_connections()
+    try:
+        run_import(CatalogImport.objects.get(pk=catalog_import_id))
+    except Exception:
+        logger.error(f"Catalog import {catalog_import_id} crashed.", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+def iter_rows(catalog_import):
+    """Yields (row_number, row dict or parse error message), row numbers start at 1."""
+    with catalog_import.source.open('rb') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        if catalog_import.file_format == 'csv':
+            for row_number, row in enumerate(csv.DictReader(text), start=1):
+                yield row_number, row
+            return
+
+        row_number = 0
+        for line in text:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row_number, f"Invalid JSON: {e}"
+                continue
+            yield row_number, row if isinstance(row, dict) else "Each line must be a JSON object."
+
+
+def _json_value(row, key, json_key):
+    # JSONL carries nested lists directly, CSV carries them as JSON strings
+    if row.get(key) is not None:
+        return row[key]
+    raw = row.get(json_key)
+    if raw in (None, ''):
+        return []
+    return json.loads(raw)
+
+
+def build_serializer(row):
+    data = {field: row.get(field) for field in PRODUCT_FIELDS if row.get(field) not in (None, '')}
+    data.setdefault('Active', True)
+    try:
+        data['variants'] = _json_value(row, 'variants', 'variants_json')
+        initial_product_skus_data = _json_value(
+            row, 'initial_product_skus', 'initial_product_skus_json')
+    except json.JSONDecodeError as e:
+        raise serializers.ValidationError({'non_field_errors': [f"Invalid JSON: {e}"]})
+    return ProductSerializer(
+        data=data, context={'initial_product_skus_data': initial_product_skus_data})
+
+
+def import_row(row):
+    """Creates one product inside its own savepoint, returns the errors or None."""
+    if isinstance(row, str):
+        return {'non_field_errors': [row]}
+    try:
+        with transaction.atomic():
+            serializer = build_serializer(row)
+            if not serializer.is_valid():
+                return serializer.errors
+            serializer.save()
+    except serializers.ValidationError as e:
+        return e.detail if isinstance(e.detail, dict) else {'non_field_errors': e.detail}
+    except DatabaseError as e:
+        return {'non_field_errors': [str(e)]}
+    return None
+
+
+def process_chunk(catalog_import, rows):
+    created = 0
+    row_errors = []
+    with transaction.atomic():
+        for row_number, row in rows:
+            errors = import_row(row)
+            if errors is None:
+                created += 1
+            else:
+                row_errors.append(CatalogImportError(
+                    catalog_import=catalog_import, row_number=row_number,
+                    errors=json.loads(json.dumps(errors))))
+
+        CatalogImportError.objects.bulk_create(row_errors)
+        CatalogImport.objects.filter(pk=catalog_import.pk).update(
+            processed_rows=F('processed_rows') + len(rows),
+            created_count=F('created_count') + created,
+            failed_count=F('failed_count') + len(row_errors),
+        )
+    return created, len(row_errors)
+
+
+def run_import(catalog_import, progress=None):
+    """Runs (or resumes) an import and returns it refreshed from the database."""
+    CatalogImport.objects.filter(pk=catalog_import.pk).update(status='RUNNING', message='')
+    catalog_import.refresh_from_db()
+    logger.info(
+        f"Catalog import {catalog_import.pk} starting at row {catalog_import.processed_rows + 1}.")
+
+    try:
+        rows = islice(iter_rows(catalog_import), catalog_import.processed_rows, None)
+        while True:
+            chunk = list(islice(rows, catalog_import.chunk_size))
+            if not chunk:
+                break
+            created, failed = process_chunk(catalog_import, chunk)
+            if progress:
+                progress(chunk[-1][0], created, failed)
+    except Exception as e:
+        logger.error(f"Catalog import {catalog_import.pk} failed: {e}", exc_info=True)
+        CatalogImport.objects.filter(pk=catalog_import.pk).update(
+            status='FAILED', message=str(e))
+        raise
+
+    CatalogImport.objects.filter(pk=catalog_import.pk).update(status='COMPLETED')
+    catalog_import.refresh_from_db()
+    logger.info(
+        f"Catalog import {catalog_import.pk} completed: {catalog_import.created_count} created, "
+        f"{catalog_import.failed_count} failed.")
+    return catalog_import
@@ -0,0 +1,125 @@
+import http.client
+import itertools
+import json
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.allocator import allocate_product_id
+from products.models import Products, ProductSKU
+
+BENCH_PRODUCT_CODE = '__BENCH_ASYNC__'
+
+# (label, method, sync path, async path); movements alternate add and remove
+SCENARIOS = [
+    ('product list', 'GET', '/api/products/?limit=20', '/api/async/products/?limit=20'),
+    ('stock report', 'GET', '/api/stock/report/?limit=50', '/api/async/stock/report/?limit=50'),
+    ('stock movement', 'POST', '/api/stock/{kind}/', '/api/async/stock/{kind}/'),
+]
+
+
+class Command(BaseCommand):
+    help = ("Compare concurrent throughput of the sync endpoints on a WSGI server with "
+            "the async endpoints on an ASGI server, both already running against this "
+            "database, e.g. `gunicorn backend.wsgi -w 4 -b :8000` and "
+            "`uvicorn backend.asgi:application --workers 4 --port 8001`.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://127.0.0.1:8000',
+                            help="Base URL of the WSGI deployment.")
+        parser.add_argument('--asgi', default='http://127.0.0.1:8001',
+                            help="Base URL of the ASGI deployment.")
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help="Requests in flight at once.")
+        parser.add_argument('--requests', type=int, default=2000,
+                            help="Requests sent per scenario and deployment.")
+
+    def handle(self, *args, **options):
+        product, sku = self.seed(options['requests'])
+        movement = {'product_id': str(product.id), 'product_sku_id': str(sku.id), 'quantity': 1}
+        try:
+            for label, method, sync_path, async_path in SCENARIOS:
+                results = {}
+                for deployment, base, path in (('WSGI', options['wsgi'], sync_path),
+                                               ('ASGI', options['asgi'], async_path)):
+                    results[deployment] = self.load(
+                        base, method, path, movement, options['concurrency'], options['requests'])
+                    self.report(label, deployment, results[deployment])
+                ratio = results['ASGI']['rate'] / results['WSGI']['rate']
+                self.stdout.write(f"{label:<15} ASGI/WSGI throughput {ratio:.2f}x\n")
+        finally:
+            product.delete()
+
+        self.stdout.write(
+            "The sync product list is served from the read-through cache, the async one is not.")
+
+    def seed(self, stock):
+        Products.objects.filter(ProductCode=BENCH_PRODUCT_CODE).delete()
+        product = Products.objects.create(
+            ProductID=allocate_product_id(),
+            ProductCode=BENCH_PRODUCT_CODE, ProductName='Async endpoint benchmark',
+            TotalStock=stock)
+        sku = ProductSKU.objects.create(
+            product=product, stock=stock, sku_code=f'{BENCH_PRODUCT_CODE}-1')
+        return product, sku
+
+    def load(self, base, method, path, movement, concurrency, total):
+        url = urlsplit(base)
+        if url.scheme != 'http':
+            raise CommandError(f"Only http:// URLs are supported, got {base!r}.")
+        numbers = itertools.count()
+        local = threading.local()
+        body = json.dumps(movement)
+        headers = {'Content-Type': 'application/json'}
+
+        def send(n):
+            # One keep-alive connection per worker thread
+            if not hasattr(local, 'connection'):
+                local.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            target = path.format(kind='add' if n % 2 == 0 else 'remove')
+            started = time.perf_counter()
+            try:
+                local.connection.request(method, target, body=body if method == 'POST' else None,
+                                         headers=headers)
+                response = local.connection.getresponse()
+                response.read()
+                outcome = response.status
+            except (OSError, http.client.HTTPException) as e:
+                local.connection.close()
+                del local.connection
+                outcome = type(e).__name__
+            return outcome, (time.perf_counter() - started) * 1000
+
+        def worker():
+            results = []
+            while (n := next(numbers)) < total:
+                results.append(send(n))
+            return results
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            runs = [pool.submit(worker) for _ in range(concurrency)]
+            results = [result for run in runs for result in run.result()]
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(timing for _, timing in results)
+        return {
+            'rate': len(results) / elapsed,
+            'median': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+            'outcomes': Counter(outcome for outcome, _ in results),
+        }
+
+    def report(self, label, deployment, result):
+        outcomes = result['outcomes']
+        line = (f"{label:<15} {deployment}  {result['rate']:8.0f} req/s  "
+                f"median {result['median']:7.2f} ms  p95 {result['p95']:7.2f} ms")
+        if set(outcomes) != {200}:
+            self.stdout.write(self.style.WARNING(f"{line}  responses: {dict(outcomes)}"))
+        else:
+            self.stdout.write(line)
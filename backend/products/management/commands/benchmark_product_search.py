@@ -0,0 +1,116 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from products.models import Products, ProductSearchToken
+from products.search import index_products, search
+
+BENCH_PRODUCT_CODE = '__BENCH_SEARCH__'
+
+COLOURS = ['red', 'blue', 'green', 'black', 'white', 'navy', 'olive', 'maroon', 'teal', 'grey']
+MATERIALS = ['cotton', 'linen', 'denim', 'wool', 'silk', 'leather', 'polyester', 'canvas']
+ITEMS = ['shirt', 'trousers', 'jacket', 'sneakers', 'cap', 'scarf', 'socks', 'hoodie',
+         'shorts', 'sweater', 'blazer', 'sandals', 'belt', 'gloves', 'backpack']
+
+
+class Command(BaseCommand):
+    help = ("Seed a large catalog and time typeahead queries against the product "
+            "search index (target: under 20 ms).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=300_000)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Runs of each query, the median and p95 are reported.")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the seeded products instead of deleting them afterwards.")
+
+    def handle(self, *args, **options):
+        self.seed(options['products'], options['batch_size'])
+        try:
+            slow = self.run_queries(options['repeat'])
+        finally:
+            if not options['keep']:
+                self.stdout.write("Removing seeded products...")
+                self.remove_seeded()
+
+        if slow:
+            self.stdout.write(self.style.ERROR(f"Slower than 20 ms at p95: {', '.join(slow)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every query stays under 20 ms at p95."))
+
+    def seeded(self):
+        return Products.objects.filter(ProductCode__startswith=BENCH_PRODUCT_CODE)
+
+    def seed(self, count, batch_size):
+        existing = self.seeded().count()
+        if existing >= count:
+            self.stdout.write("Reusing previously seeded benchmark products.")
+            return
+
+        rng = random.Random(42)
+        started = time.perf_counter()
+        for start in range(existing, count, batch_size):
+            # Negative ProductIDs never clash with allocated ones
+            products = [
+                Products(
+                    ProductID=-(n + 1),
+                    ProductCode=f'{BENCH_PRODUCT_CODE}-{n:07d}',
+                    ProductName=f'{rng.choice(COLOURS).title()} {rng.choice(MATERIALS).title()} '
+                                f'{rng.choice(ITEMS).title()} {rng.randrange(10_000)}',
+                    HSNCode=str(rng.randrange(1000, 9999)),
+                    Active=True,
+                )
+                for n in range(start, min(start + batch_size, count))
+            ]
+            with transaction.atomic():
+                Products.objects.bulk_create(products)
+                index_products(products)
+            self.stdout.write(f"\rSeeded {start + len(products):,}/{count:,} products", ending='')
+        self.stdout.write(f"\nSeeding took {time.perf_counter() - started:.1f}s")
+
+        with connection.cursor() as cursor:
+            table = ProductSearchToken._meta.db_table
+            if connection.vendor == 'mysql':
+                cursor.execute(f"ANALYZE TABLE {table}")
+                cursor.fetchall()
+            else:
+                cursor.execute(f"ANALYZE {table}")
+
+    def run_queries(self, repeat):
+        queries = {
+            'short prefix': 'bl',
+            'word prefix': 'sneak',
+            'two words': 'navy hood',
+            'exact code': f'{BENCH_PRODUCT_CODE}-0001234',
+            'substring': 'eakers 12',
+            'no match': 'zzzz',
+        }
+        slow = []
+        for label, query in queries.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                results = search(query, limit=20)
+                timings.append((time.perf_counter() - started) * 1000)
+            p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+            if p95 > 20:
+                slow.append(label)
+            self.stdout.write(
+                f"{label:<14} {query!r:<28} {len(results):>3} results  "
+                f"median {statistics.median(timings):6.2f} ms  p95 {p95:6.2f} ms")
+        return slow
+
+    def remove_seeded(self):
+        # Plain DELETEs: going through the ORM would fire the cache and search
+        # signals once for every seeded product
+        ProductSearchToken.objects.filter(
+            product__ProductCode__startswith=BENCH_PRODUCT_CODE).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {Products._meta.db_table} "
+                f"WHERE {connection.ops.quote_name('ProductCode')} LIKE %s ESCAPE '!'",
+                [BENCH_PRODUCT_CODE.replace('_', '!_') + '%'])
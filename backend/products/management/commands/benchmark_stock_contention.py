@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Min
+from rest_framework.test import APIRequestFactory
+
+from products.allocator import allocate_product_id
+from products.models import Products, ProductSKU, StockShard
+from products.shards import rebalance, reshard
+from products.views import RemoveStockAPIView
+from stock.models import StockTransaction
+
+BENCH_PRODUCT_CODE = '__BENCH_STOCK_CONTENTION__'
+
+
+class Command(BaseCommand):
+    help = ("Hammer a single SKU with concurrent sales through RemoveStockAPIView and "
+            "check that stock never goes negative and the ledger stays consistent. "
+            "With --shards N the run is repeated with the SKU split across N shards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--sales', type=int, default=200,
+                            help="Sales attempted by each thread.")
+        parser.add_argument('--stock', type=int, default=2000,
+                            help="Opening stock, keep it below threads * sales to test sell-out.")
+        parser.add_argument('--shards', type=int, default=0,
+                            help="Also run with the SKU sharded, and report the throughput gain.")
+        parser.add_argument('--rebalance-every', type=float, default=0.2,
+                            help="Seconds between shard rebalances during the sharded run.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                "SQLite serialises all writers, numbers are only meaningful on MySQL/PostgreSQL."))
+
+        # Sell-out warnings from the view would drown the report
+        logging.getLogger('products').setLevel(logging.ERROR)
+        attempts = options['threads'] * options['sales']
+        rates = {}
+        for shards in [0] + ([options['shards']] if options['shards'] else []):
+            product, sku = self.seed(options['stock'])
+            try:
+                if shards:
+                    reshard(sku.id, shards)
+                outcomes, elapsed = self.hammer(
+                    product, sku, options['threads'], options['sales'],
+                    options['rebalance_every'] if shards else None)
+                if shards:
+                    rebalance([sku.id])
+                self.verify(product, sku, options['stock'], outcomes)
+            finally:
+                product.delete()
+
+            rates[shards] = attempts / elapsed
+            label = f"{shards} shards" if shards else "unsharded"
+            self.stdout.write(
+                f"{label}: {attempts} sales attempted by {options['threads']} threads in {elapsed:.2f}s "
+                f"({rates[shards]:.0f} req/s): {dict(outcomes)}")
+
+        if options['shards']:
+            self.stdout.write(f"Sharding gain: {rates[options['shards']] / rates[0]:.2f}x")
+        self.stdout.write(self.style.SUCCESS("Stock never went negative and the ledger is consistent."))
+
+    def seed(self, stock):
+        Products.objects.filter(ProductCode=BENCH_PRODUCT_CODE).delete()
+        product = Products.objects.create(
+            ProductID=allocate_product_id(),
+            ProductCode=BENCH_PRODUCT_CODE, ProductName='Stock contention benchmark',
+            TotalStock=stock)
+        sku = ProductSKU.objects.create(
+            product=product, stock=stock, sku_code=f'{BENCH_PRODUCT_CODE}-1')
+        return product, sku
+
+    def hammer(self, product, sku, threads, sales, rebalance_every=None):
+        view = RemoveStockAPIView.as_view()
+        factory = APIRequestFactory()
+        payload = {'product_id': str(product.id), 'product_sku_id': str(sku.id), 'quantity': 1}
+        outcomes = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def worker():
+            local = Counter()
+            start.wait()
+            try:
+                for _ in range(sales):
+                    response = view(factory.post('/api/stock/remove/', payload, format='json'))
+                    local[response.status_code] += 1
+            finally:
+                connections.close_all()
+            with lock:
+                outcomes.update(local)
+
+        done = threading.Event()
+
+        def rebalancer():
+            # Folds the shards into the SKU row while the sales run, as in production
+            try:
+                while not done.wait(rebalance_every):
+                    rebalance([sku.id])
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        if rebalance_every:
+            workers.append(threading.Thread(target=rebalancer))
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers[:threads]:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in workers[threads:]:
+            thread.join()
+        return outcomes, elapsed
+
+    def verify(self, product, sku, opening_stock, outcomes):
+        sku.refresh_from_db()
+        product.refresh_from_db()
+        ledger = StockTransaction.objects.filter(product_sku=sku)
+        sold = outcomes[200]
+
+        problems = []
+        if sku.stock < 0:
+            problems.append(f"stock went negative ({sku.stock})")
+        if sku.stock != opening_stock - sold:
+            problems.append(f"stock is {sku.stock}, expected {opening_stock - sold}")
+        if product.TotalStock != sku.stock:
+            problems.append(f"TotalStock is {product.TotalStock}, SKU stock is {sku.stock}")
+        if ledger.count() != sold:
+            problems.append(f"{ledger.count()} ledger rows for {sold} sales")
+        if StockShard.objects.filter(product_sku=sku, stock__lt=0).exists():
+            problems.append("a stock shard went negative")
+        lowest = ledger.aggregate(lowest=Min('current_stock'))['lowest']
+        if lowest is not None and lowest < 0:
+            problems.append(f"ledger recorded a negative current_stock ({lowest})")
+        if set(outcomes) - {200, 400}:
+            problems.append(f"unexpected responses: {dict(outcomes)}")
+        if problems:
+            raise CommandError('; '.join(problems))
@@ -0,0 +1,72 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import run_import
+from products.models import CatalogImport
+
+
+class Command(BaseCommand):
+    help = "Import products, variants and SKUs from a CSV or JSON Lines catalog file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            help="Catalog file to import (.csv or .jsonl).")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="File format, guessed from the extension by default.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Rows written per transaction (default 500).")
+        parser.add_argument('--resume', metavar='IMPORT_ID',
+                            help="Resume an interrupted import from its last committed chunk.")
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                catalog_import = CatalogImport.objects.get(pk=options['resume'])
+            except (CatalogImport.DoesNotExist, ValueError):
+                raise CommandError(f"Catalog import {options['resume']} not found.")
+            if catalog_import.status == 'COMPLETED':
+                raise CommandError(f"Catalog import {catalog_import.pk} already completed.")
+            self.stdout.write(
+                f"Resuming import {catalog_import.pk} after row {catalog_import.processed_rows}.")
+        else:
+            catalog_import = self.create_import(options)
+            self.stdout.write(f"Started import {catalog_import.pk}.")
+
+        try:
+            catalog_import = run_import(catalog_import, progress=self.report_progress)
+        except Exception as e:
+            raise CommandError(
+                f"Import {catalog_import.pk} stopped: {e}. "
+                f"Run again with --resume {catalog_import.pk} to continue.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Import {catalog_import.pk} completed: {catalog_import.created_count} created, "
+            f"{catalog_import.failed_count} failed."))
+        for row_error in catalog_import.row_errors.all()[:50]:
+            self.stdout.write(self.style.WARNING(str(row_error)))
+        if catalog_import.failed_count > 50:
+            self.stdout.write(f"... and {catalog_import.failed_count - 50} more row errors.")
+
+    def create_import(self, options):
+        path = options['path']
+        if not path:
+            raise CommandError("A catalog file path is required unless --resume is given.")
+        if not os.path.isfile(path):
+            raise CommandError(f"File {path} does not exist.")
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format == 'ndjson':
+            file_format = 'jsonl'
+        if file_format not in dict(CatalogImport.FORMAT_CHOICES):
+            raise CommandError("Cannot tell the file format, pass --format csv or --format jsonl.")
+
+        catalog_import = CatalogImport(
+            file_format=file_format, chunk_size=max(options['chunk_size'], 1))
+        with open(path, 'rb') as source:
+            catalog_import.source.save(os.path.basename(path), File(source), save=False)
+        catalog_import.save()
+        return catalog_import
+
+    def report_progress(self, last_row, created, failed):
+        self.stdout.write(f"Committed through row {last_row}: {created} created, {failed} failed.")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from products.shards import rebalance
+
+
+class Command(BaseCommand):
+    help = ("Fold the shards of every sharded SKU into its stock and its product's TotalStock, "
+            "and spread the stock evenly across the shards again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float,
+                            help="Keep running and rebalance every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            done = rebalance()
+            if options['every'] is None:
+                self.stdout.write(self.style.SUCCESS(f"Rebalanced {done} sharded SKU(s)."))
+                return
+            connections.close_all()
+            time.sleep(options['every'])
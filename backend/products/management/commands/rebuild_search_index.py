@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Products
+from products.search import SEARCH_FIELDS, index_products
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the product search index from scratch. Saves keep it up to date, "
+            "this is only needed after bulk edits that bypass Products.save().")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = Products.objects.only('id', *SEARCH_FIELDS).order_by('pk')
+        batch = []
+        indexed = 0
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                index_products(batch)
+                indexed += len(batch)
+                batch = []
+        index_products(batch)
+        indexed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products."))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from products.models import Products, ProductSKU
+
+
+class Command(BaseCommand):
+    help = "Check the stored Products.TotalStock against the SKU stock and rebuild it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drifted products, do not write anything.")
+
+    def handle(self, *args, **options):
+        sku_totals = ProductSKU.objects.filter(product=OuterRef('pk')).order_by().values(
+            'product').annotate(total=Sum('stock')).values('total')
+        actual = Coalesce(Subquery(sku_totals), Value(0),
+                          output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+        with transaction.atomic():
+            drifted = Products.objects.select_for_update().annotate(
+                actual_total=actual).exclude(TotalStock=F('actual_total'))
+            rows = list(drifted.values_list(
+                'id', 'ProductCode', 'TotalStock', 'actual_total'))
+
+            for product_id, code, stored, expected in rows:
+                self.stdout.write(
+                    f"{code} ({product_id}): stored {stored}, actual {expected}")
+
+            if rows and not options['check']:
+                Products.objects.filter(id__in=[row[0] for row in rows]).update(
+                    TotalStock=actual)
+
+        if not rows:
+            self.stdout.write(self.style.SUCCESS(
+                "TotalStock is consistent for all products."))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(rows)} product(s) have a drifted TotalStock."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt TotalStock for {len(rows)} product(s)."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import ProductSKU
+from products.shards import reshard
+
+
+class Command(BaseCommand):
+    help = ("Split the stock of a hot SKU across shards so its sales stop queueing on one "
+            "row lock, or merge it back with --shards 0. See products.shards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('sku_code')
+        parser.add_argument('--shards', type=int, default=8,
+                            help="Number of shards, 0 keeps the stock in the SKU row again.")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 64:
+            raise CommandError("--shards must be between 0 and 64.")
+        sku_id = ProductSKU.objects.filter(sku_code=options['sku_code']).values_list(
+            'id', flat=True).first()
+        if sku_id is None:
+            raise CommandError(f"No SKU with code {options['sku_code']!r}.")
+
+        stock = reshard(sku_id, options['shards'])
+        if options['shards']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['sku_code']}: {stock} in stock, split across {options['shards']} shards."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['sku_code']}: {stock} in stock, no longer sharded."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.images import warm_renditions
+from products.models import Products
+
+
+class Command(BaseCommand):
+    help = ("Generate the ProductImage renditions of the existing catalog in parallel, "
+            "for products whose renditions are not marked ready.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Images resized at once.")
+        parser.add_argument('--all', action='store_true',
+                            help="Also check products already marked ready, e.g. after a size was added.")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        products = Products.objects.exclude(ProductImage='').exclude(ProductImage__isnull=True)
+        if not options['all']:
+            products = products.filter(ImageRenditionsReady=False)
+        product_ids = list(products.order_by('pk').values_list('id', flat=True))
+
+        warmed = failed = 0
+        for product_id, ok in warm_renditions(product_ids, workers=options['workers']):
+            if ok:
+                warmed += 1
+            else:
+                failed += 1
+                self.stderr.write(f"Product {product_id}: renditions failed, see the log.")
+            if (warmed + failed) % 100 == 0:
+                self.stdout.write(f"{warmed + failed}/{len(product_ids)} products...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Renditions ready for {warmed} product(s), {failed} failed."))
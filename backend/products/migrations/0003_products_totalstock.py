@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:44
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_total_stock(apps, schema_editor):
+    Products = apps.get_model('products', 'Products')
+    ProductSKU = apps.get_model('products', 'ProductSKU')
+    totals = ProductSKU.objects.filter(product=OuterRef('pk')).order_by().values(
+        'product').annotate(total=Sum('stock')).values('total')
+    Products.objects.update(TotalStock=Coalesce(
+        Subquery(totals), Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_alter_products_createduser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='TotalStock',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(populate_total_stock, migrations.RunPython.noop),
+    ]
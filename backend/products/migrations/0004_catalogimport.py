@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:51
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_products_totalstock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogImport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('source', models.FileField(upload_to='imports/')),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], max_length=5)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('chunk_size', models.PositiveIntegerField(default=500)),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('created_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('message', models.TextField(blank=True)),
+                ('CreatedDate', models.DateTimeField(auto_now_add=True)),
+                ('UpdatedDate', models.DateTimeField(auto_now=True)),
+                ('CreatedUser', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_objects', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-CreatedDate'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogImportError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.PositiveIntegerField()),
+                ('errors', models.JSONField()),
+                ('catalog_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='row_errors', to='products.catalogimport')),
+            ],
+            options={
+                'ordering': ['row_number'],
+            },
+        ),
+    ]
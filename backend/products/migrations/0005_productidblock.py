@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:53
+
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+# ProductIDBlock.SIZE at the time of this migration
+BLOCK_SIZE = 20
+
+
+def seed_product_id_blocks(apps, schema_editor):
+    # Start the block sequence above every ProductID handed out so far
+    Products = apps.get_model('products', 'Products')
+    ProductIDBlock = apps.get_model('products', 'ProductIDBlock')
+    highest = Products.objects.aggregate(highest=models.Max('ProductID'))['highest'] or 0
+    if highest <= 0:
+        return
+    ProductIDBlock.objects.create(id=-(-highest // BLOCK_SIZE))
+
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [ProductIDBlock]):
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_catalogimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductIDBlock',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('CreatedDate', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(seed_product_id_blocks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:55
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def populate_option_fields(apps, schema_editor):
+    # Same rules as ProductSKU.build_options_label / build_options_signature
+    ProductSKU = apps.get_model('products', 'ProductSKU')
+    batch = []
+    skus = ProductSKU.objects.prefetch_related('sub_variants__variant')
+    for sku in skus.iterator(chunk_size=1000):
+        options = sorted(sku.sub_variants.all(), key=lambda sv: (sv.variant.name, sv.option))
+        sku.options_label = ', '.join([sv.option for sv in options])[:255]
+        canonical = '|'.join(sorted(sv.option.strip().lower() for sv in options))
+        sku.options_signature = hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+        batch.append(sku)
+        if len(batch) >= 1000:
+            ProductSKU.objects.bulk_update(batch, ['options_label', 'options_signature'])
+            batch = []
+    ProductSKU.objects.bulk_update(batch, ['options_label', 'options_signature'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_productidblock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsku',
+            name='options_label',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='productsku',
+            name='options_signature',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(fields=['product', 'options_signature'], name='product_sku_signature_idx'),
+        ),
+        migrations.RunPython(populate_option_fields, migrations.RunPython.noop),
+    ]
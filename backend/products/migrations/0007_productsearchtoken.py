@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:05
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Same rules as products.search at the time of this migration
+WORD_RE = re.compile(r'\w+')
+
+
+def tokens(text):
+    text = ' '.join(WORD_RE.findall((text or '').lower()))
+    found = {('w', word[:64]) for word in text.split()}
+    found.update(('g', text[i:i + 3]) for i in range(len(text) - 2))
+    return found
+
+
+def index_existing_products(apps, schema_editor):
+    Products = apps.get_model('products', 'Products')
+    ProductSearchToken = apps.get_model('products', 'ProductSearchToken')
+    batch = []
+    products = Products.objects.only('id', 'ProductName', 'ProductCode', 'HSNCode')
+    for product in products.iterator(chunk_size=1000):
+        found = tokens(product.ProductName) | tokens(product.ProductCode) | tokens(product.HSNCode)
+        batch.extend(ProductSearchToken(product_id=product.id, kind=kind, token=token)
+                     for kind, token in found)
+        if len(batch) >= 5000:
+            ProductSearchToken.objects.bulk_create(batch)
+            batch = []
+    ProductSearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_productsku_options_label'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('w', 'Word'), ('g', 'Trigram')], max_length=1)),
+                ('token', models.CharField(max_length=64)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='products.products', db_index=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'token', 'product'], name='product_search_token_idx'), models.Index(fields=['product', 'kind', 'token'], name='product_search_product_idx')],
+            },
+        ),
+        migrations.RunPython(index_existing_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_productsearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsku',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('stock', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('product_sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='products.productsku')),
+            ],
+            options={
+                'unique_together': {('product_sku', 'shard')},
+            },
+        ),
+    ]
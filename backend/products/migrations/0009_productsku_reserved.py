@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_stockshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsku',
+            name='reserved',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_productsku_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='ImageRenditionsReady',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_products_imagerenditionsready'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='catalogimport',
+            name='chunk_size',
+            field=models.PositiveIntegerField(default=500, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
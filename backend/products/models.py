@@ -1,12 +1,26 @@
+import hashlib
+import random
+import time
 import uuid
-from django.db import models
+from collections import namedtuple
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import IntegrityError, connection, models, transaction
 from django.utils.translation import gettext_lazy as _
 from versatileimagefield.fields import VersatileImageField
-from django.db.models import Sum
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .cache import invalidate_products
 
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
+# Result of ProductSKU.move_stock; ``sharded`` moves leave ProductSKU.stock
+# and TotalStock to products.shards.rebalance
+StockMove = namedtuple('StockMove', ['stock', 'sku_code', 'sharded'])
+
 
 class Products(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -15,6 +29,8 @@ class Products(models.Model):
     ProductName = models.CharField(max_length=255)
     ProductImage = VersatileImageField(
         upload_to="uploads/", blank=True, null=True)
+    # Set by products.images once the renditions of ProductImage exist
+    ImageRenditionsReady = models.BooleanField(default=False, editable=False)
     CreatedDate = models.DateTimeField(auto_now_add=True)
     UpdatedDate = models.DateTimeField(blank=True, null=True)
     CreatedUser = models.ForeignKey(
@@ -22,6 +38,9 @@ class Products(models.Model):
     IsFavourite = models.BooleanField(default=False)
     Active = models.BooleanField(default=False)
     HSNCode = models.CharField(max_length=255, blank=True, null=True)
+    # Sum of stock across all SKUs, kept in step with every stock movement
+    TotalStock = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0.00, editable=False)
 
     class Meta:
         unique_together = ('ProductCode', 'ProductID',)
@@ -30,9 +49,86 @@ class Products(models.Model):
     def __str__(self):
         return self.ProductName
 
+    @classmethod
+    def adjust_total_stocks(cls, deltas):
+        # Incremental update of {product_id: delta} in a single UPDATE, call
+        # inside the transaction that moves the stock
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        invalidate_products(deltas)
+        if len(deltas) == 1:
+            [(pk, delta)] = deltas.items()
+            cls.objects.filter(pk=pk).update(TotalStock=F('TotalStock') + delta)
+            return
+        cls.objects.filter(pk__in=deltas).update(TotalStock=F('TotalStock') + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
+    def refresh_total_stock(self):
+        # Full recount from the SKUs, for places that edit stock directly
+        total = self.productsku_set.aggregate(total=Sum('stock'))['total'] or 0
+        Products.objects.filter(pk=self.pk).update(TotalStock=total)
+        invalidate_products([self.pk])
+        self.TotalStock = total
+        return total
+
+
+class ProductIDBlock(models.Model):
+    """
+    Each row reserves SIZE consecutive ProductIDs: row ``n`` owns
+    ``(n - 1) * SIZE + 1`` to ``n * SIZE``. Rows are numbered by the table's
+    auto-increment, which never blocks other writers and never hands the same
+    value out twice, so workers reserve blocks concurrently without locks or
+    retries. See products.allocator.
+    """
+    # Changing SIZE remaps every existing block, reseed the table if you do
+    SIZE = 20
+
+    id = models.BigAutoField(primary_key=True)
+    CreatedDate = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def first_id(self):
+        return (self.id - 1) * self.SIZE + 1
+
     @property
-    def TotalStock(self):
-        return self.productsku_set.aggregate(total=Sum('stock'))['total'] or 0.00
+    def last_id(self):
+        return self.id * self.SIZE
+
+
+class ProductSearchToken(models.Model):
+    """
+    Search index row of a product, see products.search. WORD rows hold each
+    lowercased word of ProductName, ProductCode and HSNCode for prefix
+    matching, TRIGRAM rows every three-character slice for substring matching.
+    """
+    WORD = 'w'
+    TRIGRAM = 'g'
+    KINDS = (
+        (WORD, 'Word'),
+        (TRIGRAM, 'Trigram'),
+    )
+    MAX_LENGTH = 64
+
+    # Indexed by product_search_product_idx below
+    product = models.ForeignKey(
+        Products, related_name='search_tokens', on_delete=models.CASCADE, db_index=False)
+    kind = models.CharField(max_length=1, choices=KINDS)
+    token = models.CharField(max_length=MAX_LENGTH)
+
+    class Meta:
+        indexes = [
+            # Prefix scans walk (kind, token) in order and stop at the limit
+            models.Index(fields=['kind', 'token', 'product'],
+                         name='product_search_token_idx'),
+            # Checking the other words of a query on one product is a single seek
+            models.Index(fields=['product', 'kind', 'token'],
+                         name='product_search_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} '{self.token}' of {self.product_id}"
 
 
 class Variant(models.Model):
@@ -71,25 +167,327 @@ class ProductSKU(models.Model):  # SKU -> Stock Keeping Unit
     sub_variants = models.ManyToManyField(
         SubVariant, related_name='product_skus')
     sku_code = models.CharField(max_length=255, unique=True, blank=True)
+    # Denormalised from sub_variants by products.signals, e.g. "Red, S"
+    options_label = models.CharField(
+        max_length=255, blank=True, db_index=True, editable=False)
+    # Order and case independent hash of the option values, see build_options_signature
+    options_signature = models.CharField(
+        max_length=40, blank=True, editable=False)
+    # Number of StockShard rows holding this SKU's stock, 0 when the stock
+    # lives in this row, see products.shards
+    shard_count = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Quantity held by active StockReservations, kept in step by
+    # stock.reservations; sales only take stock - reserved
+    reserved = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0.00, editable=False)
+
+    # Suffixes tried in order on a clash, random ones are tried after them
+    MAX_SKU_CODE_SUFFIX = 100
 
     class Meta:
         ordering = ['sku_code']
+        indexes = [
+            models.Index(fields=['product', 'options_signature'],
+                         name='product_sku_signature_idx'),
+        ]
 
     def __str__(self):
-        options_str = ', '.join(
-            [sv.option for sv in self.sub_variants.all().order_by('variant__name', 'option')])
-        return f"{self.product.ProductName} - {options_str} (SKU: {self.sku_code})"
+        return f"{self.product.ProductName} - {self.options_label} (SKU: {self.sku_code})"
+
+    @staticmethod
+    def build_options_label(sub_variants):
+        ordered = sorted(sub_variants, key=lambda sv: (sv.variant.name, sv.option))
+        return ', '.join([sv.option for sv in ordered])[:255]
+
+    @staticmethod
+    def build_options_signature(options):
+        canonical = '|'.join(sorted(str(option).strip().lower() for option in options))
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    @property
+    def available_stock(self):
+        return self.stock - self.reserved
+
+    def set_option_fields(self, sub_variants):
+        # sub_variants need their variant loaded, the label is ordered by variant name
+        self.options_label = self.build_options_label(sub_variants)
+        self.options_signature = self.build_options_signature(
+            [sv.option for sv in sub_variants])
+
+    def refresh_option_fields(self):
+        self.set_option_fields(list(self.sub_variants.select_related('variant')))
+        ProductSKU.objects.filter(pk=self.pk).update(
+            options_label=self.options_label, options_signature=self.options_signature)
+
+    @classmethod
+    def move_stock(cls, sku_id, delta, product_id=None):
+        """
+        Adds ``delta`` (negative for a sale) to a SKU's stock with a single
+        conditional UPDATE that refuses to take stock below what is reserved, instead of
+        locking the row, checking in Python and re-reading it. Sharded SKUs
+        move one of their StockShard rows instead, see StockShard.move.
+
+        Returns a ``StockMove(new_stock, sku_code, sharded)``, or ``None``
+        when no SKU matched or there was not enough stock. Must run inside a
+        transaction together with the ledger insert.
+        """
+        try:
+            sku_id = cls._meta.pk.to_python(sku_id)
+            if product_id is not None:
+                product_id = cls._meta.get_field('product').target_field.to_python(product_id)
+        except ValidationError:
+            return None
+
+        # Sharded SKUs must not touch their own row, even a failed UPDATE
+        # keeps it locked until commit on MySQL
+        if sku_id in StockShard.sharded_sku_ids():
+            moved = StockShard.move(sku_id, delta, product_id)
+            if moved is not StockShard.NOT_SHARDED:
+                return moved
+
+        moved = cls._move_unsharded_stock(sku_id, delta, product_id)
+        if moved is None and cls.objects.filter(id=sku_id, shard_count__gt=0).exists():
+            # Sharded by another process since the registry was loaded
+            StockShard.forget_sharded_sku_ids()
+            moved = StockShard.move(sku_id, delta, product_id)
+            return None if moved is StockShard.NOT_SHARDED else moved
+        return moved
+
+    @classmethod
+    def _move_unsharded_stock(cls, sku_id, delta, product_id):
+        if cls.supports_update_returning():
+            return cls._move_stock_returning(sku_id, delta, product_id)
+
+        skus = cls.objects.filter(id=sku_id, shard_count=0)
+        if product_id is not None:
+            skus = skus.filter(product_id=product_id)
+        if delta < 0:
+            skus = skus.filter(stock__gte=F('reserved') - delta)
+        if not skus.update(stock=F('stock') + delta):
+            return None
+        # The UPDATE holds the row lock until commit, so this read is ours
+        stock, sku_code = cls.objects.filter(id=sku_id).values_list('stock', 'sku_code').get()
+        return StockMove(stock, sku_code, False)
+
+    @staticmethod
+    def supports_update_returning():
+        # PostgreSQL and SQLite 3.35+ understand UPDATE ... RETURNING, MySQL does not
+        return connection.vendor == 'postgresql' or (
+            connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert)
+
+    @classmethod
+    def _move_stock_returning(cls, sku_id, delta, product_id):
+        table = connection.ops.quote_name(cls._meta.db_table)
+        sql = f"UPDATE {table} SET stock = stock + %s WHERE id = %s AND shard_count = 0"
+        params = [delta, cls._meta.pk.get_db_prep_value(sku_id, connection)]
+        if product_id is not None:
+            sql += " AND product_id = %s"
+            params.append(cls._meta.get_field('product').target_field.get_db_prep_value(
+                product_id, connection))
+        if delta < 0:
+            sql += " AND stock >= reserved + %s"
+            params.append(-delta)
+        sql += " RETURNING stock, sku_code"
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        stock_field = cls._meta.get_field('stock')
+        stock = stock_field.to_python(row[0]).quantize(Decimal(10) ** -stock_field.decimal_places)
+        return StockMove(stock, row[1], False)
+
+    @staticmethod
+    def live_stock():
+        """
+        Expression for the exact stock of a SKU. Shards hold the available
+        stock of a sharded SKU, its stock is their total plus what is reserved.
+        """
+        shard_total = StockShard.objects.filter(product_sku=OuterRef('pk')).order_by().values(
+            'product_sku').annotate(total=Sum('stock')).values('total')
+        return Case(
+            When(shard_count=0, then=F('stock')),
+            default=Coalesce(Subquery(shard_total), Value(Decimal('0.00'))) + F('reserved'),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+    @staticmethod
+    def build_sku_code(product_code, sub_variants):
+        # Options ordered by variant name, e.g. "TSHIRT-RED-M" for Color/Size
+        ordered = sorted(sub_variants, key=lambda sv: (sv.variant.name, sv.option))
+        options_slug = '-'.join([sv.option.replace(' ', '').upper() for sv in ordered])
+        return f"{product_code}-{options_slug}"
 
     def save(self, *args, **kwargs):
-        if not self.sku_code:
-            product_code = self.product.ProductCode
-            options_slug = '-'.join([
-                sv.option.replace(' ', '').upper() for sv in self.sub_variants.all().order_by('variant__name', 'option')
-            ])
-            self.sku_code = f"{product_code}-{options_slug}"
-            counter = 0
-            original_sku_code = self.sku_code
-            while ProductSKU.objects.filter(sku_code=self.sku_code).exists():
+        if self.sku_code:
+            return super().save(*args, **kwargs)
+        sub_variants = [] if self._state.adding else self.sub_variants.select_related('variant')
+        self.save_with_unique_sku_code(
+            self.build_sku_code(self.product.ProductCode, sub_variants), *args, **kwargs)
+
+    def save_with_unique_sku_code(self, base_code, *args, **kwargs):
+        """
+        Saves with ``base_code``, or ``base_code-1``, ``base_code-2``... when the
+        unique index rejects it, then with random numeric suffixes once
+        MAX_SKU_CODE_SUFFIX is used up. The common case is a single INSERT; the
+        extra lookup only runs after a failed insert to tell a code clash from
+        any other integrity error.
+        """
+        counter = 0
+        while True:
+            self.sku_code = f"{base_code}-{counter}" if counter else base_code
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if not ProductSKU.objects.filter(sku_code=self.sku_code).exclude(pk=self.pk).exists():
+                    raise
+            if counter < self.MAX_SKU_CODE_SUFFIX:
                 counter += 1
-                self.sku_code = f"{original_sku_code}-{counter}"
-        super().save(*args, **kwargs)
+            else:
+                counter = random.randint(self.MAX_SKU_CODE_SUFFIX + 1, 10 ** 9)
+
+    def is_placeholder_sku_code(self):
+        # Codes generated before any option was attached, e.g. "TSHIRT-" or "TSHIRT--2"
+        base_code = self.build_sku_code(self.product.ProductCode, [])
+        suffix = self.sku_code[len(base_code):]
+        return self.sku_code.startswith(base_code) and (
+            suffix == '' or (suffix.startswith('-') and suffix[1:].isdigit()))
+
+
+class StockShard(models.Model):
+    """
+    One slice of a hot SKU's stock. Sales of a sharded SKU update a single
+    shard, so they no longer queue on the ProductSKU row lock; the SKU's
+    available stock is the sum of its shards, held units are in
+    ProductSKU.reserved. See products.shards.
+    """
+    product_sku = models.ForeignKey(
+        ProductSKU, related_name='stock_shards', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    stock = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+
+    # Shards a sale tries on its own before locking them all
+    MOVE_ATTEMPTS = 2
+    # Seconds the process-local set of sharded SKU ids is trusted
+    SHARDED_IDS_TTL = 5
+    NOT_SHARDED = object()
+    _sharded_sku_ids = (None, frozenset())
+
+    class Meta:
+        unique_together = ('product_sku', 'shard')
+
+    def __str__(self):
+        return f"{self.product_sku_id} #{self.shard}: {self.stock}"
+
+    @classmethod
+    def sharded_sku_ids(cls):
+        """
+        Ids of the sharded SKUs, reloaded every SHARDED_IDS_TTL seconds. A
+        stale set only costs a retry: unsharded moves check shard_count.
+        """
+        loaded, sku_ids = cls._sharded_sku_ids
+        if loaded is None or time.monotonic() - loaded > cls.SHARDED_IDS_TTL:
+            sku_ids = frozenset(ProductSKU.objects.filter(
+                shard_count__gt=0).values_list('id', flat=True))
+            cls._sharded_sku_ids = (time.monotonic(), sku_ids)
+        return sku_ids
+
+    @classmethod
+    def forget_sharded_sku_ids(cls):
+        cls._sharded_sku_ids = (None, frozenset())
+
+    @classmethod
+    def move(cls, sku_id, delta, product_id=None):
+        """
+        Adds ``delta`` to one shard of a sharded SKU: additions go to the
+        smallest shard, sales to a random shard holding enough. A sale no
+        single shard can cover is taken from several under lock. Returns a
+        StockMove, None without enough stock, or NOT_SHARDED.
+        """
+        shards = cls.objects.filter(product_sku_id=sku_id, product_sku__shard_count__gt=0)
+        if product_id is not None:
+            shards = shards.filter(product_sku__product_id=product_id)
+        rows = list(shards.values_list('shard', 'stock', 'product_sku__sku_code', 'product_sku__reserved'))
+        if not rows:
+            return cls.NOT_SHARDED
+        sku_code, reserved = rows[0][2:]
+        # Stock as this movement saw it, concurrent sales of other shards may not be in it
+        total = sum(row[1] for row in rows) + reserved
+        shards = cls.objects.filter(product_sku_id=sku_id)
+
+        if delta >= 0:
+            smallest = min(rows, key=lambda row: row[1])[0]
+            if not shards.filter(shard=smallest).update(stock=F('stock') + delta):
+                # Folded away by an unshard since the read, the caller moves the SKU row
+                return cls.NOT_SHARDED
+            return StockMove(total + delta, sku_code, True)
+
+        candidates = [row[0] for row in rows if row[1] >= -delta]
+        random.shuffle(candidates)
+        for shard in candidates[:cls.MOVE_ATTEMPTS]:
+            if shards.filter(shard=shard, stock__gte=-delta).update(stock=F('stock') + delta):
+                return StockMove(total + delta, sku_code, True)
+
+        # Lock every shard in shard order and take from the fullest first
+        locked = list(shards.select_for_update().order_by('shard'))
+        if not locked:
+            return cls.NOT_SHARDED
+        available = sum(shard.stock for shard in locked)
+        if available < -delta:
+            return None
+        remaining = -delta
+        for shard in sorted(locked, key=lambda shard: shard.stock, reverse=True):
+            taken = min(shard.stock, remaining)
+            shard.stock -= taken
+            remaining -= taken
+        cls.objects.bulk_update(locked, ['stock'])
+        return StockMove(available + reserved + delta, sku_code, True)
+
+
+class CatalogImport(models.Model):
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    )
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    source = models.FileField(upload_to="imports/")
+    file_format = models.CharField(max_length=5, choices=FORMAT_CHOICES)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    chunk_size = models.PositiveIntegerField(default=500, validators=[MinValueValidator(1)])
+    # Rows covered by committed chunks, a resumed import skips this many
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    CreatedDate = models.DateTimeField(auto_now_add=True)
+    UpdatedDate = models.DateTimeField(auto_now=True)
+    CreatedUser = models.ForeignKey(
+        User, related_name='%(class)s_objects', on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        ordering = ['-CreatedDate']
+
+    def __str__(self):
+        return f"{self.source.name} ({self.status})"
+
+
+class CatalogImportError(models.Model):
+    catalog_import = models.ForeignKey(
+        CatalogImport, related_name='row_errors', on_delete=models.CASCADE)
+    row_number = models.PositiveIntegerField()
+    errors = models.JSONField()
+
+    class Meta:
+        ordering = ['row_number']
+
+    def __str__(self):
+        return f"Row {self.row_number}: {self.errors}"
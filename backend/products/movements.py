@@ -0,0 +1,32 @@
+"""
+Single stock movements, shared by the sync and async stock endpoints.
+"""
+from django.db import transaction
+
+from stock.models import StockTransaction
+from .models import Products, ProductSKU
+
+
+def record_movement(product_id, product_sku_id, transaction_type, quantity):
+    """
+    Moves ``quantity`` into (IN) or out of (OUT) a SKU, adjusts the product
+    total and writes the ledger row in one transaction. Returns
+    (current_stock, sku_code), or None when the SKU does not belong to the
+    product or, for OUT, holds less than ``quantity``.
+    """
+    delta = quantity if transaction_type == 'IN' else -quantity
+    with transaction.atomic():
+        moved = ProductSKU.move_stock(product_sku_id, delta, product_id=product_id)
+        if moved is None:
+            return None
+        # Sharded SKUs reach TotalStock when their shards are folded
+        if not moved.sharded:
+            Products.adjust_total_stocks({product_id: delta})
+        StockTransaction.objects.create(
+            product_id=product_id,
+            product_sku_id=product_sku_id,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            current_stock=moved.stock
+        )
+    return moved.stock, moved.sku_code
@@ -0,0 +1,196 @@
+"""
+Product search.
+
+``ProductName__icontains`` and the admin search become ``LIKE '%x%'`` scans
+that no index can serve. Instead every product is broken into
+ProductSearchToken rows, rebuilt whenever the product is saved (see
+products.signals):
+
+* WORD tokens, each lowercased word of ProductName, ProductCode and HSNCode.
+  A prefix lookup is a range scan on product_search_token_idx that stops as
+  soon as enough products are found.
+* TRIGRAM tokens, every three-character slice of the same fields. A
+  substring lookup finds the products holding the trigrams of the query and
+  then checks the real substring.
+
+Results are ranked: exact ProductCode first, then products with a word
+starting with the query, then substring matches.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Products, ProductSearchToken
+
+SEARCH_FIELDS = ('ProductName', 'ProductCode', 'HSNCode')
+MATCH_CODE = 'code'
+MATCH_PREFIX = 'prefix'
+MATCH_SUBSTRING = 'substring'
+# Index entries read per batch for every result wanted, the rest is verification
+# slack; further batches are read while products are filtered out or fail the check
+CANDIDATE_FACTOR = 5
+# Trigrams of the query weighed, and the rarest ones used, to find substring candidates
+MAX_QUERY_GRAMS = 8
+SUBSTRING_GRAMS = 4
+# Index entries counted per condition to find the rarest one
+RARITY_SCAN = 500
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+def words(text):
+    return [word[:ProductSearchToken.MAX_LENGTH] for word in normalize(text).split()]
+
+
+def trigrams(text):
+    text = normalize(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def prefix_end(prefix):
+    # Smallest string above every string starting with prefix. A range is an
+    # index scan on every backend, LIKE 'x%' is not on SQLite.
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def product_tokens(product):
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        value = getattr(product, field)
+        tokens.update((ProductSearchToken.WORD, word) for word in words(value))
+        tokens.update((ProductSearchToken.TRIGRAM, gram) for gram in trigrams(value))
+    return tokens
+
+
+def index_products(products, batch_size=1000):
+    """Replaces the search tokens of ``products``."""
+    products = list(products)
+    with transaction.atomic():
+        ProductSearchToken.objects.filter(product__in=products).delete()
+        ProductSearchToken.objects.bulk_create([
+            ProductSearchToken(product=product, kind=kind, token=token)
+            for product in products
+            for kind, token in product_tokens(product)
+        ], batch_size=batch_size)
+
+
+def matches_words(product, query_words):
+    # Every query word must start some word of the product
+    product_words = [word for field in SEARCH_FIELDS for word in words(getattr(product, field))]
+    return all(any(word.startswith(query_word) for word in product_words)
+               for query_word in query_words)
+
+
+def matches_substring(product, query):
+    return any(query in normalize(getattr(product, field)) for field in SEARCH_FIELDS)
+
+
+def search(query, limit=20, queryset=None):
+    """
+    Up to ``limit`` (product, match) pairs for ``query``, best match first.
+    ``queryset`` narrows the products, e.g. to Active ones.
+    """
+    queryset = Products.objects.all() if queryset is None else queryset
+    query_words = words(query)
+    if not query_words or limit <= 0:
+        return []
+    candidates = limit * CANDIDATE_FACTOR
+    results = []
+    seen = set()
+
+    def take(id_batches, match, check):
+        checked = set()
+        for product_ids in id_batches:
+            product_ids = [pk for pk in dict.fromkeys(product_ids)
+                           if pk not in seen and pk not in checked]
+            checked.update(product_ids)
+            products = queryset.filter(id__in=product_ids).in_bulk()
+            # Keep the index order, it already ranks shorter and exact words first
+            for pk in product_ids:
+                product = products.get(pk)
+                if product is not None and check(product):
+                    seen.add(pk)
+                    results.append((product, match))
+                    if len(results) == limit:
+                        return
+
+    # Codes are usually typed in the wrong case, all variants are unique index lookups
+    code = query.strip()
+    take([queryset.filter(ProductCode__in={code, code.upper(), code.lower()}).values_list(
+        'id', flat=True)], MATCH_CODE, lambda product: True)
+
+    if len(results) < limit:
+        take(batches(prefix_candidates(query_words), candidates),
+             MATCH_PREFIX, lambda product: matches_words(product, query_words))
+
+    normalized = normalize(query)
+    grams = trigrams(normalized)
+    if len(results) < limit and grams:
+        take(batches(substring_candidates(grams), candidates),
+             MATCH_SUBSTRING, lambda product: matches_substring(product, normalized))
+
+    return results
+
+
+def batches(matches, size):
+    """
+    Product ids of ``matches`` ((token, product_id) rows in index order),
+    ``size`` rows at a time. Each batch resumes after the last row read, so
+    it is another short range scan however far the search has to go.
+    """
+    after = None
+    while True:
+        page = matches
+        if after is not None:
+            page = page.filter(Q(token__gt=after[0]) | Q(token=after[0], product_id__gt=after[1]))
+        rows = list(page[:size])
+        if rows:
+            yield [pk for _, pk in rows]
+        if len(rows) < size:
+            return
+        after = rows[-1]
+
+
+def prefix_candidates(query_words):
+    # Products with a word starting with each query word
+    return matching_products(ProductSearchToken.WORD, [
+        Q(token__gte=word, token__lt=prefix_end(word)) for word in dict.fromkeys(query_words)
+    ])
+
+
+def substring_candidates(grams):
+    # Products holding the rarest trigrams of the query, each one is verified
+    # afterwards so a few trigrams are enough to narrow the candidates
+    grams = sorted(grams)
+    if len(grams) > MAX_QUERY_GRAMS:
+        step = len(grams) / MAX_QUERY_GRAMS
+        grams = [grams[int(i * step)] for i in range(MAX_QUERY_GRAMS)]
+    return matching_products(ProductSearchToken.TRIGRAM, [
+        Q(token=gram) for gram in grams
+    ], use=SUBSTRING_GRAMS)
+
+
+def matching_products(kind, conditions, use=None):
+    """
+    (token, product_id) rows of products with a ``kind`` token matching each
+    of ``conditions``, or only the ``use`` rarest of them. The rarest
+    condition is scanned in index order, the others are checked per product
+    with a seek on product_search_product_idx, so a slice of the rows stops
+    the scan as soon as it is filled instead of joining whole posting lists.
+    """
+    tokens = ProductSearchToken.objects.filter(kind=kind)
+    if len(conditions) > 1:
+        conditions = sorted(conditions, key=lambda condition: tokens.filter(
+            condition)[:RARITY_SCAN].count())[:use]
+    first, *rest = conditions
+    queryset = tokens.filter(first)
+    for condition in rest:
+        queryset = queryset.filter(Exists(ProductSearchToken.objects.filter(
+            condition, kind=kind, product_id=OuterRef('product_id'))))
+    # Token order ranks exact and shorter words first
+    return queryset.order_by('token', 'product_id').values_list('token', 'product_id')
@@ -1,8 +1,11 @@
 from rest_framework import serializers
-from django.db import transaction
-from .models import Products, Variant, SubVariant, ProductSKU
+from django.db import IntegrityError, transaction
+from .allocator import allocate_product_id
+from .images import rendition_urls, submit_renditions
+from .models import Products, Variant, SubVariant, ProductSKU, CatalogImport
 from stock.models import StockTransaction
 import logging
+from decimal import Decimal, InvalidOperation
 
 logger = logging.getLogger(__name__)
 
@@ -59,15 +62,17 @@ class VariantSerializer(serializers.ModelSerializer):
 
 # Serializer for ProductSKU (primarily for reading/output now)
 class ProductSKUSerializer(serializers.ModelSerializer):
-    product_sku_options = serializers.SerializerMethodField(read_only=True)
+    product_sku_options = serializers.CharField(
+        source='options_label', read_only=True)
+    # Stock not held by a reservation, stock - reserved fits the stock column
+    available_stock = serializers.DecimalField(
+        max_digits=ProductSKU._meta.get_field('stock').max_digits,
+        decimal_places=ProductSKU._meta.get_field('stock').decimal_places, read_only=True)
 
     class Meta:
         model = ProductSKU
-        fields = ['id', 'sku_code', 'stock', 'product_sku_options']
-        read_only_fields = ['id', 'sku_code', 'stock', 'product_sku_options']
-
-    def get_product_sku_options(self, obj):
-        return ', '.join([sv.option for sv in obj.sub_variants.all().order_by('variant__name', 'option')])
+        fields = ['id', 'sku_code', 'stock', 'available_stock', 'product_sku_options']
+        read_only_fields = ['id', 'sku_code', 'stock', 'available_stock', 'product_sku_options']
 
 
 # REMOVED: CategorySerializer
@@ -79,18 +84,45 @@ class ProductSerializer(serializers.ModelSerializer):
     product_skus = ProductSKUSerializer(
         many=True, read_only=True, source='productsku_set')
 
-    TotalStock = serializers.DecimalField(
-        max_digits=10, decimal_places=2, read_only=True)
     ProductImage = serializers.ImageField(required=False, allow_null=True)
+    # {thumbnail, card, detail} URLs, null until products.images has made them
+    ProductImageRenditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Products
         fields = ['id', 'ProductID', 'ProductCode', 'ProductName', 'ProductImage',
-                  'CreatedDate', 'UpdatedDate', 'CreatedUser', 'IsFavourite', 'Active',
+                  'ProductImageRenditions', 'CreatedDate', 'UpdatedDate', 'CreatedUser', 'IsFavourite', 'Active',
                   'HSNCode', 'TotalStock', 'variants', 'product_skus']
         read_only_fields = ['id', 'CreatedDate', 'UpdatedDate',
                             'CreatedUser', 'TotalStock', 'ProductID']
 
+    # Nested relations, each one costs its own prefetch queries
+    nested_fields = ('variants', 'product_skus')
+    # Model fields read by the fields that are not model fields themselves
+    field_columns = {'ProductImageRenditions': ('ProductImage', 'ImageRenditionsReady')}
+
+    def __init__(self, *args, **kwargs):
+        # fields=[...] renders only those fields, e.g. ?fields= on the product list
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def columns(cls, fields):
+        """Model fields to load with QuerySet.only() for rendering ``fields``."""
+        columns = ['id']
+        for name in fields:
+            if name not in cls.nested_fields:
+                columns.extend(cls.field_columns.get(name, (name,)))
+        return columns
+
+    def get_ProductImageRenditions(self, obj):
+        if not obj.ProductImage or not obj.ImageRenditionsReady:
+            return None
+        return rendition_urls(obj.ProductImage, request=self.context.get('request'))
+
     @transaction.atomic
     def create(self, validated_data):
         variants_data = validated_data.pop('variants', [])
@@ -103,69 +135,111 @@ class ProductSerializer(serializers.ModelSerializer):
             f"ProductSerializer.create - Received product_skus_data (from context): {initial_product_skus_data}")
 
         if not validated_data.get('ProductID'):
-            last_product = Products.objects.order_by('-ProductID').first()
-            validated_data['ProductID'] = (
-                last_product.ProductID if last_product and last_product.ProductID is not None else 0) + 1
+            validated_data['ProductID'] = allocate_product_id()
 
+        skus_to_create = []
+        for sku_data in initial_product_skus_data:
+            try:
+                sku_stock = Decimal(str(sku_data.get('stock', 0) or 0))
+            except (InvalidOperation, ValueError):
+                raise serializers.ValidationError(
+                    f"Invalid stock value {sku_data.get('stock')!r} for SKU {sku_data.get('options', [])}.")
+            if not sku_stock.is_finite() or sku_stock < 0:
+                raise serializers.ValidationError(
+                    f"Invalid stock value {sku_data.get('stock')!r} for SKU {sku_data.get('options', [])}.")
+            skus_to_create.append((sku_stock, sku_data.get('options', [])))
+
+        validated_data['TotalStock'] = sum(
+            (stock for stock, _ in skus_to_create), Decimal(0))
         product = Products.objects.create(**validated_data)
         logger.info(
             f"Product '{product.ProductName}' created. Now creating variants and SKUs.")
+        if product.ProductImage:
+            # Resized once the product commits, the request only stores the upload
+            transaction.on_commit(lambda: submit_renditions(product.pk))
 
-        # Create Variants and SubVariants
+        # Create Variants and SubVariants, one INSERT per table
+        variants = []
+        sub_variants = []
         for variant_data in variants_data:
             sub_variants_data = variant_data.pop('sub_variants', [])
-            variant = Variant.objects.create(product=product, **variant_data)
-            for sv_data in sub_variants_data:
-                SubVariant.objects.create(variant=variant, **sv_data)
+            variant = Variant(product=product, **variant_data)
+            variants.append(variant)
+            sub_variants.extend(SubVariant(variant=variant, **sv_data)
+                                for sv_data in sub_variants_data)
+        Variant.objects.bulk_create(variants)
+        SubVariant.objects.bulk_create(sub_variants)
         logger.info(
             f"Variants and SubVariants created for product '{product.ProductName}'.")
 
+        # Options are resolved from the sub-variants just created, not the database
+        options_map = {}
+        for sub_variant in sub_variants:
+            options_map.setdefault(sub_variant.option.lower(), []).append(sub_variant)
+
         # Create ProductSKUs manually
-        if not initial_product_skus_data:
+        if not skus_to_create:
             logger.warning(
                 f"No initial_product_skus_data received for product '{product.ProductName}'. SKUs will not be created.")
 
-        for sku_data in initial_product_skus_data:
-            try:
-                sku_stock = sku_data.get('stock', 0)
-                option_strings = sku_data.get('options', [])
-
-                product_sku = ProductSKU.objects.create(
-                    product=product, stock=sku_stock)
-
-                sub_variants_for_sku = []
-                for option_str in option_strings:
-                    try:
-                        sub_variant = SubVariant.objects.get(
-                            option__iexact=option_str,
-                            variant__product=product
-                        )
-                        sub_variants_for_sku.append(sub_variant)
-                    except SubVariant.DoesNotExist:
-                        logger.error(
-                            f"SubVariant with option '{option_str}' not found for product '{product.ProductName}' during SKU creation.")
-                        raise serializers.ValidationError(
-                            f"SubVariant with option '{option_str}' not found for product '{product.ProductName}'."
-                        )
-
-                product_sku.sub_variants.set(sub_variants_for_sku)
-                product_sku.save()
-
-                if sku_stock > 0:
-                    StockTransaction.objects.create(
-                        product=product,
-                        product_sku=product_sku,
-                        transaction_type='IN',
-                        quantity=sku_stock,
-                        current_stock=sku_stock
+        # SKUs with the same option set get -1, -2... suffixes in memory, clashes
+        # with other products' codes are left to the unique index
+        taken_sku_codes = set()
+        product_skus = []
+        sku_options = []
+        stock_transactions = []
+        for sku_stock, option_strings in skus_to_create:
+            sub_variants_for_sku = []
+            for option_str in option_strings:
+                matches = options_map.get(str(option_str).lower(), [])
+                if len(matches) != 1:
+                    logger.error(
+                        f"SubVariant with option '{option_str}' not found for product '{product.ProductName}' during SKU creation.")
+                    raise serializers.ValidationError(
+                        f"SubVariant with option '{option_str}' not found for product '{product.ProductName}'."
+                        if not matches else
+                        f"Option '{option_str}' is ambiguous for product '{product.ProductName}'."
                     )
-                logger.info(
-                    f"ProductSKU '{product_sku.sku_code}' created successfully with stock {sku_stock}.")
-
-            except Exception as e:
-                logger.error(
-                    f"Error creating ProductSKU for product '{product.ProductName}' with data {sku_data}: {e}", exc_info=True)
-                raise
+                sub_variants_for_sku.append(matches[0])
+
+            sku_code = ProductSKU.build_sku_code(product.ProductCode, sub_variants_for_sku)
+            unique_sku_code, counter = sku_code, 0
+            while unique_sku_code in taken_sku_codes:
+                counter += 1
+                unique_sku_code = f"{sku_code}-{counter}"
+            taken_sku_codes.add(unique_sku_code)
+
+            product_sku = ProductSKU(
+                product=product, stock=sku_stock, sku_code=unique_sku_code)
+            product_sku.set_option_fields(sub_variants_for_sku)
+            product_skus.append(product_sku)
+            sku_options.append(sub_variants_for_sku)
+            if sku_stock > 0:
+                stock_transactions.append(StockTransaction(
+                    product=product,
+                    product_sku=product_sku,
+                    transaction_type='IN',
+                    quantity=sku_stock,
+                    current_stock=sku_stock
+                ))
+
+        try:
+            with transaction.atomic():
+                ProductSKU.objects.bulk_create(product_skus)
+        except IntegrityError:
+            # A code is already used by another product, let the unique index
+            # pick free suffixes one SKU at a time
+            for product_sku in product_skus:
+                product_sku.save_with_unique_sku_code(product_sku.sku_code)
+        SKUOptions = ProductSKU.sub_variants.through
+        SKUOptions.objects.bulk_create([
+            SKUOptions(productsku_id=product_sku.id, subvariant_id=sub_variant.id)
+            for product_sku, options in zip(product_skus, sku_options)
+            for sub_variant in options
+        ])
+        StockTransaction.objects.bulk_create(stock_transactions)
+        logger.info(
+            f"{len(product_skus)} ProductSKU(s) created for product '{product.ProductName}'.")
 
         return product
 
@@ -180,6 +254,51 @@ class ProductSerializer(serializers.ModelSerializer):
         product_image = validated_data.get('ProductImage')
         if product_image is not None:
             instance.ProductImage = product_image
+            instance.ImageRenditionsReady = False
 
         instance.save()
+        if product_image is not None:
+            transaction.on_commit(lambda: submit_renditions(instance.pk))
         return instance
+
+
+# Lightweight product row for search results, see products.search
+class ProductSearchSerializer(serializers.ModelSerializer):
+    match = serializers.CharField(source='search_match', read_only=True)
+
+    class Meta:
+        model = Products
+        fields = ['id', 'ProductID', 'ProductCode', 'ProductName', 'HSNCode',
+                  'Active', 'TotalStock', 'match']
+        read_only_fields = fields
+
+
+# Serializer for catalog import jobs (upload + progress)
+class CatalogImportSerializer(serializers.ModelSerializer):
+    file_format = serializers.ChoiceField(
+        choices=CatalogImport.FORMAT_CHOICES, required=False)
+    row_errors = serializers.SerializerMethodField(read_only=True)
+
+    max_reported_errors = 100
+
+    class Meta:
+        model = CatalogImport
+        fields = ['id', 'source', 'file_format', 'status', 'chunk_size', 'processed_rows',
+                  'created_count', 'failed_count', 'message', 'row_errors',
+                  'CreatedDate', 'UpdatedDate']
+        read_only_fields = ['id', 'status', 'processed_rows', 'created_count',
+                            'failed_count', 'message', 'row_errors', 'CreatedDate', 'UpdatedDate']
+        extra_kwargs = {'source': {'write_only': True}}
+
+    def validate(self, attrs):
+        if not attrs.get('file_format'):
+            extension = attrs['source'].name.rsplit('.', 1)[-1].lower()
+            attrs['file_format'] = 'jsonl' if extension == 'ndjson' else extension
+            if attrs['file_format'] not in dict(CatalogImport.FORMAT_CHOICES):
+                raise serializers.ValidationError(
+                    {'file_format': "Cannot tell the file format, send file_format csv or jsonl."})
+        return attrs
+
+    def get_row_errors(self, obj):
+        return [{'row': error.row_number, 'errors': error.errors}
+                for error in obj.row_errors.all()[:self.max_reported_errors]]
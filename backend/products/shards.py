@@ -0,0 +1,112 @@
+"""
+Sharded stock for hot SKUs.
+
+Every sale of a SKU updates its ProductSKU row and its product's TotalStock,
+so during a promotion all sales of a bestseller queue on those row locks.
+``reshard(sku, n)`` splits the SKU's stock across ``n`` StockShard rows:
+sales then update one shard picked at random (StockShard.move). The shards
+hold the stock that is not reserved, so the exact stock is their sum plus
+ProductSKU.reserved (ProductSKU.live_stock()).
+
+Sales of a sharded SKU leave ProductSKU.stock and TotalStock alone.
+rebalance() folds the shard total back into both in one transaction, so
+readers always see them agree, at most one rebalance behind, and spreads the
+stock evenly across the shards again so sales keep finding a shard with
+enough. Run it every few seconds with ``rebalance_stock_shards --every 5``.
+
+Batch endpoints that lock SKU rows and move stock in memory fold the shards
+of those SKUs first and spread them again afterwards, see fold_locked.
+"""
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import transaction
+
+from .models import Products, ProductSKU, StockShard
+
+CENT = Decimal('0.01')
+
+
+def split(total, count):
+    """``total`` spread over ``count`` shards, the remainder on the first one."""
+    share = (total / count).quantize(CENT, rounding=ROUND_DOWN)
+    return [total - share * (count - 1)] + [share] * (count - 1)
+
+
+def reshard(sku_id, count=None):
+    """
+    Folds a SKU's stock into ProductSKU.stock and TotalStock and spreads it
+    over ``count`` shards, 0 unshards it and None keeps its shard count.
+    Returns the SKU's stock.
+    """
+    with transaction.atomic():
+        sku = ProductSKU.objects.select_for_update().get(pk=sku_id)
+        count = sku.shard_count if count is None else count
+        shards = list(StockShard.objects.select_for_update().filter(
+            product_sku=sku).order_by('shard'))
+        total = sum((shard.stock for shard in shards), sku.reserved) if shards else sku.stock
+
+        if count and len(shards) == count:
+            for shard, amount in zip(shards, split(total - sku.reserved, count)):
+                shard.stock = amount
+            StockShard.objects.bulk_update(shards, ['stock'])
+        else:
+            StockShard.objects.filter(product_sku=sku).delete()
+            if count:
+                StockShard.objects.bulk_create([
+                    StockShard(product_sku=sku, shard=number, stock=amount)
+                    for number, amount in enumerate(split(total - sku.reserved, count))
+                ])
+
+        Products.adjust_total_stocks({sku.product_id: total - sku.stock})
+        ProductSKU.objects.filter(pk=sku.pk).update(stock=total, shard_count=count)
+    StockShard.forget_sharded_sku_ids()
+    return total
+
+
+def rebalance(sku_ids=None):
+    """Folds and evens out every sharded SKU, or those of ``sku_ids``. Returns the number done."""
+    skus = ProductSKU.objects.filter(shard_count__gt=0)
+    if sku_ids is not None:
+        skus = skus.filter(id__in=sku_ids)
+    done = 0
+    # One short transaction per SKU, sales of the others carry on
+    for sku_id in skus.values_list('id', flat=True):
+        reshard(sku_id)
+        done += 1
+    return done
+
+
+def fold_locked(skus):
+    """
+    For batches that lock SKU rows and move their stock in memory: locks the
+    shards of the sharded ``skus`` and sets their ``stock`` to the shard
+    total. Returns ({sku_id: shards} for spread_locked, {product_id: delta}
+    still owed to TotalStock).
+    """
+    sharded = {sku.id: sku for sku in skus if sku.shard_count}
+    if not sharded:
+        return {}, {}
+    shards = {}
+    for shard in StockShard.objects.select_for_update().filter(
+            product_sku_id__in=sharded).order_by('product_sku_id', 'shard'):
+        shards.setdefault(shard.product_sku_id, []).append(shard)
+
+    deltas = {}
+    for sku_id, sku_shards in shards.items():
+        sku = sharded[sku_id]
+        total = sum((shard.stock for shard in sku_shards), sku.reserved)
+        deltas[sku.product_id] = deltas.get(sku.product_id, 0) + total - sku.stock
+        sku.stock = total
+    return shards, deltas
+
+
+def spread_locked(shards, skus):
+    """Spreads the new ``stock`` of the SKUs folded by fold_locked over their shards again."""
+    changed = []
+    for sku in skus:
+        sku_shards = shards.get(sku.id)
+        if sku_shards:
+            for shard, amount in zip(sku_shards, split(sku.available_stock, len(sku_shards))):
+                shard.stock = amount
+            changed.extend(sku_shards)
+    StockShard.objects.bulk_update(changed, ['stock'], batch_size=500)
@@ -0,0 +1,91 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_products
+from .models import Products, ProductSKU, SubVariant, Variant
+from .search import SEARCH_FIELDS, index_products
+
+
+def refresh_skus(skus):
+    for sku in skus:
+        sku.refresh_option_fields()
+        invalidate_products([sku.product_id])
+        # SKUs saved before their options (admin, SKU inline) get a real code
+        # once the options arrive; codes already built from options never change
+        if sku.sku_code and sku.options_label and sku.is_placeholder_sku_code():
+            sku.save_with_unique_sku_code(
+                ProductSKU.build_sku_code(
+                    sku.product.ProductCode, sku.sub_variants.select_related('variant')),
+                update_fields=['sku_code'])
+
+
+@receiver(m2m_changed, sender=ProductSKU.sub_variants.through)
+def sku_options_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # sub_variant.product_skus.add(...): pk_set holds the SKUs
+        refresh_skus(ProductSKU.objects.filter(
+            pk__in=pk_set or []).select_related('product'))
+    else:
+        refresh_skus([instance])
+
+
+@receiver(post_save, sender=SubVariant)
+def sub_variant_saved(sender, instance, created, **kwargs):
+    # A renamed option changes the label and signature of every SKU using it
+    if not created:
+        refresh_skus(instance.product_skus.select_related('product'))
+
+
+@receiver(post_save, sender=Variant)
+def variant_saved(sender, instance, created, **kwargs):
+    # Labels are ordered by variant name
+    if not created:
+        refresh_skus(ProductSKU.objects.filter(
+            sub_variants__variant=instance).distinct().select_related('product'))
+
+
+@receiver(pre_delete, sender=SubVariant)
+def sub_variant_deleting(sender, instance, **kwargs):
+    instance._affected_sku_ids = list(instance.product_skus.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=SubVariant)
+def sub_variant_deleted(sender, instance, **kwargs):
+    # The through rows went with the option, without an m2m_changed signal
+    refresh_skus(ProductSKU.objects.filter(
+        pk__in=getattr(instance, '_affected_sku_ids', [])).select_related('product'))
+
+
+# Product list cache, see products.cache. Stock movements use UPDATE and are
+# invalidated by Products.adjust_total_stocks instead.
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def product_changed(sender, instance, **kwargs):
+    # Name, code or Active may change which products a filter matches
+    invalidate_products([instance.pk], catalog=True)
+
+
+@receiver(post_save, sender=Products)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    # Search tokens only depend on the name, code and HSN code
+    if update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+        index_products([instance])
+
+
+@receiver(post_save, sender=Variant)
+@receiver(post_delete, sender=Variant)
+@receiver(post_save, sender=ProductSKU)
+@receiver(post_delete, sender=ProductSKU)
+def product_part_changed(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
+
+
+@receiver(post_save, sender=SubVariant)
+@receiver(post_delete, sender=SubVariant)
+def sub_variant_changed(sender, instance, **kwargs):
+    invalidate_products(Variant.objects.filter(
+        pk=instance.variant_id).values_list('product_id', flat=True))
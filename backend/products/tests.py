@@ -1,3 +1,929 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import pathlib
+import shutil
+import tempfile
+import time
+import uuid
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import generics
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+
+from . import allocator, search
+from .admin import ProductSKUAdmin, ProductSKUInlineForm
+from .conditional import ConditionalGetMixin
+from .images import generate_renditions
+from .importer import run_import
+from .models import CatalogImport, Products, ProductIDBlock, ProductSKU, StockShard
+from .shards import rebalance, reshard
+
+
+def create_product(client, code, stocks=(5, 3, 0, 2)):
+    variants = [
+        {'name': 'Color', 'sub_variants': [{'option': 'Red'}, {'option': 'Blue'}]},
+        {'name': 'Size', 'sub_variants': [{'option': 'S'}, {'option': 'M'}]},
+    ]
+    options = [['Red', 'S'], ['Red', 'M'], ['Blue', 'S'], ['Blue', 'M']]
+    skus = [{'options': opts, 'stock': stock}
+            for opts, stock in zip(options, stocks)]
+    response = client.post('/api/products/create/', {
+        'ProductName': f'Shirt {code}',
+        'ProductCode': code,
+        'variants_json': json.dumps(variants),
+        'initial_product_skus_json': json.dumps(skus),
+    }, format='multipart')
+    assert response.status_code == 201, response.content
+    return response.data
+
+
+class ProductListQueryCountTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(25):
+            create_product(self.client, f'P{i:03d}')
+
+    def list_query_count(self, limit):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        counts = {limit: self.list_query_count(limit) for limit in (1, 5, 20)}
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_page_of_twenty_products(self):
+        # count, products, variants, sub-variants, SKUs
+        with self.assertNumQueries(5):
+            self.client.get('/api/products/', {'limit': 20})
+
+    def test_sku_options_are_ordered_by_variant_name(self):
+        response = self.client.get('/api/products/', {'limit': 1})
+        options = [sku['product_sku_options']
+                   for sku in response.data['results'][0]['product_skus']]
+        self.assertIn('Red, S', options)
+        self.assertIn('Blue, M', options)
+
+
+class ProductListCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = [create_product(self.client, f'C{i:03d}') for i in range(3)]
+
+    def write(self):
+        # Invalidation waits for the commit, which TestCase never reaches
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def list_products(self, **params):
+        response = self.client.get('/api/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+
+class ProductListCacheTests(ProductListCacheTestCase):
+    def test_repeated_list_is_served_from_the_cache(self):
+        first = self.list_products()
+        with self.assertNumQueries(0):
+            second = self.list_products()
+        self.assertEqual(second, first)
+        self.assertEqual(self.client.get('/api/products/cache/stats/').data, {
+            'page_hits': 1, 'page_misses': 1, 'product_hits': 3, 'product_misses': 3})
+
+    def test_stock_movement_invalidates_only_that_product(self):
+        self.list_products()
+        product = self.products[0]
+        sku = product['product_skus'][0]
+        with self.write():
+            self.client.post('/api/stock/add/', {
+                'product_id': product['id'], 'product_sku_id': sku['id'], 'quantity': 4}, format='json')
+
+        # Page still cached: the product and its variants, sub-variants and SKUs
+        with self.assertNumQueries(4):
+            data = self.list_products()
+        stocks = {row['id']: row['stock']
+                  for result in data['results'] for row in result['product_skus']}
+        self.assertEqual(Decimal(stocks[sku['id']]), Decimal(sku['stock']) + 4)
+        self.assertEqual(self.client.get('/api/products/cache/stats/').data['product_misses'], 4)
+
+    def test_new_and_renamed_products_refresh_cached_pages(self):
+        self.list_products(ProductName__icontains='shirt')
+        with self.write():
+            create_product(self.client, 'C999')
+        self.assertEqual(self.list_products(ProductName__icontains='shirt')['count'], 4)
+
+        product = Products.objects.get(ProductCode='C000')
+        product.ProductName = 'Renamed'
+        with self.write():
+            product.save()
+        self.assertEqual(self.list_products(ProductName__icontains='shirt')['count'], 3)
+        self.assertEqual(self.list_products(ProductName__icontains='renamed')['count'], 1)
+
+    def test_nothing_is_invalidated_by_a_rolled_back_movement(self):
+        self.list_products()
+        sku = self.products[0]['product_skus'][0]
+        with self.write() as callbacks:
+            response = self.client.post('/api/stock/remove/', {
+                'product_id': self.products[0]['id'], 'product_sku_id': sku['id'],
+                'quantity': 1000}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            self.list_products()
+
+
+class ProductListConditionalGetTests(ProductListCacheTestCase):
+    def test_unchanged_list_answers_304_without_queries(self):
+        response = self.client.get('/api/products/')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Another page is another representation
+        other = self.client.get('/api/products/', {'limit': 1})
+        self.assertNotEqual(other['ETag'], etag)
+
+    def test_stock_movement_changes_the_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+        product = self.products[0]
+        with self.write():
+            self.client.post('/api/stock/add/', {
+                'product_id': product['id'], 'product_sku_id': product['product_skus'][0]['id'],
+                'quantity': 1}, format='json')
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_view_without_validators_is_rejected(self):
+        class UnversionedListView(ConditionalGetMixin, generics.ListAPIView):
+            queryset = Products.objects.all()
+
+        with self.assertRaises(ImproperlyConfigured):
+            UnversionedListView.as_view()(APIRequestFactory().get('/'))
+
+
+class ProductListFieldsTests(ProductListCacheTestCase):
+    def test_sparse_fields_skip_the_nested_queries(self):
+        # count and products only
+        with self.assertNumQueries(2):
+            data = self.list_products(fields='id,ProductName,TotalStock')
+        self.assertEqual(set(data['results'][0]), {'id', 'ProductName', 'TotalStock'})
+        self.assertEqual(data['count'], 3)
+
+    def test_sparse_fields_only_load_those_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.list_products(fields='id,ProductName')
+        products_sql = ctx.captured_queries[-1]['sql']
+        self.assertIn('ProductName', products_sql)
+        self.assertNotIn('HSNCode', products_sql)
+
+    def test_expand_adds_one_nested_relation(self):
+        # count, products, SKUs
+        with self.assertNumQueries(3):
+            data = self.list_products(expand='product_skus')
+        product = data['results'][0]
+        self.assertNotIn('variants', product)
+        self.assertEqual(len(product['product_skus']), 4)
+        self.assertIn('ProductCode', product)
+
+    def test_fieldsets_are_cached_separately(self):
+        self.list_products(fields='id,ProductName')
+        full = self.list_products()['results'][0]
+        self.assertIn('variants', full)
+        with self.assertNumQueries(0):
+            sparse = self.list_products(fields='id,ProductName')['results'][0]
+        self.assertEqual(set(sparse), {'id', 'ProductName'})
+
+    def test_unknown_fields_are_rejected(self):
+        for params in ({'fields': 'id,Price'}, {'expand': 'ProductName'}):
+            self.assertEqual(self.client.get('/api/products/', params).status_code, 400)
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        for code, name, hsn in (('TEE', 'Blue Cotton Tee', '6109'),
+                                ('BLZ', 'Navy Wool Blazer', '6203'),
+                                ('SNK', 'Canvas Sneakers', '6404'),
+                                ('BLUEBELL', 'Bluebell Vase', '6913')):
+            Products.objects.create(ProductID=allocator.allocate_product_id(),
+                                    ProductCode=code, ProductName=name, HSNCode=hsn, Active=True)
+
+    def search(self, q, **params):
+        response = self.client.get('/api/products/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row['ProductCode'], row['match']) for row in response.data]
+
+    def test_ranked_code_prefix_and_substring_matches(self):
+        self.assertEqual(self.search('bluebell'), [('BLUEBELL', 'code')])
+        self.assertEqual(self.search('blu'), [('TEE', 'prefix'), ('BLUEBELL', 'prefix')])
+        self.assertEqual(self.search('eaker'), [('SNK', 'substring')])
+        self.assertEqual(self.search('62'), [('BLZ', 'prefix')])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('navy bl'), [('BLZ', 'prefix')])
+        self.assertEqual(self.search('navy cotton'), [])
+
+    def test_index_follows_product_saves(self):
+        product = Products.objects.get(ProductCode='SNK')
+        product.ProductName = 'Leather Loafers'
+        product.save()
+        self.assertEqual(self.search('sneak'), [])
+        self.assertEqual(self.search('loaf'), [('SNK', 'prefix')])
+
+        product.delete()
+        self.assertEqual(self.search('loaf'), [])
+
+    def test_limit_and_active_filter(self):
+        self.assertEqual(len(self.search('blu', limit=1)), 1)
+        Products.objects.filter(ProductCode='TEE').update(Active=False)
+        self.assertEqual(self.search('blu', Active='true'), [('BLUEBELL', 'prefix')])
+
+    def test_filtered_out_candidates_do_not_hide_later_matches(self):
+        # More inactive 'lamp' entries than one candidate batch rank before 'lampshade'
+        for i in range(search.CANDIDATE_FACTOR * 2):
+            Products.objects.create(ProductID=allocator.allocate_product_id(),
+                                    ProductCode=f'LMP{i}', ProductName='Desk Lamp', Active=False)
+        Products.objects.create(ProductID=allocator.allocate_product_id(),
+                                ProductCode='SHD', ProductName='Linen Lampshade', Active=True)
+        self.assertEqual(self.search('lamp', Active='true', limit=1), [('SHD', 'prefix')])
+        self.assertEqual(self.search('amp', Active='true', limit=1), [('SHD', 'substring')])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+
+
+class ProductCreateTests(APITestCase):
+    def create_matrix(self, code, sizes):
+        names = ['Color', 'Size', 'Fit'][:len(sizes)]
+        variants = [{'name': name, 'sub_variants': [{'option': f'{name}{i}'} for i in range(size)]}
+                    for name, size in zip(names, sizes)]
+        options = [[]]
+        for variant in variants:
+            options = [opts + [sv['option']] for opts in options for sv in variant['sub_variants']]
+        skus = [{'options': opts, 'stock': 1} for opts in options]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/products/create/', {
+                'ProductName': code, 'ProductCode': code,
+                'variants_json': json.dumps(variants),
+                'initial_product_skus_json': json.dumps(skus),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response, len(ctx.captured_queries)
+
+    def test_creation_cost_is_flat_in_the_variant_matrix(self):
+        _, small = self.create_matrix('SMALL', [2, 2])
+        _, large = self.create_matrix('LARGE', [3, 5, 6])
+        self.assertEqual(small, large)
+
+    def test_skus_get_codes_options_and_opening_stock(self):
+        response, _ = self.create_matrix('CODES', [2, 3])
+        product = Products.objects.get(id=response.data['id'])
+        self.assertEqual(product.productsku_set.count(), 6)
+        self.assertEqual(product.TotalStock, 6)
+        self.assertEqual(product.stock_transactions.count(), 6)
+        sku = product.productsku_set.get(sku_code='CODES-COLOR1-SIZE2')
+        self.assertEqual(sku.options_label, 'Color1, Size2')
+
+    def test_unknown_option_rolls_back_the_product(self):
+        response = self.client.post('/api/products/create/', {
+            'ProductName': 'Bad', 'ProductCode': 'BAD',
+            'variants_json': json.dumps([{'name': 'Color', 'sub_variants': [{'option': 'Red'}]}]),
+            'initial_product_skus_json': json.dumps([{'options': ['Green'], 'stock': 1}]),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Products.objects.filter(ProductCode='BAD').exists())
+
+
+class SKUCodeTests(APITestCase):
+    def setUp(self):
+        self.product = Products.objects.create(
+            ProductID=900, ProductCode='TEE', ProductName='Tee')
+
+    def test_codes_clash_through_the_unique_index_not_probes(self):
+        first = ProductSKU(product=self.product)
+        with CaptureQueriesContext(connection) as ctx:
+            first.save()
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT')])
+
+        second = ProductSKU(product=self.product)
+        second.save()
+        self.assertEqual((first.sku_code, second.sku_code), ('TEE-', 'TEE--1'))
+
+    def test_codes_past_the_last_suffix_get_a_random_one(self):
+        ProductSKU.objects.bulk_create([
+            ProductSKU(product=self.product, sku_code=f'TEE--{n}' if n else 'TEE-')
+            for n in range(ProductSKU.MAX_SKU_CODE_SUFFIX + 1)])
+        sku = ProductSKU(product=self.product)
+        sku.save()
+        suffix = sku.sku_code.removeprefix('TEE--')
+        self.assertTrue(suffix.isdigit())
+        self.assertGreater(int(suffix), ProductSKU.MAX_SKU_CODE_SUFFIX)
+        self.assertTrue(sku.is_placeholder_sku_code())
+
+    def test_options_added_later_replace_the_placeholder_code(self):
+        variant = self.product.variants.create(name='Size')
+        medium = variant.sub_variants.create(option='M')
+        sku = ProductSKU(product=self.product)
+        sku.save()
+        sku.sub_variants.add(medium)
+        sku.refresh_from_db()
+        self.assertEqual(sku.sku_code, 'TEE-M')
+
+        # Codes built from options stay put when the options change later
+        sku.sub_variants.add(variant.sub_variants.create(option='L'))
+        sku.refresh_from_db()
+        self.assertEqual(sku.sku_code, 'TEE-M')
+
+    def test_option_label_follows_option_changes(self):
+        size = self.product.variants.create(name='Size')
+        color = self.product.variants.create(name='Color')
+        medium = size.sub_variants.create(option='M')
+        sku = ProductSKU.objects.create(product=self.product, sku_code='TEE-LABEL')
+        sku.sub_variants.add(medium, color.sub_variants.create(option='Red'))
+        sku.refresh_from_db()
+        self.assertEqual(sku.options_label, 'Red, M')
+        self.assertEqual(sku.options_signature, ProductSKU.build_options_signature(['m', 'RED']))
+
+        medium.option = 'L'
+        medium.save()
+        sku.refresh_from_db()
+        self.assertEqual(sku.options_label, 'Red, L')
+
+        medium.delete()
+        sku.refresh_from_db()
+        self.assertEqual(sku.options_label, 'Red')
+
+    def test_create_falls_back_when_another_product_owns_the_code(self):
+        ProductSKU.objects.create(product=self.product, sku_code='TEE-RED-S')
+        response = self.client.post('/api/products/create/', {
+            'ProductName': 'Tee Red', 'ProductCode': 'TEE-RED',
+            'variants_json': json.dumps([{'name': 'Size', 'sub_variants': [{'option': 'S'}]}]),
+            'initial_product_skus_json': json.dumps([{'options': ['S'], 'stock': 1}]),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([sku['sku_code'] for sku in response.data['product_skus']],
+                         ['TEE-RED-S-1'])
+
+
+class ProductSKULookupTests(APITestCase):
+    def setUp(self):
+        self.product = create_product(self.client, 'LKP')
+
+    def lookup(self, options, product_id=None):
+        return self.client.get(f"/api/products/{product_id or self.product['id']}/sku",
+                               {'options': options})
+
+    def test_options_resolve_in_one_query(self):
+        expected = next(sku for sku in self.product['product_skus']
+                        if sku['product_sku_options'] == 'Red, M')
+        with self.assertNumQueries(1):
+            response = self.lookup('m, RED')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], expected['id'])
+        self.assertEqual(response.data['sku_code'], expected['sku_code'])
+
+    def test_repeated_options_parameters(self):
+        response = self.lookup(['Blue', 'S'])
+        self.assertEqual(response.data['product_sku_options'], 'Blue, S')
+
+    def test_unknown_combination_and_product(self):
+        self.assertEqual(self.lookup('Green,M').status_code, 404)
+        self.assertEqual(self.lookup('Red,M', product_id=uuid.uuid4()).data['error'], 'Product not found.')
+        self.assertEqual(self.lookup('').status_code, 400)
+
+
+class ProductIDAllocationTests(APITestCase):
+    def test_allocated_ids_are_unique_and_increasing(self):
+        allocator.reset()
+        ids = [allocator.allocate_product_id() for _ in range(ProductIDBlock.SIZE * 2 + 1)]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_created_products_get_distinct_ids(self):
+        first = create_product(self.client, 'ID1')
+        second = create_product(self.client, 'ID2')
+        self.assertNotEqual(first['ProductID'], second['ProductID'])
+
+
+class TotalStockTests(APITestCase):
+    def test_large_totals_are_serialized(self):
+        data = create_product(self.client, 'TS2', stocks=(99999999, 99999999, 0, 0))
+        self.assertEqual(data['TotalStock'], '199999998.00')
+
+    def test_total_stock_follows_stock_movements(self):
+        data = create_product(self.client, 'TS1')
+        product = Products.objects.get(id=data['id'])
+        self.assertEqual(product.TotalStock, 10)
+
+        sku = product.productsku_set.first()
+        payload = {'product_id': str(product.id),
+                   'product_sku_id': str(sku.id)}
+        self.client.post('/api/stock/add/',
+                         {**payload, 'quantity': 4}, format='json')
+        self.client.post('/api/stock/remove/',
+                         {**payload, 'quantity': 1}, format='json')
+
+        product.refresh_from_db()
+        self.assertEqual(product.TotalStock, 13)
+
+
+class StockMovementTests(APITestCase):
+    def setUp(self):
+        data = create_product(self.client, 'MOV1')
+        self.product = Products.objects.get(id=data['id'])
+        self.sku = self.product.productsku_set.get(stock=5)
+
+    def remove(self, quantity, **overrides):
+        payload = {'product_id': str(self.product.id),
+                   'product_sku_id': str(self.sku.id), 'quantity': quantity}
+        payload.update(overrides)
+        return self.client.post('/api/stock/remove/', payload, format='json')
+
+    def test_remove_is_a_single_conditional_update(self):
+        # The sharded SKU registry reloads every few seconds, keep that out of the count
+        StockShard.sharded_sku_ids()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.remove(2)
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries
+                      if 'SAVEPOINT' not in q['sql']]
+        # UPDATE SKU (plus a read-back without RETURNING), UPDATE product total, INSERT ledger row
+        expected = ['UPDATE', 'UPDATE', 'INSERT'] if ProductSKU.supports_update_returning() else [
+            'UPDATE', 'SELECT', 'UPDATE', 'INSERT']
+        self.assertEqual(statements, expected)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['product_sku_current_stock'], 3)
+        self.assertEqual(self.sku.stock_transactions.latest(
+            'transaction_date').current_stock, 3)
+
+    def test_remove_more_than_available_leaves_stock_untouched(self):
+        response = self.remove(6)
+        self.assertEqual(response.status_code, 400)
+        self.sku.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.sku.stock, 5)
+        self.assertEqual(self.product.TotalStock, 10)
+
+    def test_remove_from_unknown_sku(self):
+        self.assertEqual(self.remove(1, product_sku_id=str(uuid.uuid4())).status_code, 404)
+        self.assertEqual(self.remove(1, product_sku_id='not-a-uuid').status_code, 404)
+        self.assertEqual(self.remove(1, product_id=str(uuid.uuid4())).status_code, 404)
+
+
+class BulkStockMovementTests(APITestCase):
+    def setUp(self):
+        data = create_product(self.client, 'BLK1')
+        self.product = Products.objects.get(id=data['id'])
+        self.skus = list(self.product.productsku_set.order_by('id'))
+
+    def movement(self, sku, transaction_type, quantity):
+        return {'product_sku_id': str(sku.id), 'transaction_type': transaction_type,
+                'quantity': quantity}
+
+    def post(self, movements, **extra):
+        return self.client.post('/api/stock/bulk/', {'movements': movements, **extra},
+                                format='json')
+
+    def test_mixed_movements_are_applied_in_one_batch(self):
+        first = self.product.productsku_set.get(stock=5)
+        second = self.product.productsku_set.get(stock=3)
+        response = self.post([
+            self.movement(first, 'IN', 10),
+            self.movement(first, 'OUT', 4),
+            self.movement(second, 'OUT', second.stock),
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.data['applied']), 3)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(second.stock, 0)
+        self.assertEqual(self.product.TotalStock,
+                         sum(sku.stock for sku in self.product.productsku_set.all()))
+        self.assertEqual(
+            list(first.stock_transactions.order_by('current_stock').values_list(
+                'transaction_type', 'current_stock')),
+            [('IN', 5), ('OUT', 11), ('IN', 15)])
+
+    def test_all_or_nothing_rejects_the_whole_batch(self):
+        sku = self.skus[0]
+        stock = sku.stock
+        response = self.post([
+            self.movement(sku, 'IN', 1),
+            self.movement(sku, 'OUT', stock + 100),
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        sku.refresh_from_db()
+        self.assertEqual(sku.stock, stock)
+
+    def test_partial_mode_applies_the_valid_lines(self):
+        sku = self.skus[0]
+        stock = sku.stock
+        response = self.post([
+            self.movement(sku, 'OUT', stock + 100),
+            self.movement(sku, 'IN', 2),
+            {'product_sku_id': 'not-a-uuid', 'transaction_type': 'IN', 'quantity': 1},
+        ], atomic=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['index'] for e in response.data['errors']], [0, 2])
+        sku.refresh_from_db()
+        self.assertEqual(sku.stock, stock + 2)
+
+    def test_non_finite_quantity_is_a_line_error(self):
+        sku = self.skus[0]
+        response = self.post([self.movement(sku, 'IN', 'NaN'), self.movement(sku, 'IN', 1)],
+                             atomic=False)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([e['index'] for e in response.data['errors']], [0])
+        self.assertEqual(self.post([self.movement(sku, 'OUT', 'NaN')]).status_code, 400)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def batch_queries(size):
+            movements = [self.movement(self.skus[i % len(self.skus)], 'IN', 1)
+                         for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.post(movements)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(batch_queries(4), batch_queries(100))
+
+
+class ScanSellTests(APITestCase):
+    def setUp(self):
+        data = create_product(self.client, 'SCN1')
+        self.product = Products.objects.get(id=data['id'])
+        self.in_stock = self.product.productsku_set.get(stock=5)
+        self.other = self.product.productsku_set.get(stock=3)
+
+    def scan(self, data):
+        return self.client.post('/api/stock/scan/', data, format='json')
+
+    def test_single_scan_sells_by_sku_code(self):
+        response = self.scan({'sku_code': self.in_stock.sku_code})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['product_sku_current_stock'], 4)
+        self.in_stock.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.in_stock.stock, 4)
+        self.assertEqual(self.product.TotalStock, 9)
+        self.assertEqual(list(self.in_stock.stock_transactions.filter(
+            transaction_type='OUT').values_list('quantity', 'current_stock')), [(1, 4)])
+
+    def test_single_scan_errors(self):
+        self.assertEqual(self.scan({'sku_code': 'NOPE'}).status_code, 404)
+        response = self.scan({'sku_code': self.other.sku_code, 'quantity': 4})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['available'], 3)
+        self.assertEqual(self.scan({'sku_code': self.other.sku_code, 'quantity': 0}).status_code, 400)
+        response = self.scan({'sku_code': self.other.sku_code, 'quantity': 'NaN'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Quantity must be a valid number.')
+
+    def test_basket_repeats_the_same_code(self):
+        response = self.scan({'scans': [
+            {'sku_code': self.in_stock.sku_code},
+            {'sku_code': self.other.sku_code, 'quantity': 2},
+            {'sku_code': self.in_stock.sku_code, 'quantity': 3},
+        ]})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([sale['product_sku_current_stock'] for sale in response.data['applied']],
+                         [4, 1, 1])
+        self.in_stock.refresh_from_db()
+        self.assertEqual(self.in_stock.stock, 1)
+
+    def test_basket_is_all_or_nothing_unless_asked(self):
+        scans = [{'sku_code': self.in_stock.sku_code}, {'sku_code': 'NOPE'}]
+        response = self.scan({'scans': scans})
+        self.assertEqual(response.status_code, 400)
+        self.in_stock.refresh_from_db()
+        self.assertEqual(self.in_stock.stock, 5)
+
+        response = self.scan({'scans': scans, 'atomic': False})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['index'] for e in response.data['errors']], [1])
+        self.in_stock.refresh_from_db()
+        self.assertEqual(self.in_stock.stock, 4)
+
+    def test_query_count_does_not_grow_with_basket_size(self):
+        def basket_queries(size):
+            scans = [{'sku_code': sku.sku_code, 'quantity': '0.01'}
+                     for sku in [self.in_stock, self.other] * (size // 2)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.scan({'scans': scans})
+            return len(ctx.captured_queries)
+
+        self.assertEqual(basket_queries(4), basket_queries(100))
+
+
+class ShardedStockTests(APITestCase):
+    def setUp(self):
+        data = create_product(self.client, 'SHD1', stocks=(10, 3, 0, 0))
+        self.product = Products.objects.get(id=data['id'])
+        self.sku = self.product.productsku_set.get(stock=10)
+        reshard(self.sku.id, 4)
+
+    def move(self, kind, quantity):
+        return self.client.post(f'/api/stock/{kind}/', {
+            'product_id': str(self.product.id), 'product_sku_id': str(self.sku.id),
+            'quantity': quantity}, format='json')
+
+    def shard_stocks(self):
+        return list(self.sku.stock_shards.order_by('shard').values_list('stock', flat=True))
+
+    def assert_folded(self, stock):
+        self.sku.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.sku.stock, stock)
+        self.assertEqual(self.product.TotalStock, stock + 3)
+
+    def test_reshard_splits_the_stock(self):
+        self.assertEqual(self.shard_stocks(), [Decimal('2.50')] * 4)
+        self.assert_folded(10)
+
+    def test_sales_move_a_shard_and_rebalance_folds_them(self):
+        response = self.move('remove', 2)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['product_sku_current_stock'], 8)
+        self.assertEqual(sum(self.shard_stocks()), 8)
+        # The SKU row and the product total wait for the rebalance, together
+        self.assert_folded(10)
+
+        self.assertEqual(self.move('add', 1).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rebalance(), 1)
+        self.assert_folded(9)
+        self.assertEqual(self.shard_stocks(), [Decimal('2.25')] * 4)
+        self.assertEqual(list(self.sku.stock_transactions.filter(transaction_type='OUT').values_list(
+            'current_stock', flat=True)), [8])
+
+    def test_a_sale_larger_than_any_shard_is_taken_from_several(self):
+        self.assertEqual(self.move('remove', 9).data['product_sku_current_stock'], 1)
+        self.assertEqual(sum(self.shard_stocks()), 1)
+        self.assertTrue(all(stock >= 0 for stock in self.shard_stocks()))
+        self.assertEqual(self.move('remove', 2).status_code, 400)
+
+    def test_a_stale_registry_still_finds_the_shards(self):
+        StockShard._sharded_sku_ids = (time.monotonic(), frozenset())
+        self.assertEqual(self.move('remove', 1).data['product_sku_current_stock'], 9)
+        self.assertEqual(sum(self.shard_stocks()), 9)
+
+    def test_unsharding_folds_the_stock_back(self):
+        self.move('remove', 4)
+        self.assertEqual(reshard(self.sku.id, 0), 6)
+        self.assertFalse(self.sku.stock_shards.exists())
+        self.assert_folded(6)
+        self.assertEqual(self.move('remove', 1).data['product_sku_current_stock'], 5)
+        self.assert_folded(5)
+
+    def test_batches_fold_and_spread_the_shards(self):
+        self.move('remove', 2)
+        response = self.client.post('/api/stock/scan/', {'scans': [
+            {'sku_code': self.sku.sku_code, 'quantity': 3}]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['applied'][0]['product_sku_current_stock'], 5)
+        self.assert_folded(5)
+        self.assertEqual(self.shard_stocks(), [Decimal('1.25')] * 4)
+
+        response = self.client.post('/api/stock/bulk/', {'movements': [
+            {'product_sku_id': str(self.sku.id), 'transaction_type': 'OUT', 'quantity': 6}]},
+            format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['available'], 5)
+
+    def test_admin_cannot_edit_the_stock_of_a_sharded_sku(self):
+        self.sku.refresh_from_db()
+        self.assertTrue(ProductSKUInlineForm(instance=self.sku).fields['stock'].disabled)
+        self.assertIn('stock', ProductSKUAdmin(ProductSKU, admin.site).get_readonly_fields(None, self.sku))
+        reshard(self.sku.id, 0)
+        self.sku.refresh_from_db()
+        self.assertFalse(ProductSKUInlineForm(instance=self.sku).fields['stock'].disabled)
+
+    def test_live_stock_sums_the_shards(self):
+        self.move('remove', 3)
+        live = ProductSKU.objects.annotate(live=ProductSKU.live_stock()).values_list('id', 'live')
+        self.assertEqual(dict(live)[self.sku.id], 7)
+        self.assertEqual(dict(live)[self.product.productsku_set.get(stock=3).id], 3)
+
+
+class AsyncEndpointTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        data = create_product(self.client, 'ASY1')
+        create_product(self.client, 'ASY2')
+        self.product = Products.objects.get(id=data['id'])
+        self.sku = self.product.productsku_set.get(stock=3)
+
+    def move(self, kind, quantity, sku=None):
+        sku = sku or self.sku
+        return self.client.post(f'/api/async/stock/{kind}/', {
+            'product_id': str(sku.product_id), 'product_sku_id': str(sku.id),
+            'quantity': quantity}, format='json')
+
+    def test_product_list_matches_the_sync_list(self):
+        for query in ('?limit=1&offset=1', '?fields=id,ProductName&expand=product_skus',
+                      '?ProductCode=ASY2'):
+            sync = self.client.get(f'/api/products/{query}')
+            response = self.client.get(f'/api/async/products/{query}')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json(), json.loads(sync.content.replace(
+                b'/api/products/', b'/api/async/products/')))
+
+        self.assertEqual(self.client.get('/api/async/products/?fields=bogus').status_code, 400)
+
+    def test_add_and_remove_stock(self):
+        response = self.move('add', 2)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Decimal(response.json()['product_sku_current_stock']), 5)
+        self.assertEqual(self.move('remove', 5).status_code, 200)
+        self.assertEqual(self.move('remove', 1).status_code, 400)
+        self.assertEqual(self.move('remove', 'x').status_code, 400)
+
+        self.sku.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.sku.stock, 0)
+        self.assertEqual(self.product.TotalStock, 7)
+        self.assertEqual(self.sku.stock_transactions.count(), 3)
+
+    def test_remove_leaves_reserved_stock_alone(self):
+        ProductSKU.objects.filter(id=self.sku.id).update(reserved=2)
+        with self.assertLogs('products.async_views', 'WARNING') as logs:
+            self.assertEqual(self.move('remove', 2).status_code, 400)
+        self.assertIn('but only 1 available', logs.output[0])
+        self.assertEqual(self.move('remove', 1).status_code, 200)
+
+    def test_unknown_sku_is_not_found(self):
+        missing = ProductSKU(id=uuid.uuid4(), product=self.product)
+        self.assertEqual(self.move('add', 1, sku=missing).status_code, 404)
+        self.assertEqual(self.move('remove', 1, sku=missing).status_code, 404)
+
+    async def test_runs_natively_under_asgi(self):
+        response = await self.async_client.get('/api/async/products/?fields=id,TotalStock')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class CatalogImportTests(APITestCase):
+    variants = json.dumps([{'name': 'Size', 'sub_variants': [{'option': 'S'}, {'option': 'M'}]}])
+    skus = json.dumps([{'options': ['S'], 'stock': 2}, {'options': ['M'], 'stock': 3}])
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def make_import(self, name, content, **kwargs):
+        catalog_import = CatalogImport(file_format=name.rsplit('.', 1)[-1], **kwargs)
+        catalog_import.source.save(name, ContentFile(content.encode()), save=False)
+        catalog_import.save()
+        return catalog_import
+
+    def csv_catalog(self, codes):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['ProductName', 'ProductCode', 'HSNCode', 'Active',
+                         'variants_json', 'initial_product_skus_json'])
+        for code in codes:
+            writer.writerow([f'Shirt {code}', code, '6109', 'true', self.variants, self.skus])
+        return output.getvalue()
+
+    def test_csv_import_creates_products_and_reports_row_errors(self):
+        # Row 3 repeats the code of row 1
+        catalog_import = run_import(self.make_import(
+            'catalog.csv', self.csv_catalog(['C1', 'C2', 'C1']), chunk_size=2))
+
+        self.assertEqual(catalog_import.status, 'COMPLETED')
+        self.assertEqual((catalog_import.created_count, catalog_import.failed_count), (2, 1))
+        self.assertEqual(catalog_import.row_errors.get().row_number, 3)
+        product = Products.objects.get(ProductCode='C2')
+        self.assertEqual(product.TotalStock, 5)
+        self.assertEqual(product.productsku_set.count(), 2)
+
+    def test_jsonl_import_reports_invalid_lines(self):
+        row = {'ProductName': 'Mug', 'ProductCode': 'J1',
+               'variants': json.loads(self.variants), 'initial_product_skus': json.loads(self.skus)}
+        content = json.dumps(row) + '\n\nnot json\n' + json.dumps({'ProductCode': 'J2'}) + '\n'
+        catalog_import = run_import(self.make_import('catalog.jsonl', content))
+
+        self.assertEqual((catalog_import.created_count, catalog_import.failed_count), (1, 2))
+        self.assertEqual(list(catalog_import.row_errors.values_list('row_number', flat=True)), [2, 3])
+        self.assertIn('ProductName', catalog_import.row_errors.get(row_number=3).errors)
+
+    def test_resume_skips_committed_rows(self):
+        catalog_import = self.make_import(
+            'catalog.csv', self.csv_catalog(['R1', 'R2', 'R3']),
+            status='FAILED', processed_rows=2)
+        call_command('import_catalog', resume=str(catalog_import.pk), stdout=io.StringIO())
+
+        catalog_import.refresh_from_db()
+        self.assertEqual(catalog_import.status, 'COMPLETED')
+        self.assertEqual(catalog_import.processed_rows, 3)
+        self.assertEqual(list(Products.objects.values_list('ProductCode', flat=True)), ['R3'])
+
+    def test_upload_endpoint_rejects_an_empty_chunk_size(self):
+        upload = ContentFile(self.csv_catalog(['Z1']).encode(), name='upload.csv')
+        response = self.client.post('/api/products/import/', {'source': upload, 'chunk_size': 0},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('chunk_size', response.data)
+        self.assertFalse(CatalogImport.objects.exists())
+
+    def test_upload_endpoint_queues_the_import(self):
+        upload = ContentFile(self.csv_catalog(['U1']).encode(), name='upload.csv')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/products/import/', {'source': upload},
+                                        format='multipart')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.data['file_format'], 'csv')
+        self.assertEqual(len(callbacks), 1)
+
+        run_import(CatalogImport.objects.get(pk=response.data['id']))
+        detail = self.client.get(f"/api/products/import/{response.data['id']}/")
+        self.assertEqual(detail.data['status'], 'COMPLETED')
+        self.assertEqual(detail.data['created_count'], 1)
+
+
+def jpeg_upload(name='photo.jpg', size=(1600, 1200)):
+    content = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(content, 'JPEG')
+    return ContentFile(content.getvalue(), name=name)
+
+
+class ProductImageTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def assert_renditions(self, renditions):
+        self.assertEqual(set(renditions), {'thumbnail', 'card', 'detail'})
+        path = renditions['thumbnail'].split('/media/', 1)[1]
+        with Image.open(f'{self.media_root}/{path}') as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), 160)
+            self.assertEqual(thumbnail.format, 'JPEG')
+
+
+class ProductImageRenditionTests(ProductImageTestMixin, APITestCase):
+    def test_renditions_are_made_after_the_create_request(self):
+        # The worker runs once the transaction commits, never in the request
+        with self.captureOnCommitCallbacks():
+            response = self.client.post('/api/products/create/', {
+                'ProductName': 'Lamp', 'ProductCode': 'IMG1', 'ProductImage': jpeg_upload(),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIsNone(response.data['ProductImageRenditions'])
+        self.assertEqual([path.name for path in pathlib.Path(self.media_root).rglob('*.jpg')],
+                         ['photo.jpg'])
+
+        self.assertTrue(generate_renditions(response.data['id']))
+        product = self.client.get('/api/products/?fields=id,ProductImageRenditions').data['results'][0]
+        self.assert_renditions(product['ProductImageRenditions'])
+
+    def test_products_without_an_image_have_no_renditions(self):
+        data = create_product(self.client, 'IMG2')
+        self.assertIsNone(data['ProductImageRenditions'])
+        self.assertFalse(generate_renditions(data['id']))
+
+
+class WarmProductImagesTests(ProductImageTestMixin, APITransactionTestCase):
+    def test_command_warms_the_existing_catalog(self):
+        for code in ('W1', 'W2'):
+            product = Products(ProductID=allocator.allocate_product_id(), ProductCode=code,
+                               ProductName=f'Frame {code}')
+            product.ProductImage.save(f'{code}.jpg', jpeg_upload(), save=False)
+            product.save()
+        Products.objects.create(ProductID=allocator.allocate_product_id(), ProductCode='W3',
+                                ProductName='No image')
+
+        output = io.StringIO()
+        call_command('warm_product_images', workers=2, stdout=output)
+        self.assertIn('Renditions ready for 2 product(s), 0 failed.', output.getvalue())
+        for product in self.client.get('/api/products/').data['results']:
+            if product['ProductCode'] == 'W3':
+                self.assertIsNone(product['ProductImageRenditions'])
+            else:
+                self.assert_renditions(product['ProductImageRenditions'])
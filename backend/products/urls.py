@@ -1,12 +1,31 @@
 from django.urls import path
 from .views import (
     ProductCreateAPIView, ProductListAPIView, AddStockAPIView,
-    RemoveStockAPIView)
+    RemoveStockAPIView, BulkStockMovementAPIView, CatalogImportCreateAPIView,
+    CatalogImportDetailAPIView, CatalogCacheStatsAPIView, ProductSearchAPIView,
+    ProductSKULookupAPIView, ScanSellAPIView)
+from .async_views import AsyncProductListView, AsyncAddStockView, AsyncRemoveStockView
 
 urlpatterns = [
     path('products/create/', ProductCreateAPIView.as_view(), name='product-create'),
     path('products/', ProductListAPIView.as_view(), name='product-list'),
+    # Without the slash too, point-of-sale clients should not pay for a redirect
+    path('products/<uuid:pk>/sku/', ProductSKULookupAPIView.as_view(), name='product-sku-lookup'),
+    path('products/<uuid:pk>/sku', ProductSKULookupAPIView.as_view()),
+    path('products/search/', ProductSearchAPIView.as_view(), name='product-search'),
+    path('products/cache/stats/', CatalogCacheStatsAPIView.as_view(),
+         name='product-cache-stats'),
+    path('products/import/', CatalogImportCreateAPIView.as_view(),
+         name='catalog-import-create'),
+    path('products/import/<uuid:pk>/', CatalogImportDetailAPIView.as_view(),
+         name='catalog-import-detail'),
     path('stock/add/', AddStockAPIView.as_view(), name='stock-add'),
     path('stock/remove/', RemoveStockAPIView.as_view(), name='stock-remove'),
+    path('stock/bulk/', BulkStockMovementAPIView.as_view(), name='stock-bulk'),
+    path('stock/scan/', ScanSellAPIView.as_view(), name='stock-scan'),
+    # Native async versions for ASGI deployments, see products.async_views
+    path('async/products/', AsyncProductListView.as_view(), name='async-product-list'),
+    path('async/stock/add/', AsyncAddStockView.as_view(), name='async-stock-add'),
+    path('async/stock/remove/', AsyncRemoveStockView.as_view(), name='async-stock-remove'),
 
 ]
@@ -1,19 +1,78 @@
 import json
 import logging
-from rest_framework import generics, status
+import uuid
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from rest_framework import generics, serializers, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import F
+from django.db.models import F, Prefetch, prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Products, Variant, SubVariant, ProductSKU
-from .serializers import ProductSerializer
+from .models import Products, Variant, SubVariant, ProductSKU, CatalogImport
+from .serializers import ProductSerializer, ProductSKUSerializer, ProductSearchSerializer, CatalogImportSerializer
+from .importer import submit_import
+from .movements import record_movement
+from .shards import fold_locked, spread_locked
+from . import cache as catalog_cache
+from .conditional import ConditionalGetMixin
+from .search import search
 from stock.models import StockTransaction
 from stock.serializers import StockTransactionSerializer
+from stock.pagination import StockReportPagination
 
 logger = logging.getLogger(__name__)
 
+
+def product_tree_prefetches(variants=True, product_skus=True):
+    # Ordered Prefetch objects for the nested tree rendered by ProductSerializer
+    prefetches = []
+    if variants:
+        prefetches.append(Prefetch('variants', queryset=Variant.objects.prefetch_related(
+            Prefetch('sub_variants', queryset=SubVariant.objects.order_by('option')))))
+    if product_skus:
+        # SKU option labels are stored on ProductSKU, no need to load the options
+        prefetches.append('productsku_set')
+    return prefetches
+
+
+def requested_fields(params):
+    """
+    Product fields to render, or None for the full representation.
+    ``?fields=`` lists the fields wanted, ``?expand=`` adds nested relations
+    to the plain fields, e.g. ``?fields=id,ProductName,TotalStock`` for a
+    dropdown or ``?expand=product_skus`` to leave out the variant tree.
+    """
+    fields = expand = None
+    if 'fields' in params:
+        fields = [name for name in params['fields'].split(',') if name]
+    if 'expand' in params:
+        expand = [name for name in params['expand'].split(',') if name]
+
+    available = ProductSerializer.Meta.fields
+    nested = ProductSerializer.nested_fields
+    unknown = [name for name in (fields or []) if name not in available]
+    unknown += [name for name in (expand or []) if name not in nested]
+    if unknown:
+        raise serializers.ValidationError(
+            {"error": f"Unknown or non-expandable fields: {', '.join(unknown)}."})
+
+    if fields is None and expand is not None:
+        fields = [name for name in available if name not in nested]
+    if fields is not None:
+        fields = [name for name in available if name in fields or name in (expand or [])]
+    return fields
+
+
+def requested_prefetches(fields):
+    if fields is None:
+        return product_tree_prefetches()
+    return product_tree_prefetches(
+        variants='variants' in fields, product_skus='product_skus' in fields)
+
+
 # Create Product API
 
 
@@ -77,6 +136,7 @@ class ProductCreateAPIView(generics.CreateAPIView):
         logger.info(f"Serializer validated data: {serializer.validated_data}")
 
         self.perform_create(serializer)
+        prefetch_related_objects([serializer.instance], *product_tree_prefetches())
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
@@ -89,12 +149,37 @@ class ProductCreateAPIView(generics.CreateAPIView):
             logger.error(f"Error creating product: {e}", exc_info=True)
             raise
 
+# Catalog Import API (upload a CSV/JSONL file, processed in the background)
+
+
+class CatalogImportCreateAPIView(generics.CreateAPIView):
+    queryset = CatalogImport.objects.all()
+    serializer_class = CatalogImportSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user if request.user.is_authenticated else None
+        catalog_import = serializer.save(CreatedUser=user)
+        # The worker reads the job from its own connection, so wait for the commit
+        transaction.on_commit(lambda: submit_import(catalog_import.pk))
+        logger.info(
+            f"Catalog import {catalog_import.pk} queued for '{catalog_import.source.name}'.")
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class CatalogImportDetailAPIView(generics.RetrieveAPIView):
+    queryset = CatalogImport.objects.all()
+    serializer_class = CatalogImportSerializer
+
+
 # List Product API
 
 
-class ProductListAPIView(generics.ListAPIView):
-    queryset = Products.objects.prefetch_related(
-        'productsku_set__sub_variants').all()
+class ProductListAPIView(ConditionalGetMixin, generics.ListAPIView):
+    # Every nested relation comes from an ordered Prefetch, so a page costs
+    # the same handful of queries whatever its size
+    queryset = Products.objects.prefetch_related(*product_tree_prefetches())
     serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = {
@@ -103,6 +188,131 @@ class ProductListAPIView(generics.ListAPIView):
         'Active': ['exact'],
     }
 
+    def get_validators(self):
+        # Every product write replaces this token, see products.cache
+        return catalog_cache.last_change()
+
+    def get_requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = requested_fields(self.request.query_params)
+        return self._requested_fields
+
+    def get_prefetches(self):
+        return requested_prefetches(self.get_requested_fields())
+
+    def get_queryset(self):
+        fields = self.get_requested_fields()
+        queryset = Products.objects.prefetch_related(*self.get_prefetches())
+        if fields is not None:
+            queryset = queryset.only(*ProductSerializer.columns(fields))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        # Read-through cache of pages and per-product payloads, see products.cache
+        fields = self.get_requested_fields()
+        page, page_key = catalog_cache.get_page(request)
+        products = {}
+        if page is None:
+            # The page itself needs no prefetch, only products missing from the cache do
+            queryset = self.filter_queryset(self.get_queryset().prefetch_related(None))
+            rows = self.paginate_queryset(queryset)
+            rows = rows if rows is not None else list(queryset)
+            products = {str(product.id): product for product in rows}
+            page = {'ids': list(products)}
+            if self.paginator is not None and hasattr(self.paginator, 'count'):
+                page.update(count=self.paginator.count,
+                            next=self.paginator.get_next_link(),
+                            previous=self.paginator.get_previous_link())
+            catalog_cache.set_page(page_key, page)
+
+        def build(missing):
+            if products:
+                instances = [products[pk] for pk in missing]
+                prefetch_related_objects(instances, *self.get_prefetches())
+            else:
+                instances = self.get_queryset().filter(id__in=missing)
+            serializer = self.get_serializer(instances, many=True)
+            return {str(product.id): data for product, data in zip(instances, serializer.data)}
+
+        representation = ','.join(fields) if fields is not None else ''
+        results = catalog_cache.get_products(request, page['ids'], build, representation)
+        if 'count' not in page:
+            return Response(results)
+        return Response(OrderedDict([
+            ('count', page['count']),
+            ('next', page['next']),
+            ('previous', page['previous']),
+            ('results', results),
+        ]))
+
+
+# Product SKU Lookup API (resolve a SKU from its option values)
+
+
+class ProductSKULookupAPIView(APIView):
+    """
+    ``GET /api/products/<id>/sku?options=Red,M`` (or repeated ``options``
+    parameters for values containing commas). Order and case of the options
+    do not matter, the lookup is one query on product_sku_signature_idx.
+    """
+    def get(self, request, pk, *args, **kwargs):
+        options = request.query_params.getlist('options')
+        if len(options) == 1:
+            options = options[0].split(',')
+        options = [option.strip() for option in options if option.strip()]
+        if not options:
+            return Response({"error": "options is required, e.g. ?options=Red,M"}, status=status.HTTP_400_BAD_REQUEST)
+
+        signature = ProductSKU.build_options_signature(options)
+        skus = list(ProductSKU.objects.filter(product_id=pk, options_signature=signature)[:2])
+        if len(skus) > 1:
+            return Response({"error": "These options match more than one SKU."}, status=status.HTTP_409_CONFLICT)
+        if not skus:
+            if not Products.objects.filter(pk=pk).exists():
+                return Response({"error": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"error": "No SKU has these options."}, status=status.HTTP_404_NOT_FOUND)
+
+        data = ProductSKUSerializer(skus[0]).data
+        data['product_id'] = skus[0].product_id
+        return Response(data)
+
+
+# Product Search API (ranked prefix and substring matches for typeahead)
+
+
+class ProductSearchAPIView(APIView):
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Products.objects.only(*ProductSearchSerializer.Meta.fields[:-1])
+        active = request.query_params.get('Active')
+        if active is not None:
+            queryset = queryset.filter(Active=active.lower() in ('true', '1'))
+
+        products = []
+        for product, match in search(query, limit=limit, queryset=queryset):
+            product.search_match = match
+            products.append(product)
+        return Response(ProductSearchSerializer(products, many=True).data)
+
+
+class CatalogCacheStatsAPIView(APIView):
+    def get(self, request, *args, **kwargs):
+        return Response(catalog_cache.stats())
+
 # Add Stock (Purchase) API
 
 
@@ -116,36 +326,26 @@ class AddStockAPIView(APIView):
             return Response({"error": "product_id, product_sku_id, and quantity are required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            quantity = float(quantity)
+            quantity = Decimal(str(quantity))
+            if not quantity.is_finite():
+                raise ValueError
             if quantity <= 0:
                 return Response({"error": "Quantity must be positive."}, status=status.HTTP_400_BAD_REQUEST)
-        except ValueError:
+        except (ValueError, InvalidOperation):
             return Response({"error": "Quantity must be a valid number."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            with transaction.atomic():
-                product_sku = ProductSKU.objects.select_for_update().get(
-                    id=product_sku_id, product__id=product_id)
-                product = product_sku.product
-
-                product_sku.stock = F('stock') + quantity
-                product_sku.save()
-                product_sku.refresh_from_db()
-
-                StockTransaction.objects.create(
-                    product=product,
-                    product_sku=product_sku,
-                    transaction_type='IN',
-                    quantity=quantity,
-                    current_stock=product_sku.stock
-                )
-                logger.info(
-                    f"Added {quantity} stock to ProductSKU '{product_sku.sku_code}' (ID: {product_sku.id}) for Product '{product.ProductName}'.")
+            moved = record_movement(product_id, product_sku_id, 'IN', quantity)
+            if moved is None:
+                raise ProductSKU.DoesNotExist
+            current_stock, sku_code = moved
+            logger.info(
+                f"Added {quantity} stock to ProductSKU '{sku_code}' (ID: {product_sku_id}) for Product ID {product_id}.")
 
-                return Response({
-                    "message": "Stock added successfully",
-                    "product_sku_current_stock": product_sku.stock,
-                }, status=status.HTTP_200_OK)
+            return Response({
+                "message": "Stock added successfully",
+                "product_sku_current_stock": current_stock,
+            }, status=status.HTTP_200_OK)
         except ProductSKU.DoesNotExist:
             logger.warning(
                 f"ProductSKU with ID {product_sku_id} or Product with ID {product_id} not found for stock addition.")
@@ -167,42 +367,35 @@ class RemoveStockAPIView(APIView):
             return Response({"error": "product_id, product_sku_id, and quantity are required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            quantity = float(quantity)
+            quantity = Decimal(str(quantity))
+            if not quantity.is_finite():
+                raise ValueError
             if quantity <= 0:
                 return Response({"error": "Quantity must be positive."}, status=status.HTTP_400_BAD_REQUEST)
-        except ValueError:
+        except (ValueError, InvalidOperation):
             return Response({"error": "Quantity must be a valid number."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            with transaction.atomic():
-                product_sku = ProductSKU.objects.select_for_update().get(
-                    id=product_sku_id, product__id=product_id)
-                product = product_sku.product
-
-                if product_sku.stock < quantity:
-                    logger.warning(
-                        f"Attempted to remove {quantity} from ProductSKU '{product_sku.sku_code}' (ID: {product_sku.id}) but only {product_sku.stock} available.")
-                    return Response({"error": "Not enough stock available."}, status=status.HTTP_400_BAD_REQUEST)
-
-                product_sku.stock = F('stock') - quantity
-                product_sku.save()
-                product_sku.refresh_from_db()
-
-                StockTransaction.objects.create(
-                    product=product,
-                    product_sku=product_sku,
-                    transaction_type='OUT',
-                    quantity=quantity,
-                    current_stock=product_sku.stock
-                )
-                logger.info(
-                    f"Removed {quantity} stock from ProductSKU '{product_sku.sku_code}' (ID: {product_sku.id}) for Product '{product.ProductName}'.")
+            moved = record_movement(product_id, product_sku_id, 'OUT', quantity)
+            if moved is None:
+                # Only the failure path pays for telling "missing" from "short"
+                available = ProductSKU.objects.filter(
+                    id=product_sku_id, product_id=product_id).values_list(
+                    F('stock') - F('reserved'), flat=True).first()
+                if available is None:
+                    raise ProductSKU.DoesNotExist
+                logger.warning(
+                    f"Attempted to remove {quantity} from ProductSKU (ID: {product_sku_id}) but only {available} available.")
+                return Response({"error": "Not enough stock available."}, status=status.HTTP_400_BAD_REQUEST)
+            current_stock, sku_code = moved
+            logger.info(
+                f"Removed {quantity} stock from ProductSKU '{sku_code}' (ID: {product_sku_id}) for Product ID {product_id}.")
 
-                return Response({
-                    "message": "Stock removed successfully",
-                    "product_sku_current_stock": product_sku.stock,
-                }, status=status.HTTP_200_OK)
-        except ProductSKU.DoesNotExist:
+            return Response({
+                "message": "Stock removed successfully",
+                "product_sku_current_stock": current_stock,
+            }, status=status.HTTP_200_OK)
+        except (ProductSKU.DoesNotExist, ValidationError):
             logger.warning(
                 f"ProductSKU with ID {product_sku_id} or Product with ID {product_id} not found for stock removal.")
             return Response({"error": "Product SKU not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -211,10 +404,275 @@ class RemoveStockAPIView(APIView):
             return Response({"error": "Internal server error.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Bulk Stock Movement API (mixed IN/OUT lines in one transaction)
+
+
+class BulkStockMovementAPIView(APIView):
+    """
+    Applies a list of IN/OUT movements in a single transaction.
+
+    Body: {"movements": [{"product_sku_id", "transaction_type", "quantity",
+    "product_id" (optional)}, ...], "atomic": true}
+
+    With "atomic" (the default) any invalid line rejects the whole batch.
+    With "atomic": false the valid lines are applied and the rest are
+    reported back in "errors".
+    """
+    max_movements = 1000
+
+    def post(self, request, *args, **kwargs):
+        movements = request.data.get('movements')
+        all_or_nothing = request.data.get('atomic', True) not in (False, 'false', 'False', 0, '0')
+
+        if not isinstance(movements, list) or not movements:
+            return Response({"error": "movements must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(movements) > self.max_movements:
+            return Response({"error": f"At most {self.max_movements} movements are allowed per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+        lines = []
+        for index, movement in enumerate(movements):
+            line, error = self.parse_movement(movement)
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                lines.append((index, line))
+
+        if errors and all_or_nothing:
+            return Response({"error": "Invalid movements.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                # Lock every SKU up front in primary key order so concurrent
+                # batches always acquire locks in the same sequence
+                sku_ids = sorted({str(line['product_sku_id']) for _, line in lines})
+                locked_skus = {
+                    str(sku.id): sku for sku in
+                    ProductSKU.objects.select_for_update().filter(id__in=sku_ids).order_by('id')
+                }
+
+                # Sharded SKUs are moved in memory like the others, see products.shards
+                sharded, product_deltas = fold_locked(locked_skus.values())
+                applied = []
+                stock_transactions = []
+                changed_skus = {sku.id: sku for sku in locked_skus.values() if sku.id in sharded}
+                for index, line in lines:
+                    product_sku = locked_skus.get(str(line['product_sku_id']))
+                    if product_sku is None or (
+                            line['product_id'] and str(product_sku.product_id) != str(line['product_id'])):
+                        errors.append({"index": index, "error": "Product SKU not found."})
+                        continue
+
+                    quantity = line['quantity']
+                    if line['transaction_type'] == 'OUT':
+                        if product_sku.available_stock < quantity:
+                            errors.append({"index": index, "error": "Not enough stock available.",
+                                           "available": product_sku.available_stock})
+                            continue
+                        quantity = -quantity
+
+                    product_sku.stock += quantity
+                    changed_skus[product_sku.id] = product_sku
+                    product_deltas[product_sku.product_id] = product_deltas.get(
+                        product_sku.product_id, 0) + quantity
+                    stock_transactions.append(StockTransaction(
+                        product_id=product_sku.product_id,
+                        product_sku=product_sku,
+                        transaction_type=line['transaction_type'],
+                        quantity=line['quantity'],
+                        current_stock=product_sku.stock
+                    ))
+                    applied.append({
+                        "index": index,
+                        "product_sku_id": product_sku.id,
+                        "transaction_type": line['transaction_type'],
+                        "quantity": line['quantity'],
+                        "product_sku_current_stock": product_sku.stock,
+                    })
+
+                if errors and all_or_nothing:
+                    transaction.set_rollback(True)
+                    return Response({"error": "Stock movements rejected.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+                ProductSKU.objects.bulk_update(changed_skus.values(), ['stock'], batch_size=500)
+                spread_locked(sharded, changed_skus.values())
+                StockTransaction.objects.bulk_create(stock_transactions, batch_size=500)
+                Products.adjust_total_stocks(product_deltas)
+
+            logger.info(
+                f"Bulk stock movement applied {len(applied)} line(s) across {len(changed_skus)} SKU(s), {len(errors)} rejected.")
+            return Response({
+                "message": "Stock movements applied successfully",
+                "applied": applied,
+                "errors": sorted(errors, key=lambda e: e['index']),
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error applying bulk stock movements: {e}", exc_info=True)
+            return Response({"error": "Internal server error.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def parse_movement(self, movement):
+        if not isinstance(movement, dict):
+            return None, "Each movement must be an object."
+        product_sku_id = movement.get('product_sku_id')
+        transaction_type = movement.get('transaction_type')
+        quantity = movement.get('quantity')
+
+        if not product_sku_id or quantity is None:
+            return None, "product_sku_id and quantity are required."
+        if transaction_type not in dict(StockTransaction.TRANSACTION_TYPES):
+            return None, "transaction_type must be IN or OUT."
+        try:
+            uuid.UUID(str(product_sku_id))
+            quantity = Decimal(str(quantity)).quantize(Decimal('0.01'))
+            if not quantity.is_finite():
+                raise ValueError
+        except (ValueError, InvalidOperation):
+            return None, "product_sku_id must be a UUID and quantity a valid number."
+        if quantity <= 0:
+            return None, "Quantity must be positive."
+        return {
+            'product_sku_id': product_sku_id,
+            'product_id': movement.get('product_id'),
+            'transaction_type': transaction_type,
+            'quantity': quantity,
+        }, None
+
+
+# Scan and Sell API (sales keyed by sku_code, one scan or a whole basket)
+
+
+class ScanSellAPIView(APIView):
+    """
+    Sells stock by SKU code, so terminals need no UUID lookups first.
+
+    Body: {"sku_code": "TSHIRT-RED-M", "quantity": 1} for a single scan
+    (quantity defaults to 1), or {"scans": [{"sku_code", "quantity"}, ...],
+    "atomic": true} for a basket. Every scan of a request is applied with one
+    locking SELECT, one UPDATE of the SKUs, one ledger INSERT and one UPDATE
+    of the product totals, whatever the basket size.
+    """
+    max_scans = 1000
+
+    def post(self, request, *args, **kwargs):
+        single = 'scans' not in request.data
+        scans = [request.data] if single else request.data.get('scans')
+        all_or_nothing = request.data.get('atomic', True) not in (False, 'false', 'False', 0, '0')
+
+        if not isinstance(scans, list) or not scans:
+            return Response({"error": "sku_code or a non-empty scans list is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(scans) > self.max_scans:
+            return Response({"error": f"At most {self.max_scans} scans are allowed per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+        lines = []
+        for index, scan in enumerate(scans):
+            line, error = self.parse_scan(scan)
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                lines.append((index, line))
+
+        if errors and (all_or_nothing or single):
+            return Response({"error": errors[0]["error"] if single else "Invalid scans.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                # Same lock order as BulkStockMovementAPIView: by primary key
+                locked_skus = {
+                    sku.sku_code: sku for sku in
+                    ProductSKU.objects.select_for_update().filter(
+                        sku_code__in={line['sku_code'] for _, line in lines}).order_by('id')
+                }
+
+                sharded, product_deltas = fold_locked(locked_skus.values())
+                applied = []
+                stock_transactions = []
+                changed_skus = {sku.id: sku for sku in locked_skus.values() if sku.id in sharded}
+                for index, line in lines:
+                    product_sku = locked_skus.get(line['sku_code'])
+                    if product_sku is None:
+                        errors.append({"index": index, "sku_code": line['sku_code'], "error": "Product SKU not found."})
+                        continue
+                    quantity = line['quantity']
+                    if product_sku.available_stock < quantity:
+                        errors.append({"index": index, "sku_code": line['sku_code'],
+                                       "error": "Not enough stock available.",
+                                       "available": product_sku.available_stock})
+                        continue
+
+                    product_sku.stock -= quantity
+                    changed_skus[product_sku.id] = product_sku
+                    product_deltas[product_sku.product_id] = product_deltas.get(
+                        product_sku.product_id, 0) - quantity
+                    stock_transactions.append(StockTransaction(
+                        product_id=product_sku.product_id,
+                        product_sku=product_sku,
+                        transaction_type='OUT',
+                        quantity=quantity,
+                        current_stock=product_sku.stock
+                    ))
+                    applied.append({
+                        "index": index,
+                        "sku_code": product_sku.sku_code,
+                        "product_sku_id": product_sku.id,
+                        "quantity": quantity,
+                        "product_sku_current_stock": product_sku.stock,
+                    })
+
+                if errors and (all_or_nothing or single):
+                    transaction.set_rollback(True)
+                    if single:
+                        error = errors[0]
+                        code = status.HTTP_404_NOT_FOUND if 'available' not in error else status.HTTP_400_BAD_REQUEST
+                        return Response({key: value for key, value in error.items() if key != 'index'}, status=code)
+                    return Response({"error": "Sale rejected.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+                ProductSKU.objects.bulk_update(changed_skus.values(), ['stock'], batch_size=500)
+                spread_locked(sharded, changed_skus.values())
+                StockTransaction.objects.bulk_create(stock_transactions, batch_size=500)
+                Products.adjust_total_stocks(product_deltas)
+
+            logger.info(
+                f"Scan sale applied {len(applied)} scan(s) across {len(changed_skus)} SKU(s), {len(errors)} rejected.")
+            if single:
+                sale = applied[0]
+                return Response({
+                    "message": "Stock removed successfully",
+                    "sku_code": sale["sku_code"],
+                    "product_sku_id": sale["product_sku_id"],
+                    "product_sku_current_stock": sale["product_sku_current_stock"],
+                }, status=status.HTTP_200_OK)
+            return Response({
+                "message": "Sale applied successfully",
+                "applied": applied,
+                "errors": sorted(errors, key=lambda e: e['index']),
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error applying scan sale: {e}", exc_info=True)
+            return Response({"error": "Internal server error.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def parse_scan(self, scan):
+        if not isinstance(scan, dict):
+            return None, "Each scan must be an object."
+        sku_code = scan.get('sku_code')
+        if not sku_code or not isinstance(sku_code, str):
+            return None, "sku_code is required."
+        try:
+            quantity = Decimal(str(scan.get('quantity', 1))).quantize(Decimal('0.01'))
+            if not quantity.is_finite():
+                raise ValueError
+        except (ValueError, InvalidOperation):
+            return None, "Quantity must be a valid number."
+        if quantity <= 0:
+            return None, "Quantity must be positive."
+        return {'sku_code': sku_code.strip(), 'quantity': quantity}, None
+
+
 # Stock Report API (List transactions with date filter)
 class StockReportAPIView(generics.ListAPIView):
     queryset = StockTransaction.objects.all().select_related('product', 'product_sku')
     serializer_class = StockTransactionSerializer
+    pagination_class = StockReportPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = {
         'transaction_date': ['gte', 'lte'],
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import StockTransaction
+from .models import StockTransaction, StockSnapshot, StockDailySummary, StockReservation
+from .reservations import delete_reservations
 # Ensure these are imported if used in admin.py
 from products.models import Products, ProductSKU
 
@@ -16,3 +17,42 @@ class StockTransactionAdmin(admin.ModelAdmin):
     readonly_fields = ('transaction_date', 'product', 'product_sku',
                        'transaction_type', 'quantity', 'current_stock')
     date_hierarchy = 'transaction_date'
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('snapshot_date', 'product', 'product_sku', 'closing_stock')
+    list_filter = ('snapshot_date',)
+    search_fields = ('product__ProductName', 'product_sku__sku_code')
+    readonly_fields = ('snapshot_date', 'product', 'product_sku', 'closing_stock')
+    date_hierarchy = 'snapshot_date'
+
+
+@admin.register(StockDailySummary)
+class StockDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ('day', 'product', 'product_sku', 'in_quantity',
+                    'out_quantity', 'transaction_count')
+    list_filter = ('day',)
+    search_fields = ('product__ProductName', 'product_sku__sku_code')
+    readonly_fields = ('day', 'product', 'product_sku', 'in_quantity',
+                       'out_quantity', 'transaction_count')
+    date_hierarchy = 'day'
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'product', 'product_sku', 'quantity',
+                    'status', 'expires_at', 'reference')
+    list_filter = ('status', 'created_at')
+    search_fields = ('reference', 'product__ProductName', 'product_sku__sku_code')
+    # Status changes go through stock.reservations, which keeps ProductSKU.reserved in step
+    readonly_fields = ('product', 'product_sku', 'quantity', 'status', 'reference',
+                       'created_at', 'expires_at', 'resolved_at')
+    date_hierarchy = 'created_at'
+
+    # Deleting a hold gives its stock back, like releasing it
+    def delete_model(self, request, obj):
+        delete_reservations(StockReservation.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_reservations(queryset)
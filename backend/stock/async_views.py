@@ -0,0 +1,105 @@
+"""
+Async stock report and stock change stream for ASGI deployments, see
+products.async_views.
+"""
+import asyncio
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.views import View
+from django_filters.filterset import filterset_factory
+from rest_framework import status
+
+from products.async_views import LimitOffsetWindow, filter_errors, json_response
+from .models import StockTransaction
+from .serializers import StockTransactionSerializer
+from .stream import LedgerBroker, format_event, parse_event_id, replay
+from .views import StockReportAPIView
+
+StockTransactionFilterSet = filterset_factory(
+    StockTransaction, fields=StockReportAPIView.filterset_fields)
+
+
+# Async Stock Report API (List transactions with date filter)
+
+
+class AsyncStockReportView(View):
+    """
+    ``?limit=&offset=`` pages of the stock report with the same filters as
+    the sync report. ``?count=false`` skips the COUNT(*) and works out
+    ``next`` from one extra row.
+    """
+    max_limit = 1000
+
+    async def get(self, request, *args, **kwargs):
+        filterset = StockTransactionFilterSet(
+            request.GET, queryset=StockTransaction.objects.select_related('product', 'product_sku'))
+        if not filterset.is_valid():
+            return filter_errors(filterset)
+        queryset = filterset.qs.order_by('-transaction_date', '-id')
+
+        window = LimitOffsetWindow(request, max_limit=self.max_limit)
+        if request.GET.get('count', '').lower() in ('false', '0'):
+            rows = [row async for row in queryset[window.offset:window.offset + window.limit + 1]]
+            serializer = StockTransactionSerializer(rows[:window.limit], many=True)
+            return window.response(serializer.data, has_next=len(rows) > window.limit)
+
+        count = await queryset.acount()
+        rows = [row async for row in window.slice(queryset)]
+        return window.response(StockTransactionSerializer(rows, many=True).data, count=count)
+
+
+# Stock Stream API (Server-Sent Events for every committed stock movement)
+
+
+class StockStreamView(View):
+    """
+    ``text/event-stream`` of {sku_id, stock, delta, txn_id} events, one per
+    ledger row, see stock.stream. Browsers resume with the Last-Event-ID
+    header on their own; ``?last_event_id=`` does the same for other clients.
+    """
+    heartbeat = 15
+    retry_ms = 3000
+
+    async def get(self, request, *args, **kwargs):
+        # A WSGI server would buffer the endless response instead of streaming it
+        if not isinstance(request, ASGIRequest):
+            return json_response({"error": "The stock stream needs an ASGI server."},
+                                 status=status.HTTP_501_NOT_IMPLEMENTED)
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        after = None
+        if last_event_id:
+            after = parse_event_id(last_event_id)
+            if after is None:
+                return json_response({"error": "Invalid Last-Event-ID."},
+                                     status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(self.events(after), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def events(self, after):
+        broker = LedgerBroker.get()
+        # Subscribe before replaying so nothing committed meanwhile is lost
+        queue = await broker.subscribe()
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            if after is not None:
+                async for event in replay(after):
+                    after = int(event['id'])
+                    yield format_event(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                # The live feed can repeat the end of the replay
+                if after is None or int(event['id']) > after:
+                    yield format_event(event)
+        finally:
+            broker.unsubscribe(queue)
@@ -0,0 +1,85 @@
+"""
+Streaming export of the stock report.
+
+Rows are read with ``values()`` in keyset batches on (transaction_date, id),
+newest first, and written out as they arrive, so memory stays flat whatever
+the row count and the response starts with the header straight away.
+Keyset batches are used rather than one long ``.iterator()`` because
+MySQL's client library buffers a whole result set in memory; each batch is
+an index range scan on stock_txn_date_id_idx.
+"""
+import csv
+import json
+
+from django.db.models import Q
+
+EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('transaction_date', 'transaction_date'),
+    ('product_id', 'product_id'),
+    ('product_name', 'product__ProductName'),
+    ('product_sku_id', 'product_sku_id'),
+    ('sku_code', 'product_sku__sku_code'),
+    ('product_sku_options', 'product_sku__options_label'),
+    ('transaction_type', 'transaction_type'),
+    ('quantity', 'quantity'),
+    ('current_stock', 'current_stock'),
+)
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def iter_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the report rows as dicts keyed by export column name."""
+    columns = [column for column, _ in EXPORT_FIELDS]
+    lookups = [lookup for _, lookup in EXPORT_FIELDS]
+    queryset = queryset.order_by('-transaction_date', '-id')
+    last = None
+    while True:
+        batch = queryset
+        if last is not None:
+            batch = batch.filter(
+                Q(transaction_date__lt=last[1]) |
+                Q(transaction_date=last[1], id__lt=last[0]))
+        rows = list(batch.values_list(*lookups)[:chunk_size])
+        for row in rows:
+            yield dict(zip(columns, row))
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+
+
+class Echo:
+    # csv.writer only needs an object with write(), the line is yielded instead
+    def write(self, value):
+        return value
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([column for column, _ in EXPORT_FIELDS])
+    for row in rows:
+        yield writer.writerow([format_value(value) for value in row.values()])
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps({column: format_value(value) if value is not None else None
+                          for column, value in row.items()}) + '\n'
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,129 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products.allocator import allocate_product_id
+from products.models import Products, ProductSKU
+from stock.models import StockTransaction
+
+BENCH_PRODUCT_CODE = '__BENCH_STOCK_REPORT__'
+
+# Markers each backend prints when EXPLAIN falls back to reading the whole table
+FULL_SCAN_MARKERS = {
+    'mysql': ("'type': 'ALL'", 'type: ALL', '| ALL |'),
+    'postgresql': ('Seq Scan on stock_stocktransaction',),
+    'sqlite': ('SCAN stock_stocktransaction',),
+}
+
+
+class Command(BaseCommand):
+    help = ("Seed a large StockTransaction table and print the query plan and timing "
+            "of every stock report filter combination.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000,
+                            help="Number of transactions to seed (default 2,000,000).")
+        parser.add_argument('--skus', type=int, default=200,
+                            help="Number of SKUs the transactions are spread over.")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the seeded rows instead of deleting them afterwards.")
+
+    def handle(self, *args, **options):
+        product, skus = self.seed(options['rows'], options['skus'], options['batch_size'])
+        try:
+            self.analyze()
+            full_scans = self.run_report_queries(product, skus)
+        finally:
+            if not options['keep']:
+                self.stdout.write("Removing seeded rows...")
+                StockTransaction.objects.filter(product=product).delete()
+                product.delete()
+
+        if full_scans:
+            self.stdout.write(self.style.ERROR(
+                f"{len(full_scans)} report queries still scan the full table: {', '.join(full_scans)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                "No stock report query falls back to a full table scan."))
+
+    def seed(self, rows, sku_count, batch_size):
+        existing = Products.objects.filter(ProductCode=BENCH_PRODUCT_CODE).first()
+        if existing:
+            self.stdout.write("Reusing previously seeded benchmark data.")
+            return existing, list(existing.productsku_set.all())
+
+        with transaction.atomic():
+            product = Products.objects.create(
+                ProductID=allocate_product_id(),
+                ProductCode=BENCH_PRODUCT_CODE, ProductName='Stock report benchmark')
+            skus = ProductSKU.objects.bulk_create([
+                ProductSKU(product=product, sku_code=f'{BENCH_PRODUCT_CODE}-{i}')
+                for i in range(sku_count)
+            ])
+
+        rng = random.Random(42)
+        now = timezone.now()
+        year_in_seconds = 365 * 24 * 3600
+        started = time.perf_counter()
+        for start in range(0, rows, batch_size):
+            batch = [
+                StockTransaction(
+                    product=product,
+                    product_sku=rng.choice(skus),
+                    transaction_type=rng.choice(('IN', 'OUT')),
+                    quantity=1,
+                    current_stock=0,
+                    transaction_date=now - timedelta(seconds=rng.randrange(year_in_seconds)),
+                )
+                for _ in range(min(batch_size, rows - start))
+            ]
+            with transaction.atomic():
+                StockTransaction.objects.bulk_create(batch)
+            self.stdout.write(f"\rSeeded {start + len(batch):,}/{rows:,} rows", ending='')
+        self.stdout.write(f"\nSeeding took {time.perf_counter() - started:.1f}s")
+        return product, skus
+
+    def analyze(self):
+        table = StockTransaction._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f"ANALYZE TABLE {table}")
+                cursor.fetchall()
+            elif connection.vendor in ('postgresql', 'sqlite'):
+                cursor.execute(f"ANALYZE {table}")
+
+    def report_queries(self, product, skus):
+        # Mirrors the StockReportAPIView filterset on a one-month window
+        now = timezone.now()
+        date_range = {'transaction_date__gte': now - timedelta(days=30),
+                      'transaction_date__lte': now}
+        base = StockTransaction.objects.order_by('-transaction_date')
+        return {
+            'date range': base.filter(**date_range),
+            'date range + product_sku': base.filter(product_sku__id=skus[0].id, **date_range),
+            'date range + product': base.filter(product__id=product.id, **date_range),
+            'date range + transaction_type': base.filter(transaction_type='OUT', **date_range),
+        }
+
+    def run_report_queries(self, product, skus):
+        markers = FULL_SCAN_MARKERS.get(connection.vendor, ())
+        full_scans = []
+        for label, queryset in self.report_queries(product, skus).items():
+            page = queryset[:20]
+            plan = page.explain()
+            started = time.perf_counter()
+            list(page)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            full_scan = any(marker in plan for marker in markers)
+            if full_scan:
+                full_scans.append(label)
+            status = self.style.ERROR('FULL SCAN') if full_scan else self.style.SUCCESS('index')
+            self.stdout.write(f"\n== {label}: {elapsed_ms:.2f} ms, {status}")
+            self.stdout.write(plan)
+        return full_scans
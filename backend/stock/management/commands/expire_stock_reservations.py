@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from stock.reservations import SWEEP_BATCH, expire_holds
+
+
+class Command(BaseCommand):
+    help = "Give the stock of every expired reservation back, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float,
+                            help="Keep running and sweep every this many seconds.")
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH,
+                            help="Reservations expired per transaction.")
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_holds(batch_size=options['batch_size'])
+            if options['every'] is None:
+                self.stdout.write(self.style.SUCCESS(f"Expired {expired} reservation(s)."))
+                return
+            connections.close_all()
+            time.sleep(options['every'])
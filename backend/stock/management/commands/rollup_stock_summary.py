@@ -0,0 +1,25 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from stock.summaries import closed_through, rebuild, roll_up
+
+
+class Command(BaseCommand):
+    help = ("Fold every ended day not rolled up yet into the daily stock summary. "
+            "Schedule it daily, shortly after midnight.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-from', help="Recompute the rollup from this day, YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        if options['rebuild_from']:
+            try:
+                rebuild(date.fromisoformat(options['rebuild_from']))
+            except ValueError:
+                raise CommandError("--rebuild-from must be YYYY-MM-DD.")
+
+        written = roll_up(timezone.localdate() - timedelta(days=1))
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} daily summary rows, rolled up through {closed_through()}."))
@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from stock.snapshots import take_snapshots
+
+
+class Command(BaseCommand):
+    help = ("Store each SKU's closing stock for a day (yesterday by default). "
+            "Schedule it daily, shortly after midnight.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Day to snapshot, YYYY-MM-DD (default: yesterday).")
+        parser.add_argument('--days', type=int, default=1,
+                            help="Also backfill this many days ending with --date (default 1).")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            try:
+                snapshot_date = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD.")
+        else:
+            snapshot_date = today - timedelta(days=1)
+        if snapshot_date >= today:
+            raise CommandError("Only days that have already ended can be snapshotted.")
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+
+        written = take_snapshots(snapshot_date, days=options['days'])
+        first_day = snapshot_date - timedelta(days=options['days'] - 1)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} closing stock rows for {first_day} to {snapshot_date}."))
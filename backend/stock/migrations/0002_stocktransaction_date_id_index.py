@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_products_totalstock'),
+        ('stock', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['-transaction_date', '-id'], name='stock_txn_date_id_idx'),
+        ),
+    ]
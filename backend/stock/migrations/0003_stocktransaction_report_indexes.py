@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_products_totalstock'),
+        ('stock', '0002_stocktransaction_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['product_sku', '-transaction_date'], name='stock_txn_sku_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['product', '-transaction_date'], name='stock_txn_product_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocktransaction',
+            index=models.Index(fields=['transaction_type', '-transaction_date'], name='stock_txn_type_date_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_productsku_options_label'),
+        ('stock', '0003_stocktransaction_report_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField()),
+                ('closing_stock', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.products')),
+                ('product_sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='products.productsku')),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Snapshots',
+                'ordering': ['-snapshot_date'],
+                'indexes': [models.Index(fields=['snapshot_date', 'product'], name='stock_snapshot_date_idx')],
+                'unique_together': {('product_sku', 'snapshot_date')},
+            },
+        ),
+    ]
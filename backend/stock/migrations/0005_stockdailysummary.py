@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_productsku_options_label'),
+        ('stock', '0004_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSummaryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('closed_through', models.DateField(blank=True, null=True)),
+                ('UpdatedDate', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Summary Rollup',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('in_quantity', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('out_quantity', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_daily_summaries', to='products.products')),
+                ('product_sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_daily_summaries', to='products.productsku')),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Daily Summaries',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day', 'product'], name='stock_summary_day_idx')],
+                'unique_together': {('product_sku', 'day')},
+            },
+        ),
+    ]
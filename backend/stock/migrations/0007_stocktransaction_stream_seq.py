@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:55
+
+from django.db import migrations, models
+
+
+def mark_existing_rows(apps, schema_editor):
+    # Rows already in the ledger are history, not changes to stream
+    StockTransaction = apps.get_model('stock', 'StockTransaction')
+    StockTransaction.objects.update(stream_seq=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0006_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockStreamSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_seq', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Stream Sequence',
+            },
+        ),
+        migrations.AddField(
+            model_name='stocktransaction',
+            name='stream_seq',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_existing_rows, migrations.RunPython.noop),
+    ]
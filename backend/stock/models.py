@@ -22,10 +22,146 @@ class StockTransaction(models.Model):
     transaction_date = models.DateTimeField(default=timezone.now)
     # Stock level after this transaction
     current_stock = models.DecimalField(max_digits=10, decimal_places=2)
+    # Position in the stock change feed, given once the row is committed (see
+    # stock.stream); rows from before the feed existed hold 0
+    stream_seq = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
 
     class Meta:
         verbose_name_plural = "Stock Transactions"
         ordering = ['-transaction_date']  # Order by most recent first
+        indexes = [
+            # Keyset pagination of the stock report walks (transaction_date, id)
+            models.Index(fields=['-transaction_date', '-id'],
+                         name='stock_txn_date_id_idx'),
+            # Report filters combined with a transaction_date range
+            models.Index(fields=['product_sku', '-transaction_date'],
+                         name='stock_txn_sku_date_idx'),
+            models.Index(fields=['product', '-transaction_date'],
+                         name='stock_txn_product_date_idx'),
+            models.Index(fields=['transaction_type', '-transaction_date'],
+                         name='stock_txn_type_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type} {self.quantity} for {self.product.ProductName} - SKU: {self.product_sku.sku_code}"
+
+
+class StockSnapshot(models.Model):
+    """Closing stock of a SKU at the end of ``snapshot_date``, see take_stock_snapshots."""
+    product = models.ForeignKey(
+        Products, on_delete=models.CASCADE, related_name='stock_snapshots')
+    product_sku = models.ForeignKey(
+        ProductSKU, on_delete=models.CASCADE, related_name='stock_snapshots')
+    snapshot_date = models.DateField()
+    closing_stock = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name_plural = "Stock Snapshots"
+        ordering = ['-snapshot_date']
+        unique_together = ('product_sku', 'snapshot_date',)
+        indexes = [
+            models.Index(fields=['snapshot_date', 'product'],
+                         name='stock_snapshot_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_sku.sku_code} on {self.snapshot_date}: {self.closing_stock}"
+
+
+class StockDailySummary(models.Model):
+    """IN/OUT totals of a SKU for one closed day, see stock.summaries."""
+    product = models.ForeignKey(
+        Products, on_delete=models.CASCADE, related_name='stock_daily_summaries')
+    product_sku = models.ForeignKey(
+        ProductSKU, on_delete=models.CASCADE, related_name='stock_daily_summaries')
+    day = models.DateField()
+    in_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    out_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Stock Daily Summaries"
+        ordering = ['-day']
+        unique_together = ('product_sku', 'day',)
+        indexes = [
+            models.Index(fields=['day', 'product'],
+                         name='stock_summary_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_sku.sku_code} on {self.day}: +{self.in_quantity} -{self.out_quantity}"
+
+
+class StockSummaryRollup(models.Model):
+    """Single row recording the last day folded into StockDailySummary."""
+    closed_through = models.DateField(null=True, blank=True)
+    UpdatedDate = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Stock Summary Rollup"
+
+    def __str__(self):
+        return f"Rolled up through {self.closed_through}"
+
+    @classmethod
+    def get(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+
+class StockStreamSequence(models.Model):
+    """Single row holding the last stream_seq given to a ledger row, see stock.stream."""
+    last_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Stock Stream Sequence"
+
+    def __str__(self):
+        return f"Sequenced through {self.last_seq}"
+
+    @classmethod
+    def get(cls):
+        return cls.objects.get_or_create(pk=1)[0]
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for a checkout until it is committed as a sale, released or
+    expires. Active holds are summed into ProductSKU.reserved, see
+    stock.reservations.
+    """
+    HELD = 'HELD'
+    COMMITTED = 'COMMITTED'
+    RELEASED = 'RELEASED'
+    EXPIRED = 'EXPIRED'
+    STATUS_CHOICES = (
+        (HELD, 'Held'),
+        (COMMITTED, 'Committed'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(
+        Products, on_delete=models.CASCADE, related_name='stock_reservations')
+    product_sku = models.ForeignKey(
+        ProductSKU, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    # Caller's own key for the hold, e.g. a cart or order id
+    reference = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+    # When the hold was committed, released or expired
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Stock Reservations"
+        ordering = ['-created_at']
+        indexes = [
+            # The expiry sweep reads the oldest expired holds
+            models.Index(fields=['status', 'expires_at'],
+                         name='stock_reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} {self.quantity} of {self.product_sku_id} until {self.expires_at}"
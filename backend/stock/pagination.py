@@ -0,0 +1,144 @@
+import base64
+import uuid
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StockReportPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination for the stock report with two opt-in fast paths:
+
+    * ``?pagination=cursor`` (or any ``?cursor=``) switches to keyset paging on
+      ``(transaction_date, id)``, newest first. Every page is an index range
+      scan, so deep pages cost the same as the first one and no COUNT(*) runs.
+    * ``?count=false`` keeps limit/offset but skips the COUNT(*); ``next`` is
+      worked out by fetching one extra row.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    max_limit = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.mode = 'offset'
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.cursor_query_param in request.query_params):
+            self.mode = 'cursor'
+            return self.paginate_keyset(queryset, request)
+        if request.query_params.get(self.count_query_param, '').lower() in ('false', '0'):
+            self.mode = 'nocount'
+            return self.paginate_without_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    # Offset paging without COUNT(*)
+
+    def paginate_without_count(self, queryset, request):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = None
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    # Keyset paging
+
+    def encode_cursor(self, obj, reverse):
+        raw = f"{'p' if reverse else 'n'}|{obj.transaction_date.isoformat()}|{obj.pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, date_str, pk = base64.urlsafe_b64decode(
+                encoded.encode('ascii')).decode('ascii').split('|')
+            transaction_date = parse_datetime(date_str)
+            pk = uuid.UUID(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p') or transaction_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'p', transaction_date, pk
+
+    def paginate_keyset(self, queryset, request):
+        self.limit = self.get_limit(request) or self.default_limit
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[0])
+
+        if cursor:
+            _, transaction_date, pk = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(transaction_date__gt=transaction_date) |
+                    Q(transaction_date=transaction_date, id__gt=pk))
+            else:
+                queryset = queryset.filter(
+                    Q(transaction_date__lt=transaction_date) |
+                    Q(transaction_date=transaction_date, id__lt=pk))
+
+        ordering = ('transaction_date', 'id') if reverse else (
+            '-transaction_date', '-id')
+        rows = list(queryset.order_by(*ordering)[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if reverse:
+            rows.reverse()
+
+        # Walking backwards we came from a later page, and forwards from an earlier one
+        self.has_next = True if reverse else has_more
+        self.has_previous = has_more if reverse else bool(cursor)
+        self.page_rows = rows
+        return rows
+
+    def get_cursor_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(obj, reverse))
+
+    # Links and response
+
+    def get_next_link(self):
+        if self.mode == 'cursor':
+            if not self.has_next or not self.page_rows:
+                return None
+            return self.get_cursor_link(self.page_rows[-1], reverse=False)
+        if self.mode == 'nocount':
+            if not self.has_next:
+                return None
+            url = self.request.build_absolute_uri()
+            url = replace_query_param(url, self.limit_query_param, self.limit)
+            return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.mode == 'cursor':
+            if not self.has_previous or not self.page_rows:
+                return None
+            return self.get_cursor_link(self.page_rows[0], reverse=True)
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if self.mode == 'offset':
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['required'] = ['results']
+        return response_schema
@@ -0,0 +1,172 @@
+"""
+Stock reservations for checkouts.
+
+hold() sets stock aside for a cart without keeping anything locked past its
+own short transaction: one conditional UPDATE adds the quantity to
+ProductSKU.reserved when stock - reserved covers it. The available stock of
+a SKU is therefore a column read, never a sum over its holds, and sales
+(ProductSKU.move_stock and the batch endpoints) only take stock - reserved.
+
+commit() turns a hold into a sale: stock and reserved drop together and the
+ledger row is written. release() gives the stock back. Holds left past their
+expires_at are given back by expire_holds(), which ends a whole batch of
+holds with one statement per table instead of one transaction per hold, see
+the expire_stock_reservations command.
+
+A sharded SKU (products.shards) keeps its available stock in its shards, so
+a hold takes the quantity out of a shard and giving it back adds it to one.
+"""
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from products.cache import invalidate_products
+from products.models import Products, ProductSKU, StockShard
+from .models import StockReservation, StockTransaction
+
+DEFAULT_TTL = timedelta(minutes=15)
+MAX_TTL = timedelta(hours=24)
+# Holds expired per transaction by expire_holds
+SWEEP_BATCH = 1000
+
+STOCK_FIELD = models.DecimalField(max_digits=10, decimal_places=2)
+
+
+def hold(product_sku_id, quantity, ttl=DEFAULT_TTL, product_id=None, reference=''):
+    """
+    Reserves ``quantity`` of a SKU for ``ttl``. Returns the StockReservation,
+    or None when no SKU matched or it has less than ``quantity`` available.
+    """
+    with transaction.atomic():
+        skus = ProductSKU.objects.filter(id=product_sku_id)
+        if product_id is not None:
+            skus = skus.filter(product_id=product_id)
+        if not skus.filter(shard_count=0, stock__gte=F('reserved') + quantity).update(
+                reserved=F('reserved') + quantity):
+            # The SKU row is locked before its shards, in the order products.shards uses
+            if not skus.filter(shard_count__gt=0).update(reserved=F('reserved') + quantity):
+                return None
+            moved = StockShard.move(product_sku_id, -quantity)
+            if moved is None or moved is StockShard.NOT_SHARDED:
+                transaction.set_rollback(True)
+                return None
+
+        if product_id is None:
+            product_id = skus.values_list('product_id', flat=True).get()
+        invalidate_products([product_id])
+        now = timezone.now()
+        return StockReservation.objects.create(
+            product_id=product_id,
+            product_sku_id=product_sku_id,
+            quantity=quantity,
+            reference=reference,
+            created_at=now,
+            expires_at=now + ttl,
+        )
+
+
+def commit(reservation_id):
+    """
+    Sells the stock of a hold that has not expired. Returns (reservation,
+    current_stock), or None when it is no longer held.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not StockReservation.objects.filter(
+                id=reservation_id, status=StockReservation.HELD, expires_at__gt=now).update(
+                status=StockReservation.COMMITTED, resolved_at=now):
+            return None
+        reservation = StockReservation.objects.get(id=reservation_id)
+        quantity = reservation.quantity
+
+        skus = ProductSKU.objects.filter(id=reservation.product_sku_id)
+        # The held units of a sharded SKU already left its shards, its stock
+        # and TotalStock catch up when the shards are folded
+        skus.update(reserved=F('reserved') - quantity, stock=Case(
+            When(shard_count=0, then=F('stock') - quantity), default=F('stock'),
+            output_field=STOCK_FIELD))
+        shard_count, current_stock = skus.annotate(live=ProductSKU.live_stock()).values_list(
+            'shard_count', 'live').get()
+        if shard_count:
+            invalidate_products([reservation.product_id])
+        else:
+            Products.adjust_total_stocks({reservation.product_id: -quantity})
+
+        StockTransaction.objects.create(
+            product_id=reservation.product_id,
+            product_sku_id=reservation.product_sku_id,
+            transaction_type='OUT',
+            quantity=quantity,
+            current_stock=current_stock
+        )
+    return reservation, current_stock
+
+
+def release(reservation_id):
+    """Gives the stock of a hold back. Returns the reservation, or None when it is no longer held."""
+    with transaction.atomic():
+        if not StockReservation.objects.filter(
+                id=reservation_id, status=StockReservation.HELD).update(
+                status=StockReservation.RELEASED, resolved_at=timezone.now()):
+            return None
+        reservation = StockReservation.objects.get(id=reservation_id)
+        give_back({reservation.product_sku_id: reservation.quantity})
+    return reservation
+
+
+def delete_reservations(queryset):
+    """Deletes the reservations of ``queryset``, giving back the stock of those still held."""
+    with transaction.atomic():
+        held = queryset.select_for_update().filter(status=StockReservation.HELD)
+        quantities = {}
+        for sku_id, quantity in held.values_list('product_sku_id', 'quantity'):
+            quantities[sku_id] = quantities.get(sku_id, 0) + quantity
+        if quantities:
+            give_back(quantities)
+        queryset.delete()
+
+
+def give_back(quantities):
+    """Returns {sku_id: quantity} of ended holds to the available stock, call inside their transaction."""
+    # SKU rows in primary key order, like the batch stock endpoints
+    skus = list(ProductSKU.objects.select_for_update().filter(
+        id__in=quantities).order_by('id').values_list('id', 'product_id', 'shard_count'))
+    if len(quantities) == 1:
+        [(sku_id, quantity)] = quantities.items()
+        ProductSKU.objects.filter(id=sku_id).update(reserved=F('reserved') - quantity)
+    else:
+        ProductSKU.objects.filter(id__in=quantities).update(reserved=F('reserved') - Case(
+            *[When(id=sku_id, then=Value(quantity)) for sku_id, quantity in quantities.items()],
+            output_field=STOCK_FIELD))
+    for sku_id, _, shard_count in skus:
+        if shard_count:
+            StockShard.move(sku_id, quantities[sku_id])
+    invalidate_products({product_id for _, product_id, _ in skus})
+
+
+def expire_holds(batch_size=SWEEP_BATCH):
+    """
+    Gives back every hold past its expires_at, ``batch_size`` holds per
+    transaction. Returns the number of holds expired.
+    """
+    now = timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            # Holds being committed or released right now are skipped, not waited for
+            held = list(StockReservation.objects.select_for_update(skip_locked=True).filter(
+                status=StockReservation.HELD, expires_at__lte=now).order_by(
+                'expires_at').values_list('id', 'product_sku_id', 'quantity')[:batch_size])
+            if not held:
+                return expired
+            StockReservation.objects.filter(id__in=[pk for pk, _, _ in held]).update(
+                status=StockReservation.EXPIRED, resolved_at=now)
+            quantities = {}
+            for _, sku_id, quantity in held:
+                quantities[sku_id] = quantities.get(sku_id, 0) + quantity
+            give_back(quantities)
+        expired += len(held)
+        if len(held) < batch_size:
+            return expired
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import StockTransaction
+from .models import StockReservation, StockTransaction
 from products.models import Products, ProductSKU, Variant, SubVariant  # Import new models
 
 
@@ -10,8 +10,9 @@ class StockTransactionSerializer(serializers.ModelSerializer):
     # Display SKU code
     sku_code = serializers.CharField(
         source='product_sku.sku_code', read_only=True)
-    # Display combined options for the SKU
-    product_sku_options = serializers.SerializerMethodField()
+    # Display combined options for the SKU, e.g. "Red, S"
+    product_sku_options = serializers.CharField(
+        source='product_sku.options_label', read_only=True)
 
     class Meta:
         model = StockTransaction
@@ -22,6 +23,61 @@ class StockTransactionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'product_name', 'sku_code',
                             'product_sku_options', 'transaction_date', 'current_stock']
 
-    def get_product_sku_options(self, obj):
-        # Get the options associated with the ProductSKU, e.g., "Red, S"
-        return ", ".join([sv.option for sv in obj.product_sku.sub_variants.all().order_by('variant__name', 'option')])
+
+class StockLevelSerializer(serializers.ModelSerializer):
+    # Stock of a SKU at a point in time, the level comes from the view context
+    product_sku_id = serializers.UUIDField(source='id', read_only=True)
+    product_id = serializers.UUIDField(read_only=True)
+    product_name = serializers.CharField(
+        source='product.ProductName', read_only=True)
+    product_sku_options = serializers.CharField(
+        source='options_label', read_only=True)
+    stock = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductSKU
+        fields = ['product_sku_id', 'sku_code', 'product_id', 'product_name',
+                  'product_sku_options', 'stock']
+
+    def get_stock(self, obj):
+        return self.context['stock_levels'].get(obj.id)
+
+
+class StockSummarySerializer(serializers.Serializer):
+    # One row of stock.summaries.summarize, names are looked up by the view
+    period = serializers.DateField()
+    product_id = serializers.UUIDField()
+    product_name = serializers.SerializerMethodField()
+    product_sku_id = serializers.UUIDField(required=False)
+    sku_code = serializers.SerializerMethodField()
+    in_quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    out_quantity = serializers.DecimalField(max_digits=14, decimal_places=2)
+    net_change = serializers.DecimalField(max_digits=14, decimal_places=2)
+    transaction_count = serializers.IntegerField()
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'product_sku_id' not in instance:
+            # Grouped by product
+            data.pop('product_sku_id', None)
+            data.pop('sku_code', None)
+        return data
+
+    def get_product_name(self, obj):
+        return self.context['product_names'].get(obj['product_id'])
+
+    def get_sku_code(self, obj):
+        return self.context['sku_codes'].get(obj.get('product_sku_id'))
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    product_id = serializers.UUIDField(read_only=True)
+    product_sku_id = serializers.UUIDField(read_only=True)
+    sku_code = serializers.CharField(
+        source='product_sku.sku_code', read_only=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'product_id', 'product_sku_id', 'sku_code', 'quantity', 'status',
+                  'reference', 'created_at', 'expires_at', 'resolved_at']
+        read_only_fields = fields
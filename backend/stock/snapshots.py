@@ -0,0 +1,102 @@
+"""
+Point-in-time stock levels.
+
+Working out "stock on date X" from the ledger alone means finding the last
+StockTransaction before X for every SKU. Instead take_stock_snapshots stores
+each SKU's closing stock once a day, and a point-in-time level is the nearest
+snapshot at or before X plus the (at most a day or so of) transactions between
+that snapshot and X.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, F, Max, Sum, When
+from django.utils import timezone
+
+from products.models import ProductSKU
+from .models import StockSnapshot, StockTransaction
+
+NET_QUANTITY = Sum(Case(
+    When(transaction_type='IN', then=F('quantity')),
+    default=F('quantity') * -1,
+    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+))
+
+
+def end_of_day(day):
+    """First instant after ``day`` in the project time zone."""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def net_movements(after, until=None, sku_ids=None):
+    """{sku_id: IN minus OUT} for transactions at or after ``after`` and before ``until``, either bound optional."""
+    transactions = StockTransaction.objects.order_by()
+    if after is not None:
+        transactions = transactions.filter(transaction_date__gte=after)
+    if until is not None:
+        transactions = transactions.filter(transaction_date__lt=until)
+    if sku_ids is not None:
+        transactions = transactions.filter(product_sku_id__in=sku_ids)
+    return dict(transactions.values('product_sku_id').annotate(
+        net=NET_QUANTITY).values_list('product_sku_id', 'net'))
+
+
+def take_snapshots(snapshot_date, days=1, batch_size=1000):
+    """
+    Stores closing stock for ``days`` days ending with ``snapshot_date``.
+
+    Closing stock is rolled back from the live stock of each SKU one day at a
+    time, so each day costs one grouped aggregate over that day's
+    transactions. Returns the number of rows written.
+    """
+    skus = list(ProductSKU.objects.annotate(live=ProductSKU.live_stock()).values_list(
+        'id', 'product_id', 'live'))
+    closing = {sku_id: stock for sku_id, _, stock in skus}
+    products = {sku_id: product_id for sku_id, product_id, _ in skus}
+
+    # Roll live stock back to the end of the newest requested day
+    for sku_id, net in net_movements(end_of_day(snapshot_date)).items():
+        if sku_id in closing:
+            closing[sku_id] -= net
+
+    written = 0
+    day = snapshot_date
+    for _ in range(days):
+        with transaction.atomic():
+            StockSnapshot.objects.filter(snapshot_date=day).delete()
+            StockSnapshot.objects.bulk_create([
+                StockSnapshot(product_id=products[sku_id], product_sku_id=sku_id,
+                              snapshot_date=day, closing_stock=stock)
+                for sku_id, stock in closing.items()
+            ], batch_size=batch_size)
+        written += len(closing)
+
+        # Closing stock of the previous day is this day's closing minus its movements
+        for sku_id, net in net_movements(end_of_day(day - timedelta(days=1)), end_of_day(day)).items():
+            if sku_id in closing:
+                closing[sku_id] -= net
+        day -= timedelta(days=1)
+    return written
+
+
+def stock_levels_at(instant, sku_ids):
+    """{sku_id: stock} just before ``instant`` for the given SKUs."""
+    sku_ids = list(sku_ids)
+    levels = {sku_id: Decimal('0.00') for sku_id in sku_ids}
+
+    # A snapshot is usable once its whole day lies before the instant
+    snapshot_date = StockSnapshot.objects.filter(
+        snapshot_date__lt=timezone.localdate(instant)).aggregate(
+        latest=Max('snapshot_date'))['latest']
+    if snapshot_date is None:
+        # No snapshot yet: replay the ledger up to the instant
+        levels.update(net_movements(None, instant, sku_ids))
+        return levels
+
+    levels.update(StockSnapshot.objects.filter(
+        snapshot_date=snapshot_date, product_sku_id__in=sku_ids).values_list(
+        'product_sku_id', 'closing_stock'))
+    for sku_id, net in net_movements(end_of_day(snapshot_date), instant, sku_ids).items():
+        levels[sku_id] += net
+    return levels
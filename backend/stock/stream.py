@@ -0,0 +1,185 @@
+"""
+Real-time stock change feed.
+
+One LedgerBroker per event loop tails StockTransaction and fans every new
+row out to the subscribed streams, so open dashboards cost a single ledger
+query per poll instead of one catalog download each.
+
+Rows are stamped with transaction_date when they are inserted, not when
+their transaction commits, so the ledger cannot be followed by date: a long
+basket or import chunk commits rows dated behind ones already published.
+sequence() therefore numbers rows in the order they become visible, holding
+the StockStreamSequence row until its numbers are committed, and the feed
+follows stream_seq. Every number below the last one read is committed, so
+nothing is skipped however late a transaction commits, and each poll only
+reads the rows it has not seen.
+
+The event id of a row is its stream_seq. A client that reconnects with
+Last-Event-ID is first replayed the rows after it from the ledger (see
+replay), then follows the live feed.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+
+from .models import StockStreamSequence, StockTransaction
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5
+# Events buffered for a subscriber that reads too slowly before it is dropped,
+# its client reconnects and catches up from the ledger
+QUEUE_SIZE = 1000
+REPLAY_BATCH = 500
+SEQUENCE_BATCH = 1000
+EVENT_FIELDS = ('stream_seq', 'id', 'product_sku_id', 'transaction_type',
+                'quantity', 'current_stock')
+
+
+def sequence(batch_size=SEQUENCE_BATCH):
+    """
+    Gives a stream_seq to every committed ledger row without one, oldest
+    first. Returns the last stream_seq given out.
+    """
+    pending = StockTransaction.objects.filter(stream_seq__isnull=True)
+    if not pending.exists():
+        return StockStreamSequence.get().last_seq
+    StockStreamSequence.get()
+    while True:
+        with transaction.atomic():
+            # Held until the numbers commit, so they become visible in order
+            counter = StockStreamSequence.objects.select_for_update().get(pk=1)
+            ids = list(pending.order_by('transaction_date', 'id').values_list(
+                'id', flat=True)[:batch_size])
+            if ids:
+                StockTransaction.objects.filter(id__in=ids).update(stream_seq=Case(
+                    *[When(id=pk, then=Value(counter.last_seq + n)) for n, pk in enumerate(ids, 1)],
+                    output_field=models.BigIntegerField()))
+                counter.last_seq += len(ids)
+                counter.save(update_fields=['last_seq'])
+        if len(ids) < batch_size:
+            return counter.last_seq
+
+
+def parse_event_id(value):
+    """stream_seq of an event id, or None when it is not one."""
+    try:
+        seq = int(value)
+    except (TypeError, ValueError):
+        return None
+    return seq if seq >= 0 else None
+
+
+def make_event(row):
+    seq, pk, sku_id, transaction_type, quantity, current_stock = row
+    delta = quantity if transaction_type == 'IN' else -quantity
+    return {
+        'id': str(seq),
+        'txn_id': str(pk),
+        'sku_id': str(sku_id),
+        'stock': str(current_stock),
+        'delta': str(delta),
+    }
+
+
+def format_event(event):
+    # The SSE frame: the id resumes the stream, the data is the compact change
+    data = {key: value for key, value in event.items() if key != 'id'}
+    return f"id: {event['id']}\nevent: stock\ndata: {json.dumps(data)}\n\n"
+
+
+async def replay(after):
+    """Yields the events of every sequenced row after stream_seq ``after``, oldest first."""
+    queryset = StockTransaction.objects.order_by('stream_seq')
+    while True:
+        rows = [row async for row in queryset.filter(
+            stream_seq__gt=after).values_list(*EVENT_FIELDS)[:REPLAY_BATCH]]
+        for row in rows:
+            yield make_event(row)
+        if len(rows) < REPLAY_BATCH:
+            return
+        after = rows[-1][0]
+
+
+class LedgerBroker:
+    _brokers = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get(cls):
+        """The broker of the running event loop."""
+        loop = asyncio.get_running_loop()
+        broker = cls._brokers.get(loop)
+        if broker is None:
+            broker = cls._brokers[loop] = cls()
+        return broker
+
+    def __init__(self):
+        self.subscribers = set()
+        self.task = None
+        self.ready = asyncio.Event()
+        self.wakeup = asyncio.Event()
+
+    async def subscribe(self):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.ready = asyncio.Event()
+            self.task = asyncio.create_task(self.tail())
+        # Rows committed from here on reach the queue once the tail has its start
+        try:
+            await self.ready.wait()
+        except asyncio.CancelledError:
+            self.subscribers.discard(queue)
+            raise
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        self.wakeup.set()
+
+    def publish(self, event):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # The stream fell behind, its client resumes from the ledger
+                self.publish_end(queue)
+
+    def publish_end(self, queue):
+        # None tells the stream to end
+        self.subscribers.discard(queue)
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def tail(self):
+        try:
+            await self.follow()
+        except Exception as e:
+            # End every stream, the clients reconnect and resume from the ledger
+            logger.error(f"Stock stream ledger tail failed: {e}", exc_info=True)
+            for queue in list(self.subscribers):
+                self.publish_end(queue)
+        finally:
+            self.ready.set()
+            self.task = None
+
+    async def follow(self):
+        # Rows already in the ledger when the tail starts are not news
+        last = await sync_to_async(sequence)()
+        self.ready.set()
+        while self.subscribers:
+            if await sync_to_async(sequence)() > last:
+                async for event in replay(last):
+                    self.publish(event)
+                    last = int(event['id'])
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,140 @@
+"""
+Stock movement summaries.
+
+IN/OUT totals per product or SKU and per day, week or month. Days that have
+ended are folded once into StockDailySummary by rollup_stock_summary, so a
+summary over history reads one row per SKU and day instead of every
+transaction. Only the days after the last rollup are aggregated from
+StockTransaction on each request.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
+
+from .models import StockDailySummary, StockSummaryRollup, StockTransaction
+from .snapshots import end_of_day
+
+PERIODS = ('day', 'week', 'month')
+GROUPS = {
+    'product': ('product_id',),
+    'sku': ('product_id', 'product_sku_id'),
+}
+TOTALS = ('in_quantity', 'out_quantity', 'transaction_count')
+
+
+def _quantity(transaction_type):
+    return Coalesce(
+        Sum('quantity', filter=Q(transaction_type=transaction_type)),
+        Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2))
+
+
+def transaction_totals(transactions, period, group):
+    return transactions.order_by().annotate(
+        period=Trunc('transaction_date', period, output_field=models.DateField()),
+    ).values('period', *group).annotate(
+        in_quantity=_quantity('IN'),
+        out_quantity=_quantity('OUT'),
+        transaction_count=Count('id'),
+    )
+
+
+def closed_through():
+    """Last day already in StockDailySummary, or None."""
+    return StockSummaryRollup.objects.filter(pk=1).values_list(
+        'closed_through', flat=True).first()
+
+
+def roll_up(through=None, batch_size=1000):
+    """
+    Folds every day after the last rollup up to ``through`` (default
+    yesterday) into StockDailySummary. Returns the number of rows written.
+    """
+    through = through or timezone.localdate() - timedelta(days=1)
+    StockSummaryRollup.get()
+    with transaction.atomic():
+        # Serializes concurrent rollups, the second one finds nothing left to do
+        rollup = StockSummaryRollup.objects.select_for_update().get(pk=1)
+        if rollup.closed_through is not None and rollup.closed_through >= through:
+            return 0
+
+        transactions = StockTransaction.objects.filter(transaction_date__lt=end_of_day(through))
+        if rollup.closed_through is not None:
+            transactions = transactions.filter(
+                transaction_date__gte=end_of_day(rollup.closed_through))
+        rows = [
+            StockDailySummary(
+                product_id=row['product_id'], product_sku_id=row['product_sku_id'],
+                day=row['period'], in_quantity=row['in_quantity'],
+                out_quantity=row['out_quantity'], transaction_count=row['transaction_count'])
+            for row in transaction_totals(transactions, 'day', GROUPS['sku']).iterator()
+        ]
+        StockDailySummary.objects.bulk_create(rows, batch_size=batch_size)
+
+        rollup.closed_through = through
+        rollup.save(update_fields=['closed_through', 'UpdatedDate'])
+    return len(rows)
+
+
+def rebuild(since):
+    """Drops the rollup from ``since`` onwards so the next roll_up recomputes it."""
+    with transaction.atomic():
+        StockDailySummary.objects.filter(day__gte=since).delete()
+        StockSummaryRollup.objects.filter(pk=1, closed_through__gte=since).update(
+            closed_through=since - timedelta(days=1))
+
+
+def summarize(period='day', group_by='sku', start=None, end=None, filters=None):
+    """
+    List of {period, product_id[, product_sku_id], in_quantity, out_quantity,
+    net_change, transaction_count}, newest period first. ``start`` and ``end``
+    are inclusive dates, ``filters`` holds product_id / product_sku_id.
+    """
+    group = GROUPS[group_by]
+    filters = filters or {}
+    rolled_up = closed_through()
+    totals = {}
+
+    def add(rows):
+        for row in rows:
+            key = (row['period'],) + tuple(row[field] for field in group)
+            entry = totals.setdefault(key, dict(
+                {field: row[field] for field in ('period',) + group},
+                in_quantity=Decimal('0.00'), out_quantity=Decimal('0.00'), transaction_count=0))
+            for field in TOTALS:
+                entry[field] += row[field]
+
+    if rolled_up is not None and (start is None or start <= rolled_up):
+        daily = StockDailySummary.objects.filter(day__lte=rolled_up, **filters)
+        if start is not None:
+            daily = daily.filter(day__gte=start)
+        if end is not None:
+            daily = daily.filter(day__lte=end)
+        add(daily.order_by().annotate(period=Trunc('day', period)).values(
+            'period', *group).annotate(
+            in_quantity=Sum('in_quantity'),
+            out_quantity=Sum('out_quantity'),
+            transaction_count=Sum('transaction_count'),
+        ))
+
+    if end is None or rolled_up is None or end > rolled_up:
+        transactions = StockTransaction.objects.filter(**filters)
+        if rolled_up is not None:
+            transactions = transactions.filter(transaction_date__gte=end_of_day(rolled_up))
+        if start is not None:
+            transactions = transactions.filter(
+                transaction_date__gte=end_of_day(start - timedelta(days=1)))
+        if end is not None:
+            transactions = transactions.filter(transaction_date__lt=end_of_day(end))
+        add(transaction_totals(transactions, period, group))
+
+    results = sorted(totals.values(), key=lambda entry: tuple(
+        str(entry[field]) for field in group))
+    results.sort(key=lambda entry: entry['period'], reverse=True)
+    for entry in results:
+        entry['net_change'] = entry['in_quantity'] - entry['out_quantity']
+    return results
@@ -1,3 +1,494 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+from datetime import date, timedelta
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from products.models import Products, ProductSKU
+from products.shards import rebalance, reshard
+from .admin import StockReservationAdmin
+from .async_views import StockStreamView
+from .export import iter_rows
+from .models import StockDailySummary, StockReservation, StockSnapshot, StockTransaction
+from .reservations import expire_holds
+from .snapshots import end_of_day
+from .stream import LedgerBroker, parse_event_id, sequence
+from .summaries import rebuild, roll_up
+
+
+class StockReportTestCase(APITestCase):
+    def setUp(self):
+        self.product = Products.objects.create(
+            ProductID=1, ProductCode='RPT', ProductName='Report Product')
+        self.sku = ProductSKU.objects.create(
+            product=self.product, sku_code='RPT-1')
+        now = timezone.now()
+        # Pairs of rows share a timestamp so the id tie-breaker is exercised
+        StockTransaction.objects.bulk_create([
+            StockTransaction(
+                product=self.product, product_sku=self.sku, transaction_type='IN',
+                quantity=1, current_stock=i, transaction_date=now - timedelta(minutes=i // 2))
+            for i in range(25)
+        ])
+
+
+class StockReportPaginationTests(StockReportTestCase):
+    def walk(self, url, key='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data[key]
+        return ids
+
+    def test_cursor_walks_every_row_once_in_order(self):
+        ids = self.walk('/api/stock/report/?pagination=cursor&limit=4')
+        expected = [str(pk) for pk in StockTransaction.objects.order_by(
+            '-transaction_date', '-id').values_list('id', flat=True)]
+        self.assertEqual(ids, expected)
+
+    def test_cursor_previous_link_returns_the_earlier_page(self):
+        first = self.client.get('/api/stock/report/?pagination=cursor&limit=5')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(first.data['previous'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/stock/report/?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+        tampered = base64.urlsafe_b64encode(f'n|{timezone.now().isoformat()}|1 OR 1'.encode()).decode()
+        response = self.client.get(f'/api/stock/report/?cursor={tampered}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_offset_paging_without_count(self):
+        ids = self.walk('/api/stock/report/?count=false&limit=10')
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_default_paging_still_counts(self):
+        response = self.client.get('/api/stock/report/')
+        self.assertEqual(response.data['count'], 25)
+
+
+class StockReportQueryTests(StockReportTestCase):
+    def test_rows_cost_no_per_row_queries(self):
+        def report_queries(limit):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/stock/report/', {'limit': limit})
+            self.assertEqual(len(response.data['results']), limit)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(report_queries(2), report_queries(25))
+
+
+class StockReportConditionalGetTests(StockReportTestCase):
+    def test_unchanged_report_answers_304(self):
+        response = self.client.get('/api/stock/report/')
+        etag = response['ETag']
+        # Only the lookup of the newest matching transaction runs
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stock/report/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_transaction_changes_the_etag(self):
+        etag = self.client.get('/api/stock/report/')['ETag']
+        StockTransaction.objects.create(
+            product=self.product, product_sku=self.sku, transaction_type='OUT',
+            quantity=1, current_stock=0)
+        response = self.client.get('/api/stock/report/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 26)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/api/stock/report/')['Last-Modified']
+        response = self.client.get('/api/stock/report/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class StockReportExportTests(StockReportTestCase):
+    def export(self, export, **params):
+        response = self.client.get('/api/stock/report/', {'export': export, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_has_every_row_newest_first(self):
+        lines = self.export('csv').splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'transaction_date'])
+        expected = [str(pk) for pk in StockTransaction.objects.order_by(
+            '-transaction_date', '-id').values_list('id', flat=True)]
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], expected)
+
+    def test_export_reads_in_batches(self):
+        with CaptureQueriesContext(connection) as ctx:
+            rows = list(iter_rows(StockTransaction.objects.all(), chunk_size=10))
+        self.assertEqual(len({row['id'] for row in rows}), 25)
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+    def test_ndjson_export_applies_report_filters(self):
+        newest = StockTransaction.objects.order_by('-transaction_date', '-id').first()
+        rows = [json.loads(line) for line in self.export(
+            'ndjson', transaction_date__gte=newest.transaction_date.isoformat()).splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['id'], str(newest.id))
+        self.assertEqual(rows[0]['sku_code'], 'RPT-1')
+        self.assertEqual(rows[0]['quantity'], '1.00')
+
+    def test_unknown_export_format_is_rejected(self):
+        response = self.client.get('/api/stock/report/', {'export': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncStockReportTests(StockReportTestCase):
+    def test_pages_match_the_report_order(self):
+        expected = [str(pk) for pk in StockTransaction.objects.order_by(
+            '-transaction_date', '-id').values_list('id', flat=True)]
+        response = self.client.get('/api/async/stock/report/?limit=10&offset=10')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 25)
+        self.assertEqual([row['id'] for row in data['results']], expected[10:20])
+        self.assertIn('offset=20', data['next'])
+        self.assertNotIn('offset', data['previous'])
+
+        sync = self.client.get('/api/stock/report/?limit=10').data['results'][0]
+        self.assertEqual(set(data['results'][0]), set(sync))
+
+    def test_count_false_and_filters(self):
+        data = self.client.get('/api/async/stock/report/?limit=20&offset=20&count=false').json()
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next'])
+
+        self.assertEqual(self.client.get(
+            '/api/async/stock/report/?transaction_type=OUT').json()['results'], [])
+        response = self.client.get('/api/async/stock/report/?transaction_date__gte=nope')
+        self.assertEqual(response.status_code, 400)
+
+
+class StockStreamTests(StockReportTestCase):
+    def ledger(self):
+        return list(StockTransaction.objects.order_by('transaction_date', 'id'))
+
+    async def next_event(self, events):
+        while True:
+            frame = await asyncio.wait_for(events.__anext__(), timeout=5)
+            if frame.startswith('id: '):
+                lines = frame.splitlines()
+                return lines[0][4:], json.loads(lines[2][6:])
+
+    async def test_live_events_follow_new_ledger_rows(self):
+        events = StockStreamView().events(None)
+        try:
+            self.assertTrue((await events.__anext__()).startswith('retry:'))
+            row = await StockTransaction.objects.acreate(
+                product=self.product, product_sku=self.sku, transaction_type='OUT',
+                quantity=2, current_stock=7)
+            event_id, data = await self.next_event(events)
+            self.assertEqual(data, {'txn_id': str(row.id), 'sku_id': str(self.sku.id),
+                                    'stock': '7.00', 'delta': '-2.00'})
+            await row.arefresh_from_db()
+            self.assertEqual(parse_event_id(event_id), row.stream_seq)
+        finally:
+            await events.aclose()
+        self.assertFalse(LedgerBroker.get().subscribers)
+
+    async def test_rows_committed_long_after_their_date_are_streamed(self):
+        events = StockStreamView().events(None)
+        try:
+            await events.__anext__()
+            # Dated like a row inserted at the start of a minute long transaction
+            row = await StockTransaction.objects.acreate(
+                product=self.product, product_sku=self.sku, transaction_type='OUT',
+                quantity=1, current_stock=6, transaction_date=timezone.now() - timedelta(minutes=1))
+            _, data = await self.next_event(events)
+            self.assertEqual(data['txn_id'], str(row.id))
+        finally:
+            await events.aclose()
+
+    async def test_last_event_id_replays_the_ledger(self):
+        await sync_to_async(sequence)()
+        ledger = await sync_to_async(self.ledger)()
+        self.assertEqual([row.stream_seq for row in ledger], list(range(1, 26)))
+        events = StockStreamView().events(ledger[9].stream_seq)
+        try:
+            await events.__anext__()
+            replayed = [(await self.next_event(events))[1]['txn_id'] for _ in ledger[10:]]
+        finally:
+            await events.aclose()
+        self.assertEqual(replayed, [str(row.id) for row in ledger[10:]])
+
+    async def test_slow_subscriber_is_ended(self):
+        broker = LedgerBroker()
+        queue = asyncio.Queue(maxsize=1)
+        broker.subscribers.add(queue)
+        broker.publish({'txn_id': '1'})
+        broker.publish({'txn_id': '2'})
+        self.assertIsNone(await queue.get())
+        self.assertFalse(broker.subscribers)
+
+    async def test_needs_asgi_and_a_valid_last_event_id(self):
+        response = await self.async_client.get('/api/stock/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        response = await self.async_client.get('/api/stock/stream/', headers={'Last-Event-ID': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((await sync_to_async(self.client.get)('/api/stock/stream/')).status_code, 501)
+
+
+class StockLevelTests(APITestCase):
+    def setUp(self):
+        self.product = Products.objects.create(
+            ProductID=2, ProductCode='LVL', ProductName='Level Product')
+        self.sku = ProductSKU.objects.create(
+            product=self.product, sku_code='LVL-1', stock=7)
+        today = timezone.localdate()
+        self.days = [today - timedelta(days=n) for n in (3, 2, 1)]
+        # +10 three days ago, -4 two days ago, +1 yesterday: 7 in stock now
+        for day, transaction_type, quantity, current in zip(
+                self.days, ('IN', 'OUT', 'IN'), (10, 4, 1), (10, 6, 7)):
+            StockTransaction.objects.create(
+                product=self.product, product_sku=self.sku, transaction_type=transaction_type,
+                quantity=quantity, current_stock=current,
+                transaction_date=end_of_day(day) - timedelta(hours=12))
+
+    def level_at(self, at):
+        response = self.client.get('/api/stock/levels/', {'at': at})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data['results'][0]['stock']
+
+    def expected_levels(self):
+        return {self.days[0]: 10, self.days[1]: 6, self.days[2]: 7}
+
+    def test_levels_from_the_ledger_without_snapshots(self):
+        for day, stock in self.expected_levels().items():
+            self.assertEqual(self.level_at(day.isoformat()), stock)
+
+    def test_levels_from_snapshots(self):
+        call_command('take_stock_snapshots', days=3, stdout=io.StringIO())
+        self.assertEqual(dict(StockSnapshot.objects.values_list('snapshot_date', 'closing_stock')),
+                         self.expected_levels())
+
+        for day, stock in self.expected_levels().items():
+            self.assertEqual(self.level_at(day.isoformat()), stock)
+        # Midday two days ago: closing of three days ago plus nothing yet
+        self.assertEqual(self.level_at(
+            (end_of_day(self.days[1]) - timedelta(hours=13)).isoformat()), 10)
+
+    def test_at_is_required(self):
+        self.assertEqual(self.client.get('/api/stock/levels/').status_code, 400)
+
+
+class StockSummaryTests(APITestCase):
+    def setUp(self):
+        self.product = Products.objects.create(
+            ProductID=3, ProductCode='SUM', ProductName='Summary Product')
+        self.skus = [ProductSKU.objects.create(product=self.product, sku_code=f'SUM-{n}')
+                     for n in (1, 2)]
+        self.today = timezone.localdate()
+        # (days ago, SKU, type, quantity)
+        for days_ago, sku, transaction_type, quantity in (
+                (3, 0, 'IN', 10), (3, 1, 'IN', 5), (2, 0, 'OUT', 4),
+                (1, 0, 'IN', 1), (0, 0, 'OUT', 2), (0, 1, 'OUT', 1)):
+            day = self.today - timedelta(days=days_ago)
+            StockTransaction.objects.create(
+                product=self.product, product_sku=self.skus[sku], transaction_type=transaction_type,
+                quantity=quantity, current_stock=0, transaction_date=end_of_day(day) - timedelta(hours=1))
+
+    def summary(self, **params):
+        response = self.client.get('/api/stock/summary/', {'limit': 100, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row['period'], row.get('sku_code'), row['in_quantity'], row['out_quantity'],
+                 row['net_change'], row['transaction_count']) for row in response.data['results']]
+
+    def test_daily_summary_per_sku(self):
+        day = lambda n: (self.today - timedelta(days=n)).isoformat()
+        rows = self.summary()
+        self.assertCountEqual(rows, [
+            (day(0), 'SUM-1', '0.00', '2.00', '-2.00', 1),
+            (day(0), 'SUM-2', '0.00', '1.00', '-1.00', 1),
+            (day(1), 'SUM-1', '1.00', '0.00', '1.00', 1),
+            (day(2), 'SUM-1', '0.00', '4.00', '-4.00', 1),
+            (day(3), 'SUM-1', '10.00', '0.00', '10.00', 1),
+            (day(3), 'SUM-2', '5.00', '0.00', '5.00', 1),
+        ])
+        # Newest period first
+        self.assertEqual([row[0] for row in rows], sorted((row[0] for row in rows), reverse=True))
+
+    def test_rollup_gives_the_same_summary(self):
+        for params in ({}, {'group_by': 'product'}, {'period': 'week'}, {'period': 'month'},
+                       {'start': (self.today - timedelta(days=2)).isoformat()}):
+            rebuild(date(2000, 1, 1))
+            live = self.summary(**params)
+            roll_up()
+            self.assertTrue(StockDailySummary.objects.exists())
+            self.assertEqual(self.summary(**params), live, params)
+
+    def test_rollup_is_incremental(self):
+        self.assertEqual(roll_up(self.today - timedelta(days=2)), 3)
+        self.assertEqual(roll_up(self.today - timedelta(days=2)), 0)
+        call_command('rollup_stock_summary', stdout=io.StringIO())
+        self.assertEqual(StockDailySummary.objects.count(), 4)
+        # Today is still open and never rolled up
+        self.assertFalse(StockDailySummary.objects.filter(day=self.today).exists())
+
+    def test_closed_range_reads_only_the_rollup(self):
+        roll_up()
+        with CaptureQueriesContext(connection) as ctx:
+            rows = self.summary(group_by='product', end=(self.today - timedelta(days=1)).isoformat())
+        self.assertEqual([row[2:] for row in rows], [
+            ('1.00', '0.00', '1.00', 1), ('0.00', '4.00', '-4.00', 1), ('15.00', '0.00', '15.00', 2)])
+        self.assertFalse([q for q in ctx.captured_queries
+                          if 'stock_stocktransaction' in q['sql']])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'period': 'hour'}, {'group_by': 'variant'}, {'start': 'soon'},
+                       {'product__id': 'nope'}):
+            self.assertEqual(self.client.get('/api/stock/summary/', params).status_code, 400)
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        self.product = Products.objects.create(
+            ProductID=1, ProductCode='RSV', ProductName='Reserved Product', TotalStock=10)
+        self.sku = ProductSKU.objects.create(
+            product=self.product, sku_code='RSV-1', stock=10)
+
+    def hold(self, quantity, **extra):
+        return self.client.post('/api/stock/reservations/', {
+            'product_sku_id': str(self.sku.id), 'quantity': quantity, **extra}, format='json')
+
+    def act(self, reservation_id, action):
+        return self.client.post(f'/api/stock/reservations/{reservation_id}/{action}/')
+
+    def assert_stock(self, stock, reserved, total=None):
+        self.sku.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.sku.stock, self.sku.reserved), (stock, reserved))
+        self.assertEqual(self.product.TotalStock, stock if total is None else total)
+
+    def test_hold_sets_stock_aside_from_sales(self):
+        response = self.hold(7, reference='cart-1')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['status'], 'HELD')
+        self.assertEqual(response.data['reference'], 'cart-1')
+        self.assert_stock(10, 7)
+
+        sale = {'product_id': str(self.product.id), 'product_sku_id': str(self.sku.id), 'quantity': 4}
+        self.assertEqual(self.client.post('/api/stock/remove/', sale, format='json').status_code, 400)
+        response = self.hold(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['available'], 3)
+        product = self.client.get(f'/api/products/?id={self.product.id}').data['results'][0]
+        self.assertEqual(product['product_skus'][0]['available_stock'], '3.00')
+
+    def test_deleting_a_hold_in_the_admin_gives_the_stock_back(self):
+        held = self.hold(3).data['id']
+        committed = self.hold(2).data['id']
+        self.act(committed, 'commit')
+        reservation_admin = StockReservationAdmin(StockReservation, admin.site)
+        reservation_admin.delete_model(None, StockReservation.objects.get(id=held))
+        self.assert_stock(8, 0)
+        reservation_admin.delete_queryset(None, StockReservation.objects.all())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assert_stock(8, 0)
+
+    def test_commit_sells_the_held_stock(self):
+        reservation_id = self.hold(3).data['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.act(reservation_id, 'commit')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['product_sku_current_stock'], 7)
+        self.assertEqual(response.data['reservation']['status'], 'COMMITTED')
+        self.assert_stock(7, 0)
+        ledger = self.sku.stock_transactions.get()
+        self.assertEqual((ledger.transaction_type, ledger.quantity, ledger.current_stock), ('OUT', 3, 7))
+
+        response = self.act(reservation_id, 'release')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['status'], 'COMMITTED')
+
+    def test_release_gives_the_stock_back(self):
+        reservation_id = self.hold(3).data['id']
+        response = self.act(reservation_id, 'release')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_stock(10, 0)
+        self.assertFalse(self.sku.stock_transactions.exists())
+        self.assertEqual(self.act(reservation_id, 'commit').status_code, 409)
+
+    def test_expired_holds_are_swept_in_batches(self):
+        other = ProductSKU.objects.create(product=self.product, sku_code='RSV-2', stock=5)
+        past = timezone.now() - timedelta(seconds=1)
+        for _ in range(5):
+            self.hold(1)
+        self.client.post('/api/stock/reservations/', {
+            'product_sku_id': str(other.id), 'quantity': 2}, format='json')
+        live = self.hold(2).data['id']
+        StockReservation.objects.exclude(id=live).update(expires_at=past)
+        self.assert_stock(10, 7)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(expire_holds(batch_size=4), 6)
+        # Two batches of: SELECT holds, UPDATE holds, SELECT SKUs, UPDATE SKUs
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries
+                      if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(statements, ['SELECT', 'UPDATE', 'SELECT', 'UPDATE'] * 2)
+        self.assert_stock(10, 2)
+        other.refresh_from_db()
+        self.assertEqual(other.reserved, 0)
+        self.assertEqual(StockReservation.objects.filter(status='EXPIRED').count(), 6)
+
+        expired = StockReservation.objects.filter(status='EXPIRED').first()
+        response = self.act(expired.id, 'commit')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error'], 'Reservation is expired.')
+        self.assertEqual(self.act(live, 'commit').status_code, 200)
+
+    def test_a_hold_past_its_ttl_cannot_be_committed_before_the_sweep(self):
+        reservation_id = self.hold(2).data['id']
+        StockReservation.objects.filter(id=reservation_id).update(
+            expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.act(reservation_id, 'commit')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['status'], 'HELD')
+        self.assert_stock(10, 2)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.hold(0).status_code, 400)
+        self.assertEqual(self.hold(1, ttl=0).status_code, 400)
+        self.assertEqual(self.hold('lots').status_code, 400)
+        self.assertEqual(self.hold('NaN').status_code, 400)
+        response = self.client.post('/api/stock/reservations/', {
+            'product_sku_id': '00000000-0000-0000-0000-000000000000', 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.act('00000000-0000-0000-0000-000000000000', 'commit').status_code, 404)
+
+    def test_sharded_skus_hold_from_their_shards(self):
+        reshard(self.sku.id, 2)
+        reservation_id = self.hold(6).data['id']
+        shards = self.sku.stock_shards.values_list('stock', flat=True)
+        self.assertEqual(sum(shards), 4)
+        sale = {'product_id': str(self.product.id), 'product_sku_id': str(self.sku.id), 'quantity': 5}
+        self.assertEqual(self.client.post('/api/stock/remove/', sale, format='json').status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.act(reservation_id, 'commit')
+        self.assertEqual(response.data['product_sku_current_stock'], 4)
+        rebalance()
+        self.assert_stock(4, 0)
+
+        reservation_id = self.hold(3).data['id']
+        self.act(reservation_id, 'release')
+        self.assertEqual(sum(self.sku.stock_shards.values_list('stock', flat=True)), 4)
+        rebalance()
+        self.assert_stock(4, 0)
@@ -1,6 +1,21 @@
 from django.urls import path
-from .views import StockReportAPIView
+from .views import (
+    StockReportAPIView, StockLevelAPIView, StockSummaryAPIView, StockReservationCreateAPIView,
+    StockReservationDetailAPIView, StockReservationCommitAPIView, StockReservationReleaseAPIView)
+from .async_views import AsyncStockReportView, StockStreamView
 
 urlpatterns = [
     path('stock/report/', StockReportAPIView.as_view(), name='stock-report'),
+    path('stock/levels/', StockLevelAPIView.as_view(), name='stock-levels'),
+    path('stock/summary/', StockSummaryAPIView.as_view(), name='stock-summary'),
+    path('stock/reservations/', StockReservationCreateAPIView.as_view(),
+         name='stock-reservation-create'),
+    path('stock/reservations/<uuid:pk>/', StockReservationDetailAPIView.as_view(),
+         name='stock-reservation-detail'),
+    path('stock/reservations/<uuid:pk>/commit/', StockReservationCommitAPIView.as_view(),
+         name='stock-reservation-commit'),
+    path('stock/reservations/<uuid:pk>/release/', StockReservationReleaseAPIView.as_view(),
+         name='stock-reservation-release'),
+    path('async/stock/report/', AsyncStockReportView.as_view(), name='async-stock-report'),
+    path('stock/stream/', StockStreamView.as_view(), name='stock-stream'),
 ]
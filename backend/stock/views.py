@@ -1,20 +1,38 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import StockTransaction
-from .serializers import StockTransactionSerializer
+from .models import StockReservation, StockTransaction
+from .serializers import (
+    StockTransactionSerializer, StockLevelSerializer, StockSummarySerializer,
+    StockReservationSerializer)
+from .pagination import StockReportPagination
+from .export import CONTENT_TYPES, STREAMERS, iter_rows
+from .snapshots import end_of_day, stock_levels_at
+from .summaries import GROUPS, PERIODS, summarize
+from . import reservations
+from products import cache as catalog_cache
+from products.conditional import ConditionalGetMixin
+from products.models import Products, ProductSKU
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
 # Stock Report API (List transactions with date filter)
 
 
-class StockReportAPIView(generics.ListAPIView):
+class StockReportAPIView(ConditionalGetMixin, generics.ListAPIView):
     queryset = StockTransaction.objects.all().select_related(
         'product', 'product_sku')  # Optimize query
     serializer_class = StockTransactionSerializer
+    pagination_class = StockReportPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = {
         # Greater than or equal to, Less than or equal to
@@ -29,3 +47,228 @@ class StockReportAPIView(generics.ListAPIView):
     def get_queryset(self):
         queryset = super().get_queryset()
         return queryset
+
+    def get_validators(self):
+        # The ledger is append-only, so the newest matching row versions the
+        # report. Product writes (renames, deletes) change the token.
+        latest = self.filter_queryset(StockTransaction.objects.all()).order_by(
+            '-transaction_date', '-id').values_list('transaction_date', 'id').first()
+        token, changed = catalog_cache.last_change()
+        last_modified = max(latest[0], changed) if latest else changed
+        return f"{latest}|{token}", last_modified
+
+    def list(self, request, *args, **kwargs):
+        # ?export=csv|ndjson streams every matching row instead of a page
+        export = request.query_params.get('export')
+        if export is None:
+            return super().list(request, *args, **kwargs)
+        if export not in STREAMERS:
+            return Response({"error": f"export must be one of {', '.join(STREAMERS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = iter_rows(self.filter_queryset(StockTransaction.objects.all()))
+        response = StreamingHttpResponse(STREAMERS[export](rows), content_type=CONTENT_TYPES[export])
+        filename = f"stock-report-{timezone.localdate().isoformat()}.{export}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+# Stock Level API (stock of every SKU at a point in time)
+
+
+class StockLevelAPIView(generics.ListAPIView):
+    """
+    ``?at=YYYY-MM-DD`` returns closing stock for that day, ``?at=<ISO datetime>``
+    the stock just before that instant. Served from the nearest daily
+    StockSnapshot plus the transactions since, see stock.snapshots.
+    """
+    queryset = ProductSKU.objects.select_related('product').order_by('product__ProductName', 'sku_code')
+    serializer_class = StockLevelSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'id': ['exact'],
+        'product__id': ['exact'],
+    }
+
+    def list(self, request, *args, **kwargs):
+        at = request.query_params.get('at') or ''
+        try:
+            day = parse_date(at)
+            instant = end_of_day(day) if day else parse_datetime(at)
+        except ValueError:
+            instant = None
+        if instant is None:
+            return Response({"error": "at must be a date (YYYY-MM-DD) or an ISO datetime."}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(instant):
+            instant = timezone.make_aware(instant)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        skus = page if page is not None else list(queryset)
+        context = self.get_serializer_context()
+        context['stock_levels'] = stock_levels_at(instant, [sku.id for sku in skus])
+        serializer = self.get_serializer_class()(skus, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+
+# Stock Summary API (IN/OUT totals per product or SKU and per day, week or month)
+
+
+class StockSummaryAPIView(generics.GenericAPIView):
+    """
+    ``?period=day|week|month`` (default day), ``?group_by=product|sku``
+    (default sku), optional inclusive ``?start=`` / ``?end=`` dates and
+    ``product__id`` / ``product_sku__id`` filters. Totals are computed in the
+    database, closed days come from StockDailySummary, see stock.summaries.
+    """
+    serializer_class = StockSummarySerializer
+    filter_backends = []
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        period = params.get('period', 'day')
+        group_by = params.get('group_by', 'sku')
+        if period not in PERIODS:
+            return Response({"error": f"period must be one of {', '.join(PERIODS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        if group_by not in GROUPS:
+            return Response({"error": f"group_by must be one of {', '.join(GROUPS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        dates = {}
+        for name in ('start', 'end'):
+            try:
+                dates[name] = parse_date(params[name]) if params.get(name) else None
+            except ValueError:
+                dates[name] = None
+            if params.get(name) and dates[name] is None:
+                return Response({"error": f"{name} must be a date (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {}
+        for param, field in (('product__id', 'product_id'), ('product_sku__id', 'product_sku_id')):
+            if params.get(param):
+                try:
+                    filters[field] = uuid.UUID(params[param])
+                except ValueError:
+                    return Response({"error": f"{param} must be a UUID."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = summarize(period, group_by, dates['start'], dates['end'], filters)
+        page = self.paginate_queryset(rows)
+        rows = page if page is not None else rows
+
+        context = self.get_serializer_context()
+        context['product_names'] = dict(Products.objects.filter(
+            id__in={row['product_id'] for row in rows}).values_list('id', 'ProductName'))
+        context['sku_codes'] = dict(ProductSKU.objects.filter(
+            id__in={row['product_sku_id'] for row in rows if 'product_sku_id' in row}).values_list('id', 'sku_code'))
+        serializer = self.get_serializer_class()(rows, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+
+# Stock Reservation API (hold stock for a checkout, then commit or release it)
+
+
+class StockReservationCreateAPIView(APIView):
+    """
+    Body: {"product_sku_id", "quantity", "product_id" (optional),
+    "ttl" (seconds, default 900), "reference" (optional, e.g. a cart id)}.
+    Holds the quantity until the reservation is committed, released or
+    expires, see stock.reservations.
+    """
+
+    def post(self, request, *args, **kwargs):
+        product_sku_id = request.data.get('product_sku_id')
+        product_id = request.data.get('product_id') or None
+        quantity = request.data.get('quantity')
+        reference = request.data.get('reference') or ''
+
+        if not product_sku_id or quantity is None:
+            return Response({"error": "product_sku_id and quantity are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            uuid.UUID(str(product_sku_id))
+            if product_id is not None:
+                uuid.UUID(str(product_id))
+        except ValueError:
+            return Response({"error": "product_sku_id and product_id must be UUIDs."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quantity = Decimal(str(quantity)).quantize(Decimal('0.01'))
+            if not quantity.is_finite():
+                raise ValueError
+            ttl = timedelta(seconds=float(request.data.get('ttl', reservations.DEFAULT_TTL.total_seconds())))
+        except (ValueError, TypeError, InvalidOperation, OverflowError):
+            return Response({"error": "quantity and ttl must be valid numbers."}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity <= 0:
+            return Response({"error": "Quantity must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+        if not timedelta(0) < ttl <= reservations.MAX_TTL:
+            return Response({"error": f"ttl must be between 1 and {int(reservations.MAX_TTL.total_seconds())} seconds."}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(reference, str) or len(reference) > 255:
+            return Response({"error": "reference must be a string of at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            reservation = reservations.hold(
+                product_sku_id, quantity, ttl=ttl, product_id=product_id, reference=reference)
+            if reservation is None:
+                skus = ProductSKU.objects.filter(id=product_sku_id)
+                if product_id is not None:
+                    skus = skus.filter(product_id=product_id)
+                # Sharded SKUs keep their available stock in their shards
+                available = skus.values_list(ProductSKU.live_stock() - F('reserved'), flat=True).first()
+                if available is None:
+                    return Response({"error": "Product SKU not found."}, status=status.HTTP_404_NOT_FOUND)
+                return Response({"error": "Not enough stock available.", "available": available}, status=status.HTTP_400_BAD_REQUEST)
+            logger.info(
+                f"Reserved {quantity} of ProductSKU (ID: {product_sku_id}) until {reservation.expires_at} (reservation {reservation.id}).")
+            return Response(StockReservationSerializer(reservation).data, status=status.HTTP_201_CREATED)
+        except Exception as e:
+            logger.error(f"Error reserving stock: {e}", exc_info=True)
+            return Response({"error": "Internal server error.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class StockReservationDetailAPIView(generics.RetrieveAPIView):
+    queryset = StockReservation.objects.select_related('product_sku')
+    serializer_class = StockReservationSerializer
+
+
+class StockReservationActionAPIView(APIView):
+    """Base for the commit and release endpoints, which only act on a held reservation."""
+
+    def post(self, request, pk, *args, **kwargs):
+        try:
+            result = self.apply(pk)
+            if result is None:
+                reservation = StockReservation.objects.filter(id=pk).only('status', 'expires_at').first()
+                if reservation is None:
+                    return Response({"error": "Reservation not found."}, status=status.HTTP_404_NOT_FOUND)
+                state = 'expired' if reservation.status == StockReservation.HELD else reservation.get_status_display().lower()
+                return Response({"error": f"Reservation is {state}.", "status": reservation.status}, status=status.HTTP_409_CONFLICT)
+            return Response(result, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error updating reservation {pk}: {e}", exc_info=True)
+            return Response({"error": "Internal server error.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class StockReservationCommitAPIView(StockReservationActionAPIView):
+    def apply(self, pk):
+        committed = reservations.commit(pk)
+        if committed is None:
+            return None
+        reservation, current_stock = committed
+        logger.info(f"Committed reservation {pk}: sold {reservation.quantity} of ProductSKU (ID: {reservation.product_sku_id}).")
+        return {
+            "message": "Reservation committed successfully",
+            "reservation": StockReservationSerializer(reservation).data,
+            "product_sku_current_stock": current_stock,
+        }
+
+
+class StockReservationReleaseAPIView(StockReservationActionAPIView):
+    def apply(self, pk):
+        reservation = reservations.release(pk)
+        if reservation is None:
+            return None
+        logger.info(f"Released reservation {pk}: {reservation.quantity} of ProductSKU (ID: {reservation.product_sku_id}).")
+        return {
+            "message": "Reservation released successfully",
+            "reservation": StockReservationSerializer(reservation).data,
+        }
@@ -35,9 +35,10 @@ export const createProduct = (productData) => {
 
 /**
  * API function to fetch a list of all products.
+ * @param {Object} [params] - Optional query parameters, e.g. { fields: 'id,ProductName', expand: 'product_skus' }.
  * @returns {Promise} A promise that resolves with the list of products.
  */
-export const getProducts = () => api.get('/products/');
+export const getProducts = (params) => api.get('/products/', { params });
 
 /**
  * API function to add stock for a specific product sub-variant.
@@ -59,3 +60,35 @@ export const removeStock = (data) => api.post('/stock/remove/', data);
  * @returns {Promise} A promise that resolves with the stock transactions.
  */
 export const getStockReport = (params) => api.get('/stock/report/', { params });
+
+/**
+ * Subscribes to the real-time stock change feed. The backend must run on an ASGI server.
+ * EventSource reconnects on its own and resumes from the last event it received.
+ * @param {Function} onChange - Called with { sku_id, stock, delta, txn_id } for every stock movement.
+ * @returns {Function} Closes the subscription.
+ */
+export const subscribeStockChanges = (onChange) => {
+    const source = new EventSource(`${API_BASE_URL}/stock/stream/`);
+    source.addEventListener('stock', (event) => onChange(JSON.parse(event.data)));
+    return () => source.close();
+};
+
+/**
+ * Applies a stock change event to a list of products with their product_skus.
+ * @param {Array} products - Products as returned by getProducts.
+ * @param {Object} change - An event from subscribeStockChanges.
+ * @returns {Array} The products, with the changed SKU and its product's TotalStock updated.
+ */
+export const applyStockChange = (products, change) => products.map((product) => {
+    const skus = Array.isArray(product.product_skus) ? product.product_skus : [];
+    if (!skus.some((sku) => sku.id === change.sku_id)) {
+        return product;
+    }
+    const productSkus = skus.map((sku) => (sku.id === change.sku_id ? { ...sku, stock: change.stock } : sku));
+    const updated = { ...product, product_skus: productSkus };
+    if (product.TotalStock !== undefined && product.TotalStock !== null) {
+        // Summed from the absolute SKU stocks, so a replayed event cannot count twice
+        updated.TotalStock = productSkus.reduce((total, sku) => total + Number(sku.stock), 0).toFixed(2);
+    }
+    return updated;
+});
@@ -1,5 +1,5 @@
 import React, { useEffect, useState, useCallback } from 'react';
-import { getProducts } from '../api/products';
+import { getProducts, subscribeStockChanges, applyStockChange } from '../api/products';
 import ErrorDisplay from './ErrorDisplay';
 
 /**
@@ -39,6 +39,11 @@ const ProductList = () => {
         fetchProducts();
     }, [fetchProducts]);
 
+    // Keep stock levels live without downloading the catalog again
+    useEffect(() => subscribeStockChanges((change) => {
+        setProducts((current) => applyStockChange(current, change));
+    }), []);
+
     // Render loading state
     if (loading) {
         return (
@@ -77,10 +82,10 @@ const ProductList = () => {
                     <li key={product.id} className="bg-white border border-gray-200 rounded-xl shadow-lg p-6 flex flex-col items-center text-center transition-transform transform hover:scale-105 duration-200 ease-in-out">
                         <h3 className="text-xl font-semibold text-blue-600 mb-3">{product.ProductName} ({product.ProductCode})</h3>
                         
-                        {/* Display product image if available */}
+                        {/* Display product image if available, the original until its thumbnail is ready */}
                         {product.ProductImage ? (
                             <img
-                                src={product.ProductImage}
+                                src={product.ProductImageRenditions?.thumbnail || product.ProductImage}
                                 alt={product.ProductName}
                                 className="w-32 h-32 object-cover rounded-lg mb-4 shadow-md"
                                 onError={(e) => { e.target.onerror = null; e.target.src = 'https://placehold.co/128x128/e0e0e0/555555?text=No+Image'; }}
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useCallback } from 'react';
-import { getProducts, addStock, removeStock } from '../api/products';
+import { getProducts, addStock, removeStock, subscribeStockChanges, applyStockChange } from '../api/products';
 import ErrorDisplay from './ErrorDisplay';
 
 /**
@@ -23,7 +23,8 @@ const StockManagement = () => {
      */
     const fetchProductsForManagement = useCallback(async () => {
         try {
-            const response = await getProducts();
+            // Only the names and SKUs are shown here, skip the variant tree
+            const response = await getProducts({ fields: 'id,ProductName,ProductCode', expand: 'product_skus' });
             console.log("API Response Data for Stock Management Products (with SKUs):", response.data); // For debugging
             const dataToSet = Array.isArray(response.data.results) ? response.data.results : [];
             setProducts(dataToSet);
@@ -38,6 +39,11 @@ const StockManagement = () => {
         fetchProductsForManagement();
     }, [fetchProductsForManagement]);
 
+    // Stock moved by other terminals shows up as it happens
+    useEffect(() => subscribeStockChanges((change) => {
+        setProducts((current) => applyStockChange(current, change));
+    }), []);
+
     /**
      * Handles the change event for the product selection dropdown.
      * Resets the selected Product SKU when a new product is chosen.